@@ -0,0 +1,232 @@
+"""耗時的統計分析：在行程池中執行，不佔用處理 webhook 的執行緒
+
+分析函式只接收打包好的歷史資料（shared_history.RECORD，依開獎先後排列），
+結果依（分析、參數、最新期號）快取，有新期號後自然失效；計算中的相同請求共用同一個工作。
+"""
+import multiprocessing
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import odds_tables
+from executor import Rejected
+from shared_history import RECORD, pack_record
+from sources import LatencyStats
+from stats_cube import rebuild as rebuild_stats_cube
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_WORKERS = int(os.getenv('ANALYTICS_WORKERS', '2'))
+# 排隊加計算中的工作上限，超過時拒絕
+ANALYTICS_MAX_PENDING = int(os.getenv('ANALYTICS_MAX_PENDING', '16'))
+ANALYTICS_CACHE_SIZE = int(os.getenv('ANALYTICS_CACHE_SIZE', '256'))
+# 子行程的啟動方式：worker 已有執行緒與連線，直接 fork 可能複製到持有中的鎖
+ANALYTICS_START_METHOD = os.getenv('ANALYTICS_START_METHOD', 'forkserver')
+# 冷熱分析的區間（期數），None 表示全部歷史
+FREQUENCY_WINDOWS = (30, 100, 500, None)
+
+
+def pack_history(records):
+    """把開獎資料依期號由小到大打包，送給分析行程"""
+    return b''.join(pack_record(r) for r in sorted(records, key=lambda r: int(r['期號'])))
+
+
+def analyze_numbers(packed, numbers):
+    """全部歷史的號碼回測：各中獎數次數、超級獎號、獎金回收與最長連續未中"""
+    bet = set(numbers)
+    stars = len(bet)
+    payouts = odds_tables.PAYOUTS.get(stars, {})
+    match_counts = [0] * (stars + 1)
+    super_matches = 0
+    total_payout = 0
+    periods = 0
+    first_period = last_period = last_win_period = None
+    gap = longest_gap = 0
+    for period, _, _, _, _, super_number, drawn in RECORD.iter_unpack(packed):
+        hits = len(bet.intersection(drawn))
+        match_counts[hits] += 1
+        periods += 1
+        if first_period is None:
+            first_period = period
+        last_period = period
+        if super_number in bet:
+            super_matches += 1
+        if hits in payouts:
+            total_payout += payouts[hits]
+            last_win_period = period
+            gap = 0
+        else:
+            gap += 1
+            longest_gap = max(longest_gap, gap)
+    return {
+        'numbers': sorted(bet),
+        'stars': stars,
+        'periods': periods,
+        'first_period': first_period,
+        'last_period': last_period,
+        'match_counts': match_counts,
+        'super_matches': super_matches,
+        'wins': sum(match_counts[hits] for hits in payouts),
+        'last_win_period': last_win_period,
+        'longest_gap': longest_gap,
+        'total_payout': total_payout,
+        'cost': periods * odds_tables.BET_UNIT,
+    }
+
+
+def frequency_report(packed, windows=FREQUENCY_WINDOWS):
+    """最近各區間的號碼冷熱：由新到舊累計，每到一個區間的期數就記下當時的排名"""
+    total = len(packed) // RECORD.size
+    checkpoints = sorted({min(w, total) if w else total for w in windows})
+    counts = [0] * 81
+    super_counts = [0] * 81
+    result = []
+    seen = 0
+    for checkpoint in checkpoints:
+        while seen < checkpoint:
+            offset = (total - 1 - seen) * RECORD.size
+            for n in packed[offset + 12:offset + 32]:
+                counts[n] += 1
+            super_counts[packed[offset + 11]] += 1
+            seen += 1
+        ranked = sorted(range(1, 81), key=lambda n: (-counts[n], n))
+        result.append({
+            'periods': seen,
+            'all': seen == total,
+            'expected': seen * 20 / 80,
+            'hot': [(n, counts[n]) for n in ranked[:5]],
+            'cold': [(n, counts[n]) for n in reversed(ranked[-5:])],
+            'super_hot': [(n, super_counts[n]) for n in sorted(range(1, 81), key=lambda n: (-super_counts[n], n))[:3]],
+        })
+    return result
+
+
+ANALYSES = {
+    'numbers': analyze_numbers,
+    'frequency': frequency_report,
+    'stats_cube': rebuild_stats_cube,
+}
+
+
+class AnalyticsJobs:
+    """分析工作的行程池與結果快取"""
+
+    def __init__(self, workers=ANALYTICS_WORKERS, max_pending=ANALYTICS_MAX_PENDING, cache_size=ANALYTICS_CACHE_SIZE):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+        self._pool = None
+        self._memo = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.latency = LatencyStats()
+        self._counters = {'submitted': 0, 'memo_hits': 0, 'coalesced': 0, 'rejected': 0, 'pool_restarts': 0}
+
+    def _get_pool(self):
+        # 第一次有工作時才建立，子行程由 forkserver 啟動，不繼承 worker 的執行緒與鎖
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context(ANALYTICS_START_METHOD)
+            )
+        return self._pool
+
+    def _reset_pool(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+                self._counters['pool_restarts'] += 1
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, analysis, params, latest_period, load):
+        """回傳結果的 Future；快取中已有結果時回傳已完成的 Future
+
+        load() 回傳打包好的歷史資料，只在需要計算時呼叫。排隊的工作已滿時拋出 Rejected。
+        """
+        key = (analysis, tuple(params), str(latest_period))
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                self._counters['memo_hits'] += 1
+                future = Future()
+                future.set_result(self._memo[key])
+                return future
+            if key in self._inflight:
+                self._counters['coalesced'] += 1
+                return self._inflight[key]
+            if len(self._inflight) >= self.max_pending:
+                self._counters['rejected'] += 1
+                raise Rejected(f"分析工作已達上限 {self.max_pending} 個")
+            future = Future()
+            self._inflight[key] = future
+            self._counters['submitted'] += 1
+        started = time.monotonic()
+        try:
+            packed = load()
+            try:
+                pool = self._get_pool()
+                job = pool.submit(ANALYSES[analysis], packed, *params)
+            except BrokenProcessPool:
+                self._reset_pool(pool)
+                pool = self._get_pool()
+                job = pool.submit(ANALYSES[analysis], packed, *params)
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            self.latency.record(time.monotonic() - started, False, str(e))
+            future.set_exception(e)
+            return future
+        job.add_done_callback(lambda job: self._finish(key, future, job, pool, started))
+        return future
+
+    def _finish(self, key, future, job, pool, started):
+        elapsed = time.monotonic() - started
+        try:
+            result = job.result()
+        except Exception as e:
+            logger.error(f"分析工作 {key[0]} 失敗：{str(e)}")
+            if isinstance(e, BrokenProcessPool):
+                self._reset_pool(pool)
+            with self._lock:
+                self._inflight.pop(key, None)
+            self.latency.record(elapsed, False, str(e))
+            future.set_exception(e)
+            return
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._memo[key] = result
+            while len(self._memo) > self.cache_size:
+                self._memo.popitem(last=False)
+        self.latency.record(elapsed, True)
+        future.set_result(result)
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._counters)
+            metrics.update(queue_depth=len(self._inflight), memo_size=len(self._memo))
+        metrics.update(
+            workers=self.workers, max_pending=self.max_pending, cache_size=self.cache_size,
+            latency=self.latency.snapshot()
+        )
+        return metrics
+
+    def shutdown(self):
+        pool = self._pool
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+_jobs = None
+_jobs_lock = threading.Lock()
+
+
+def get_analytics():
+    global _jobs
+    if _jobs is None:
+        with _jobs_lock:
+            if _jobs is None:
+                _jobs = AnalyticsJobs()
+    return _jobs
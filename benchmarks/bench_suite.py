@@ -0,0 +1,213 @@
+"""效能基準測試：以合成歷史量測各函式在不同期數下的耗時與記憶體峰值
+
+用法：
+    python benchmarks/bench_suite.py                       # 1k、10k、100k 期，與 baseline.json 比較
+    python benchmarks/bench_suite.py --sizes 1000,1000000
+    python benchmarks/bench_suite.py --save-baseline       # 更新 baseline.json
+"""
+import argparse
+import builtins
+import contextlib
+import gc
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+from synthetic import generate_history
+
+BASELINE_PATH = os.path.join(HERE, 'baseline.json')
+BET = [11, 22, 33]
+
+
+def _quiet(func, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+
+def bench_analyze_results(data):
+    from scraper import analyze_results
+    _quiet(analyze_results, data, BET)
+
+
+def bench_check_win(data):
+    from scraper import check_win
+    for draw in data:
+        check_win(BET, draw['開獎號碼'], draw['超級獎號'])
+
+
+def bench_query_winning(data):
+    from scraper import query_winning
+    answers = iter(['', ' '.join(map(str, BET))])
+    original = builtins.input
+    builtins.input = lambda prompt='': next(answers)
+    try:
+        _quiet(query_winning, data)
+    finally:
+        builtins.input = original
+
+
+def bench_get_best_combination(data):
+    from scraper import get_best_combination
+    random.seed(0)
+    get_best_combination(data, periods=len(data))
+
+
+def bench_number_index(data):
+    from number_index import NumberIndex
+    NumberIndex(data).find_matches(BET, min_matches=2, limit=10)
+
+
+def bench_format_range_reply(data):
+    """期號區間查詢的回覆格式化（全部期數）"""
+    from messages import format_matches
+    matches = []
+    for draw in data:
+        matched = set(BET) & set(draw['開獎號碼'])
+        is_super = draw['超級獎號'] in BET
+        if len(matched) >= 2 or is_super:
+            matches.append({'期號': draw['期號'], '時間': draw['時間'], '匹配數字': matched, '超級獎號': is_super})
+    format_matches("🎯 查詢結果", matches, f"\n💡 共找到 {len(matches)} 筆匹配記錄")
+
+
+def bench_range_reply(data):
+    """期號區間查詢的回覆（全部期數，最多5則訊息，匹配記錄逐筆產生）"""
+    from messages import build_matches_reply
+    bet = set(BET)
+    matches = (
+        {'期號': d['期號'], '時間': d['時間'], '匹配數字': bet & set(d['開獎號碼']), '超級獎號': d['超級獎號'] in bet}
+        for d in data
+        if len(bet & set(d['開獎號碼'])) >= 2 or d['超級獎號'] in bet
+    )
+    build_matches_reply("🎯 查詢結果", matches, "\n💡 查詢結果", None)
+
+
+def bench_format_recent(data):
+    from messages import format_draws, format_history
+    format_draws("📊 最近30期開獎記錄", data[:30], "")
+    format_history("📊 今日", data[:20], "")
+
+
+_ticket_indexes = {}
+
+
+def _ticket_index(size):
+    """與期數相同數量的隨機 3-10 星訂閱（依大小快取，建索引不計入耗時）"""
+    if size not in _ticket_indexes:
+        from subscriptions import TicketIndex
+        rng = random.Random(size)
+        index = TicketIndex()
+        for ticket_id in range(size):
+            numbers = sorted(rng.sample(range(1, 81), rng.randint(3, 10)))
+            index.add(ticket_id, f"U{ticket_id % 1000}", numbers, 1, 1000)
+        _ticket_indexes.clear()
+        _ticket_indexes[size] = index
+    return _ticket_indexes[size]
+
+
+def bench_subscriptions(data):
+    """訂閱比對：訂閱數與期數相同，逐一比對最近 20 期"""
+    index = _ticket_index(len(data))
+    for draw in data[:20]:
+        index.match(draw, 1)
+
+
+CASES = {
+    'analyze_results': bench_analyze_results,
+    'check_win': bench_check_win,
+    'query_winning': bench_query_winning,
+    'get_best_combination': bench_get_best_combination,
+    'number_index': bench_number_index,
+    'format_range_reply': bench_format_range_reply,
+    'range_reply': bench_range_reply,
+    'format_recent': bench_format_recent,
+    'subscriptions': bench_subscriptions,
+}
+
+
+def measure(func, data, repeat):
+    """回傳 (最短耗時秒數, 記憶體峰值 KB)"""
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func(data)
+        timings.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    func(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak / 1024
+
+
+def compare(results, baseline, tolerance):
+    """列出比基準慢或耗用記憶體多於 tolerance 倍的項目"""
+    regressions = []
+    for key, current in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        for metric in ('seconds', 'peak_kb'):
+            # 太小的數值只是雜訊
+            floor = 0.001 if metric == 'seconds' else 64
+            if base[metric] > floor and current[metric] > base[metric] * tolerance:
+                regressions.append((key, metric, base[metric], current[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='效能基準測試')
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--cases', default=','.join(CASES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=1.3)
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    cases = args.cases.split(',')
+    results = {}
+    print(f"{'case':<22}{'size':>9}{'seconds':>12}{'peak_kb':>12}")
+    for size in sizes:
+        data = generate_history(size)
+        for name in cases:
+            seconds, peak_kb = measure(CASES[name], data, args.repeat)
+            results[f"{name}@{size}"] = {'seconds': round(seconds, 6), 'peak_kb': round(peak_kb, 1)}
+            print(f"{name:<22}{size:>9}{seconds:>12.4f}{peak_kb:>12.1f}")
+        del data
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\n已更新 {BASELINE_PATH}")
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    if not baseline:
+        print("\n尚無 baseline.json，可用 --save-baseline 建立")
+    elif regressions:
+        print("\n⚠️ 效能退步：")
+        for key, metric, base, current in regressions:
+            print(f"  {key} {metric}: {base} -> {current} ({current / base:.2f}x)")
+        sys.exit(1)
+    else:
+        print("\n與 baseline 相比沒有退步")
+
+
+if __name__ == '__main__':
+    main()
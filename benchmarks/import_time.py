@@ -0,0 +1,104 @@
+"""worker 冷啟動的匯入時間檢查
+
+以 `python -X importtime` 匯入 line_bot（LINE API 指向本機替身，不連外），
+回報總匯入時間與最慢的模組，超過預算或處理 webhook 時載入了不需要的套件就以非零狀態結束。
+
+大部分時間花在 LINE SDK：linebot.v3.messaging 的 __init__ 會一併匯入非同步版的 API（約 275 ms）、
+blob API 與 aiohttp，只要用到 MessagingApi 就無法避開。因此 SDK 以外的部分另有較緊的預算
+（預設 400 ms，目前約 200 ms），總預算預設 2000 ms，比目前約 1.3-1.5 s 留有餘裕，不會因機器快慢而時過時不過。
+
+用法：
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --budget-ms 1200 --repeat 5 --top 15
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+import standins
+
+# 只有爬取網站時才需要，不應出現在 webhook 的匯入路徑上
+FORBIDDEN = ['bs4', 'selenium', 'webdriver_manager', 'github']
+LINE_PATTERN = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+
+def measure(module, env):
+    """匯入一次 module，回傳 {模組名稱: (自身微秒, 累計微秒, 巢狀層數)}"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"匯入 {module} 失敗：\n{result.stderr[-2000:]}")
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = LINE_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us), (len(indent) - 1) // 2)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='匯入時間檢查')
+    parser.add_argument('--module', default='line_bot')
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('IMPORT_BUDGET_MS', '2000')))
+    parser.add_argument('--other-budget-ms', type=float, default=float(os.getenv('IMPORT_OTHER_BUDGET_MS', '400')),
+                        help='LINE SDK 以外的匯入時間預算')
+    parser.add_argument('--repeat', type=int, default=3, help='取最快的一次，排除磁碟快取的影響')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    with standins.line_api() as line_api:
+        env = dict(
+            os.environ,
+            LINE_API_HOST=line_api.url,
+            HISTORY_URL=f"{line_api.url}/history",
+            TICKET_WATCH_INTERVAL='0',
+            DELIVERY_WORKER='false',
+            SUBSCRIPTIONS_DB_PATH=os.path.join(tmp, 'subscriptions.db'),
+            DELIVERY_DB_PATH=os.path.join(tmp, 'delivery.db'),
+        )
+        env.pop('BINGO_SHM_NAME', None)
+        runs = [measure(args.module, env) for _ in range(args.repeat)]
+
+    best = min(runs, key=lambda modules: modules[args.module][1])
+    total_ms = best[args.module][1] / 1000
+    # module 直接匯入的 linebot 套件（累計時間包含 SDK 帶進來的 pydantic、aiohttp）
+    sdk_ms = sum(
+        cumulative_us for name, (_, cumulative_us, depth) in best.items()
+        if depth == 1 and name.split('.')[0] == 'linebot'
+    ) / 1000
+    print(f"{args.module} 匯入時間：{total_ms:.1f} ms（預算 {args.budget_ms:.0f} ms，{args.repeat} 次取最快）")
+    other_ms = total_ms - sdk_ms
+    print(f"其中 LINE SDK：{sdk_ms:.1f} ms，其他：{other_ms:.1f} ms（預算 {args.other_budget_ms:.0f} ms）")
+    print(f"\n自身耗時最多的 {args.top} 個模組：")
+    for name, (self_us, cumulative_us, _) in sorted(best.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"  {self_us / 1000:>8.1f} ms  {cumulative_us / 1000:>8.1f} ms  {name}")
+
+    failed = False
+    loaded = [name for name in FORBIDDEN if name in best]
+    if loaded:
+        print(f"\n⚠️ webhook 路徑載入了不需要的套件：{', '.join(loaded)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"\n⚠️ 超過匯入時間預算：{total_ms:.1f} ms > {args.budget_ms:.0f} ms")
+        failed = True
+    if other_ms > args.other_budget_ms:
+        print(f"\n⚠️ LINE SDK 以外超過匯入時間預算：{other_ms:.1f} ms > {args.other_budget_ms:.0f} ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("\n匯入時間在預算內")
+
+
+if __name__ == '__main__':
+    main()
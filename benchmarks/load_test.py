@@ -0,0 +1,231 @@
+"""LINE webhook 壓測工具
+
+啟動 LINE API 與歷史資料的本機替身，以 gunicorn 啟動 line_bot:app（或使用 --target 指定的服務），
+送出正確簽章的 webhook 請求並回報延遲百分位數與每秒請求數。
+
+用法：
+    python benchmarks/load_test.py --requests 500 --concurrency 16 --workers 2
+    python benchmarks/load_test.py --target http://127.0.0.1:8000 --secret <channel secret>
+    python benchmarks/load_test.py --workers 4 --shm bingo --memory   # 共享歷史資料，回報各 worker 的 PSS
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import standins
+from shared_history import memory_usage
+
+DEFAULT_SECRET = 'loadtest-channel-secret'
+
+# 指令組合與權重，大致對應實際使用情形
+COMMAND_MIX = [
+    ('1', 20),
+    ('2', 25),
+    ('最近', 15),
+    ('range', 15),
+    ('numbers', 25),
+]
+
+
+def make_text(rng, latest_period):
+    command = rng.choices([c for c, _ in COMMAND_MIX], weights=[w for _, w in COMMAND_MIX])[0]
+    numbers = ' '.join(str(n) for n in rng.sample(range(1, 81), 3))
+    if command == 'range':
+        start = latest_period - rng.randint(20, 140)
+        return f"{start}-{latest_period} {numbers}"
+    if command == 'numbers':
+        return numbers
+    return command
+
+
+def make_payload(text):
+    """產生一個 LINE 文字訊息 webhook 事件"""
+    return json.dumps({
+        'destination': 'Ustandin',
+        'events': [{
+            'type': 'message',
+            'mode': 'active',
+            'timestamp': int(time.time() * 1000),
+            'webhookEventId': uuid.uuid4().hex.upper(),
+            'deliveryContext': {'isRedelivery': False},
+            'replyToken': uuid.uuid4().hex,
+            'source': {'type': 'user', 'userId': 'U' + uuid.uuid4().hex},
+            'message': {
+                'type': 'text',
+                'id': str(random.randint(10 ** 17, 10 ** 18)),
+                'quoteToken': uuid.uuid4().hex,
+                'text': text
+            }
+        }]
+    }, ensure_ascii=False).encode('utf-8')
+
+
+def sign(body, secret):
+    digest = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode('utf-8')
+
+
+def post_webhook(url, body, secret, timeout):
+    req = urllib.request.Request(url, data=body, method='POST', headers={
+        'Content-Type': 'application/json; charset=utf-8',
+        'X-Line-Signature': sign(body, secret)
+    })
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            ok = resp.status == 200
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return True
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    return False
+
+
+def worker_memory(master_pid):
+    """gunicorn master 與各 worker 的 RSS/PSS（KB），PSS 依共用的行程數分攤共享分頁"""
+    try:
+        with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+            children = [int(pid) for pid in f.read().split()]
+        with open(f"/proc/{master_pid}/cmdline", 'rb') as f:
+            cmdline = f.read()
+    except OSError:
+        return None
+    # worker 由 master fork 出來，命令列相同；略過 resource_tracker 等其他子行程
+    workers = []
+    for pid in children:
+        try:
+            with open(f"/proc/{pid}/cmdline", 'rb') as f:
+                if f.read() == cmdline:
+                    workers.append(pid)
+        except OSError:
+            pass
+    usage = [memory_usage(pid) for pid in workers]
+    return {
+        'master': memory_usage(master_pid),
+        'workers_rss_kb': [u.get('rss_kb') for u in usage],
+        'workers_pss_kb': [u.get('pss_kb') for u in usage],
+    }
+
+
+def run(url, secret, total, concurrency, latest_period, timeout, seed):
+    rng = random.Random(seed)
+    payloads = [make_payload(make_text(rng, latest_period)) for _ in range(total)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda body: post_webhook(url, body, secret, timeout), payloads))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for latency, ok in results if ok)
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'errors': sum(1 for _, ok in results if not ok),
+        'elapsed_s': round(elapsed, 3),
+        'rps': round(total / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LINE webhook 壓測')
+    parser.add_argument('--target', help='已在執行的服務網址，未指定時自動以 gunicorn 啟動')
+    parser.add_argument('--secret', default=DEFAULT_SECRET, help='LINE channel secret')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker 數')
+    parser.add_argument('--threads', type=int, default=4, help='每個 worker 的執行緒數')
+    parser.add_argument('--history', default=os.path.join(ROOT, 'data', 'bingo_history.json'))
+    parser.add_argument('--upstream-latency', type=float, default=0.0, help='替身伺服器的回應延遲（秒）')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--shm', metavar='NAME', help='設定 BINGO_SHM_NAME，由 gunicorn master 發布共享歷史資料')
+    parser.add_argument('--memory', action='store_true', help='結束前回報 master 與各 worker 的記憶體用量')
+    parser.add_argument('--json', action='store_true', help='以 JSON 輸出結果')
+    args = parser.parse_args()
+
+    with open(args.history, 'rb') as f:
+        history_bytes = f.read()
+    latest_period = int(json.loads(history_bytes)['records'][0]['期號'])
+
+    line_api = standins.line_api(latency=args.upstream_latency).start()
+    history = standins.history_server(history_bytes, latency=args.upstream_latency).start()
+    app = None
+    try:
+        if args.target:
+            base_url = args.target.rstrip('/')
+        else:
+            port = 18000 + os.getpid() % 1000
+            base_url = f"http://127.0.0.1:{port}"
+            env = dict(
+                os.environ,
+                LINE_API_HOST=line_api.url,
+                HISTORY_URL=f"{history.url}/data/bingo_history.json",
+                LINE_CHANNEL_SECRET=args.secret,
+                LINE_CHANNEL_ACCESS_TOKEN='loadtest-token',
+                BINGO_SHM_NAME=args.shm or '',
+            )
+            app = subprocess.Popen([
+                sys.executable, '-m', 'gunicorn', 'line_bot:app',
+                '-b', f"127.0.0.1:{port}",
+                '-w', str(args.workers), '--threads', str(args.threads),
+                '--log-level', 'warning'
+            ], cwd=ROOT, env=env)
+            if not wait_until_up(f"{base_url}/"):
+                raise SystemExit('服務未能啟動')
+
+        report = run(f"{base_url}/webhook", args.secret, args.requests, args.concurrency,
+                     latest_period, args.timeout, args.seed)
+        report['line_replies'] = sum(1 for m, p, _ in line_api.requests if p == '/v2/bot/message/reply')
+        report['history_fetches'] = len(history.requests)
+        if args.memory and app is not None:
+            report['memory'] = worker_memory(app.pid)
+        if args.json:
+            print(json.dumps(report, ensure_ascii=False))
+        else:
+            for key, value in report.items():
+                print(f"{key:>16}: {value}")
+    finally:
+        if app is not None:
+            app.terminate()
+            app.wait(timeout=10)
+        line_api.stop()
+        history.stop()
+
+
+if __name__ == '__main__':
+    main()
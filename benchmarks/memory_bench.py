@@ -0,0 +1,142 @@
+"""更新 bingo_history.json 的記憶體峰值：整份載入與串流讀寫的比較
+
+以合成的多年歷史（每天 203 期）模擬 update_history 的一次更新：讀入現有檔案、
+合併一天的新資料、寫出並計算上傳用的 blob SHA。兩種做法各在獨立的子行程中執行，
+以 ru_maxrss 量測峰值，並扣除開始更新前的基準。
+
+用法：
+    python benchmarks/memory_bench.py                  # 1、3、5 年
+    python benchmarks/memory_bench.py --years 1,10
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import islice
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+from synthetic import DRAWS_PER_DAY, iter_draws
+
+LAST_UPDATED = "2030-01-01T00:00:00+08:00"
+
+
+def new_day(count):
+    """接在 count 期之後的一天新資料（期號由大到小），另含最新一期的重複資料"""
+    records = list(islice(iter_draws(count + DRAWS_PER_DAY), count - 1, None))
+    records.reverse()
+    return records
+
+
+def run_legacy(path, new_records):
+    """原本的做法：整份 json.load、以字典合併、排序後 json.dumps"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    existing = {record['期號']: record for record in data['records']}
+    for record in new_records:
+        existing.setdefault(record['期號'], record)
+    records = sorted(existing.values(), key=lambda r: int(r['期號']), reverse=True)
+    content = json.dumps({"last_updated": LAST_UPDATED, "records": records},
+                         ensure_ascii=False, indent=2).encode('utf-8')
+    sha = hashlib.sha1(b'blob %d\0' % len(content) + content).hexdigest()
+    # 上傳時的 base64 本文
+    body = base64.b64encode(content)
+    return len(records), sha, len(body)
+
+
+def run_streaming(path, new_records):
+    """串流做法：逐筆讀取與合併、寫到暫存檔，SHA 與上傳本文都逐塊產生"""
+    from github_commit import FileContent, _BlobUploadBody
+    from history_stream import HistoryReader, merge_records, write_history
+
+    reader = HistoryReader.from_file(path)
+    fd, tmp_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        count = write_history(tmp_path, merge_records(reader.records(), new_records), LAST_UPDATED)
+        content = FileContent(tmp_path)
+        sha = content.blob_sha()
+        body = _BlobUploadBody(content)
+        size = 0
+        while True:
+            data = body.read(8192)
+            if not data:
+                break
+            size += len(data)
+        return count, sha, size
+    finally:
+        os.remove(tmp_path)
+
+
+MODES = {'legacy': run_legacy, 'streaming': run_streaming}
+
+
+def child(mode, path, count):
+    """子行程：執行一種做法，輸出結果與峰值 RSS（KB）"""
+    new_records = new_day(count)
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    result = MODES[mode](path, new_records)
+    elapsed = time.perf_counter() - started
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        'records': result[0], 'sha': result[1], 'body_bytes': result[2],
+        'seconds': elapsed, 'baseline_kb': baseline_kb, 'peak_kb': peak_kb
+    }))
+
+
+def measure(mode, path, count):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', mode, path, str(count)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if output.returncode != 0:
+        raise SystemExit(f"{mode} 執行失敗：\n{output.stderr[-2000:]}")
+    return json.loads(output.stdout)
+
+
+def generate(path, count):
+    # 產生檔案本身就要整份放進記憶體，放在另一個子行程以免影響量測
+    subprocess.run(
+        [sys.executable, '-c', f'import synthetic; synthetic.write_history({path!r}, {count})'],
+        cwd=HERE, check=True
+    )
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        return
+
+    parser = argparse.ArgumentParser(description='bingo_history.json 更新的記憶體峰值')
+    parser.add_argument('--years', default='1,3,5', help='以逗號分隔的年數')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    print(f"{'年':>4} {'期數':>9} {'檔案 MB':>8} {'做法':>10} {'峰值 MB':>8} {'秒':>7}")
+    for years in (float(y) for y in args.years.split(',')):
+        count = int(years * 365 * DRAWS_PER_DAY)
+        path = os.path.join(tmp, f"history_{count}.json")
+        generate(path, count)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        results = {mode: measure(mode, path, count) for mode in MODES}
+        if results['legacy']['sha'] != results['streaming']['sha']:
+            raise SystemExit(f"{years:g} 年：兩種做法的輸出不同")
+        for mode, result in results.items():
+            peak_mb = (result['peak_kb'] - result['baseline_kb']) / 1024
+            print(f"{years:>4g} {count:>9} {size_mb:>8.1f} {mode:>10} {peak_mb:>8.1f} {result['seconds']:>7.2f}")
+        os.remove(path)
+    os.rmdir(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,431 @@
+"""本機替身伺服器：取代 LINE Messaging API、GitHub raw 歷史資料、GitHub API 與 Redis，供壓測與驗證使用"""
+import base64
+import hashlib
+import json
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandInServer:
+    """在背景執行緒中跑的伺服器（預設為 HTTP），記錄收到的請求"""
+
+    def __init__(self, handler_class, host='127.0.0.1', port=0, server_class=ThreadingHTTPServer,
+                 scheme='http', **state):
+        self.state = dict(state)
+        self.requests = []
+        self.lock = threading.Lock()
+        self.scheme = scheme
+        server = self
+
+        class Handler(handler_class):
+            standin = server
+
+        self.httpd = server_class((host, port), Handler)
+        self.httpd.daemon_threads = True
+        # 用戶端逾時中斷連線屬預期情況，不輸出錯誤
+        self.httpd.handle_error = lambda request, client_address: None
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"{self.scheme}://{host}:{port}"
+
+    def record(self, method, path, body):
+        with self.lock:
+            self.requests.append((method, path, body))
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        # 長連線（Redis）一併中斷，模擬伺服器停止
+        for connection in list(self.state.get('connections', ())):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    standin = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status, payload, content_type='application/json'):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _delay(self):
+        latency = self.standin.state.get('latency', 0)
+        if latency:
+            time.sleep(latency)
+
+
+class LineAPIHandler(_JSONHandler):
+    """LINE Messaging API 替身：bot info、reply、push 與 multicast"""
+
+    def do_GET(self):
+        self.standin.record('GET', self.path, b'')
+        if self.path == '/v2/bot/info':
+            self._send(200, {
+                'userId': 'Ustandin', 'basicId': '@standin', 'displayName': 'stand-in bot',
+                'chatMode': 'bot', 'markAsReadMode': 'auto'
+            })
+        else:
+            self._send(404, {'message': 'Not found'})
+
+    def do_POST(self):
+        body = self._read_body()
+        self.standin.record('POST', self.path, body)
+        self._delay()
+        if self.path == '/v2/bot/message/reply':
+            messages = json.loads(body or b'{}').get('messages', [])
+            self._send(200, {'sentMessages': [{'id': str(i), 'quoteToken': 'q'} for i in range(len(messages))]})
+        elif self.path == '/v2/bot/message/push':
+            messages = json.loads(body or b'{}').get('messages', [])
+            self._send(200, {'sentMessages': [{'id': str(i), 'quoteToken': 'q'} for i in range(len(messages))]})
+        elif self.path == '/v2/bot/message/multicast':
+            self._multicast(body)
+        else:
+            self._send(404, {'message': 'Not found'})
+
+
+    def _multicast(self, body):
+        """multicast：同一個 X-Line-Retry-Key 第二次送來時回 409；
+        state 的 fail_next 可讓接下來 N 個請求回 500，delivered 記錄已送達的收件人"""
+        retry_key = self.headers.get('X-Line-Retry-Key')
+        state = self.standin.state
+        with self.standin.lock:
+            accepted = state.setdefault('accepted_keys', set())
+            if retry_key and retry_key in accepted:
+                self._send(409, {'message': 'The retry key is already accepted'})
+                return
+            if state.get('fail_next', 0) > 0:
+                state['fail_next'] -= 1
+                self._send(500, {'message': 'Internal server error'})
+                return
+            if retry_key:
+                accepted.add(retry_key)
+            state.setdefault('delivered', []).extend(json.loads(body or b'{}').get('to', []))
+        self._send(200, {})
+
+
+class HistoryHandler(_JSONHandler):
+    """GitHub raw 或開獎網站的替身：回傳固定內容，可設定延遲與狀態碼"""
+
+    def do_GET(self):
+        self.standin.record('GET', self.path, b'')
+        self._delay()
+        status = self.standin.state.get('status', 200)
+        body = self.standin.state['history'] if status == 200 else b'error'
+        self._send(status, body, self.standin.state.get('content_type', 'application/json'))
+
+
+class GitHubAPIHandler(_JSONHandler):
+    """GitHub Git Data API 替身：ref、commit、tree、blob，物件存在 state['objects']"""
+
+    def _parts(self):
+        path = self.path.split('?')[0]
+        prefix = f"/repos/{self.standin.state['repo']}/git/"
+        if not path.startswith(prefix):
+            return None
+        return path[len(prefix):].split('/')
+
+    def do_GET(self):
+        self.standin.record('GET', self.path, b'')
+        parts = self._parts()
+        state = self.standin.state
+        objects = state['objects']
+        if parts and parts[:2] == ['ref', 'heads'] and '/'.join(parts[2:]) in state['refs']:
+            sha = state['refs']['/'.join(parts[2:])]
+            self._send(200, {'ref': f"refs/heads/{'/'.join(parts[2:])}", 'object': {'sha': sha, 'type': 'commit'}})
+        elif parts and len(parts) == 2 and parts[0] == 'commits' and parts[1] in objects:
+            commit = objects[parts[1]]
+            self._send(200, {'sha': parts[1], 'tree': {'sha': commit['tree']}, 'parents': [{'sha': p} for p in commit['parents']],
+                             'message': commit['message']})
+        elif parts and len(parts) == 2 and parts[0] == 'trees' and parts[1] in objects:
+            tree = objects[parts[1]]
+            self._send(200, {'sha': parts[1], 'tree': [
+                {'path': name, 'type': kind, 'sha': sha, 'mode': '040000' if kind == 'tree' else '100644'}
+                for name, (kind, sha) in sorted(tree.items())
+            ], 'truncated': False})
+        else:
+            self._send(404, {'message': 'Not Found'})
+
+    def do_POST(self):
+        body = self._read_body()
+        self.standin.record('POST', self.path, body)
+        parts = self._parts()
+        payload = json.loads(body or b'{}')
+        with self.standin.lock:
+            if parts == ['blobs']:
+                content = payload['content'].encode('utf-8')
+                if payload.get('encoding') == 'base64':
+                    content = base64.b64decode(content)
+                sha = _store_blob(self.standin.state, content)
+                self._send(201, {'sha': sha})
+            elif parts == ['trees']:
+                files = _flatten(self.standin.state['objects'], payload.get('base_tree'))
+                for entry in payload['tree']:
+                    files[entry['path']] = entry['sha']
+                self._send(201, {'sha': _store_tree(self.standin.state, files)})
+            elif parts == ['commits']:
+                commit = {'tree': payload['tree'], 'parents': payload['parents'], 'message': payload['message']}
+                sha = hashlib.sha1(json.dumps(commit, sort_keys=True).encode()).hexdigest()
+                self.standin.state['objects'][sha] = commit
+                self._send(201, {'sha': sha})
+            else:
+                self._send(404, {'message': 'Not Found'})
+
+    def do_PATCH(self):
+        body = self._read_body()
+        self.standin.record('PATCH', self.path, body)
+        parts = self._parts()
+        payload = json.loads(body or b'{}')
+        state = self.standin.state
+        with self.standin.lock:
+            branch = '/'.join(parts[2:]) if parts and parts[:2] == ['refs', 'heads'] else None
+            if branch not in state['refs']:
+                self._send(404, {'message': 'Not Found'})
+                return
+            commit = state['objects'].get(payload['sha'])
+            if not payload.get('force') and state['refs'][branch] not in (commit or {}).get('parents', []):
+                self._send(422, {'message': 'Update is not a fast forward'})
+                return
+            state['refs'][branch] = payload['sha']
+            self._send(200, {'ref': f"refs/heads/{branch}", 'object': {'sha': payload['sha'], 'type': 'commit'}})
+
+
+def _compare_and_delete(handler, keys, args):
+    entry = handler._live(keys[0])
+    if entry is not None and entry[0] == args[0]:
+        del handler.standin.state['data'][keys[0]]
+        return 1
+    return 0
+
+
+# 無法執行 Lua，EVAL 只支援這些腳本（內容須與 shared_cache 中的相同）
+REDIS_SCRIPTS = {
+    "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) else return 0 end":
+        _compare_and_delete,
+}
+
+
+class RedisHandler(socketserver.StreamRequestHandler):
+    """Redis 替身：支援 PING、GET、SET（NX、PX、EX）、DEL、EVAL（REDIS_SCRIPTS）、PUBLISH、SUBSCRIBE，
+    資料存在 state['data']"""
+    standin = None
+
+    def _write(self, payload):
+        with self._write_lock:
+            self.wfile.write(payload)
+            self.wfile.flush()
+
+    @staticmethod
+    def _bulk(value):
+        return b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        self._write_lock = threading.Lock()
+        with self.standin.lock:
+            self.standin.state['connections'].add(self.request)
+        while True:
+            try:
+                args = self._read_command()
+            except (OSError, ValueError):
+                return
+            if args is None:
+                return
+            if not args:
+                continue
+            self.standin.record(args[0].decode().upper(), args[1].decode(errors='replace') if len(args) > 1 else '', b'')
+            try:
+                reply = self._execute(args[0].decode().upper(), args[1:])
+            except (IndexError, ValueError):
+                reply = b'-ERR syntax error\r\n'
+            if reply is None:
+                return
+            try:
+                self._write(reply)
+            except OSError:
+                return
+
+    def finish(self):
+        with self.standin.lock:
+            self.standin.state['connections'].discard(self.request)
+            for subscribers in self.standin.state['channels'].values():
+                subscribers.discard(self)
+        super().finish()
+
+    def _live(self, key):
+        entry = self.standin.state['data'].get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.standin.state['data'][key]
+            return None
+        return entry
+
+    def _execute(self, command, args):
+        state = self.standin.state
+        if command == 'PING':
+            return b'+PONG\r\n'
+        if command == 'QUIT':
+            self._write(b'+OK\r\n')
+            return None
+        with self.standin.lock:
+            if command == 'GET':
+                entry = self._live(args[0])
+                return self._bulk(entry[0] if entry else None)
+            if command == 'SET':
+                key, value = args[0], args[1]
+                options = [a.decode().upper() for a in args[2:]]
+                expires = None
+                if 'PX' in options:
+                    expires = time.monotonic() + int(options[options.index('PX') + 1]) / 1000
+                elif 'EX' in options:
+                    expires = time.monotonic() + int(options[options.index('EX') + 1])
+                if 'NX' in options and self._live(key) is not None:
+                    return b'$-1\r\n'
+                state['data'][key] = (value, expires)
+                return b'+OK\r\n'
+            if command == 'DEL':
+                removed = sum(1 for key in args if self._live(key) is not None and state['data'].pop(key))
+                return b':%d\r\n' % removed
+            if command == 'EVAL':
+                script = REDIS_SCRIPTS.get(args[0].decode())
+                if script is None:
+                    return b'-NOSCRIPT unsupported script\r\n'
+                count = int(args[1])
+                return b':%d\r\n' % script(self, args[2:2 + count], args[2 + count:])
+            if command == 'PUBLISH':
+                channel, message = args
+                subscribers = list(state['channels'].get(channel, ()))
+                state.setdefault('published', []).append((channel, message))
+            elif command == 'SUBSCRIBE':
+                replies = []
+                for i, channel in enumerate(args, 1):
+                    state['channels'].setdefault(channel, set()).add(self)
+                    replies.append(b'*3\r\n' + self._bulk(b'subscribe') + self._bulk(channel) + b':%d\r\n' % i)
+                return b''.join(replies)
+            else:
+                return b'-ERR unknown command\r\n'
+        # PUBLISH：在鎖外寫給訂閱者
+        frame = b'*3\r\n' + self._bulk(b'message') + self._bulk(channel) + self._bulk(message)
+        delivered = 0
+        for subscriber in subscribers:
+            try:
+                subscriber._write(frame)
+                delivered += 1
+            except OSError:
+                pass
+        return b':%d\r\n' % delivered
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _store_blob(state, content):
+    sha = hashlib.sha1(b'blob %d\0' % len(content) + content).hexdigest()
+    state['objects'][sha] = content
+    return sha
+
+
+def _store_tree(state, files):
+    """由 {路徑: blob SHA} 逐層建立 tree，回傳根 tree 的 SHA"""
+    children = {}
+    subdirs = {}
+    for path, sha in files.items():
+        head, _, rest = path.partition('/')
+        if rest:
+            subdirs.setdefault(head, {})[rest] = sha
+        else:
+            children[head] = ('blob', sha)
+    for name, sub in subdirs.items():
+        children[name] = ('tree', _store_tree(state, sub))
+    sha = hashlib.sha1(json.dumps(sorted(children.items())).encode()).hexdigest()
+    state['objects'][sha] = children
+    return sha
+
+
+def _flatten(objects, tree_sha, prefix=''):
+    files = {}
+    if tree_sha is None:
+        return files
+    for name, (kind, sha) in objects[tree_sha].items():
+        if kind == 'tree':
+            files.update(_flatten(objects, sha, f"{prefix}{name}/"))
+        else:
+            files[f"{prefix}{name}"] = sha
+    return files
+
+
+def github_files(standin, branch='main'):
+    """目前分支上的檔案內容 {路徑: bytes}"""
+    state = standin.state
+    tree = state['objects'][state['refs'][branch]]['tree']
+    return {path: state['objects'][sha] for path, sha in _flatten(state['objects'], tree).items()}
+
+
+def github_api(files, repo='owner/repo', branch='main', **state):
+    """以 files（{路徑: bytes}）建立初始 commit 的 GitHub API 替身"""
+    server = StandInServer(GitHubAPIHandler, repo=repo, objects={}, refs={}, **state)
+    tree = _store_tree(server.state, {path: _store_blob(server.state, content) for path, content in files.items()})
+    commit = {'tree': tree, 'parents': [], 'message': 'initial'}
+    sha = hashlib.sha1(json.dumps(commit, sort_keys=True).encode()).hexdigest()
+    server.state['objects'][sha] = commit
+    server.state['refs'][branch] = sha
+    return server
+
+
+def redis_server(**state):
+    """Redis 替身，url 為 redis://host:port"""
+    return StandInServer(RedisHandler, server_class=_ThreadingTCPServer, scheme='redis',
+                         data={}, channels={}, connections=set(), **state)
+
+
+def line_api(**state):
+    return StandInServer(LineAPIHandler, **state)
+
+
+def history_server(history_bytes, **state):
+    return StandInServer(HistoryHandler, history=history_bytes, **state)
+
+
+def pilio_server(page_bytes, **state):
+    return StandInServer(HistoryHandler, history=page_bytes, content_type='text/html; charset=utf-8', **state)
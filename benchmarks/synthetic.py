@@ -0,0 +1,67 @@
+"""可重現的合成開獎歷史，格式與 data/bingo_history.json 相同
+
+每天 07:05 到 23:55 每 5 分鐘一期（203 期），期號為民國年 + 當年流水號（6 位數）。
+
+用法：
+    python benchmarks/synthetic.py 100000 /tmp/history_100k.json
+"""
+import json
+import random
+import sys
+from datetime import datetime, timedelta
+
+WEEKDAYS = '一二三四五六日'
+DRAWS_PER_DAY = 203
+FIRST_DRAW = (7, 5)
+
+
+def iter_draws(count, seed=0, start=datetime(2020, 1, 1)):
+    """依開獎先後產生 count 期資料（最舊的在前）"""
+    rng = random.Random(seed)
+    population = range(1, 81)
+    day = start
+    year_seq = 0
+    produced = 0
+    while produced < count:
+        if day.year != (day - timedelta(days=1)).year:
+            year_seq = 0
+        for slot in range(DRAWS_PER_DAY):
+            if produced >= count:
+                return
+            year_seq += 1
+            minutes = FIRST_DRAW[0] * 60 + FIRST_DRAW[1] + slot * 5
+            numbers = sorted(rng.sample(population, 20))
+            yield {
+                '期號': f"{day.year - 1911}{year_seq:06d}",
+                '開獎號碼': numbers,
+                '超級獎號': numbers[rng.randrange(20)],
+                '時間': f"{minutes // 60:02d}:{minutes % 60:02d}",
+                '是否前一天': False,
+                '日期': f"{day.strftime('%Y/%m/%d')}({WEEKDAYS[day.weekday()]})"
+            }
+            produced += 1
+        day += timedelta(days=1)
+
+
+def generate_history(count, seed=0):
+    """回傳期號由大到小的開獎列表（與 scrape_bingo() 相同順序）"""
+    records = list(iter_draws(count, seed))
+    records.reverse()
+    return records
+
+
+def write_history(path, count, seed=0):
+    """寫出與 bingo_history.json 相同結構的檔案"""
+    data = {
+        "last_updated": "2020-01-01T00:00:00+08:00",
+        "records": generate_history(count, seed)
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("用法: python benchmarks/synthetic.py <期數> <輸出路徑>")
+        sys.exit(1)
+    write_history(sys.argv[2], int(sys.argv[1]))
@@ -0,0 +1,165 @@
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+# LINE 重送同一事件時 webhookEventId 不變
+DEDUP_TTL = float(os.getenv('DEDUP_TTL', '3600'))
+DEDUP_MAX_SIZE = int(os.getenv('DEDUP_MAX_SIZE', '10000'))
+# 設定後改用 SQLite 記錄，所有 worker 共用，重啟後仍有效
+DEDUP_DB_PATH = os.getenv('DEDUP_DB_PATH')
+
+
+def event_key(event):
+    """事件的去重鍵：優先使用 webhookEventId，沒有時用訊息 id"""
+    event_id = getattr(event, 'webhook_event_id', None)
+    if event_id:
+        return event_id
+    message = getattr(event, 'message', None)
+    message_id = getattr(message, 'id', None)
+    return f"message:{message_id}" if message_id else None
+
+
+class SeenEvents:
+    """有容量上限與存活時間的 LRU 集合"""
+
+    def __init__(self, max_size=DEDUP_MAX_SIZE, ttl=DEDUP_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, key):
+        """第一次看到 key 時加入並回傳 True，仍在存活時間內的重複 key 回傳 False"""
+        now = time.monotonic()
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is not None and expires > now:
+                self._entries.move_to_end(key)
+                return False
+            self._entries[key] = now + self.ttl
+            self._entries.move_to_end(key)
+            # 先移除已過期的，再依 LRU 淘汰超出容量的
+            while self._entries:
+                oldest, oldest_expires = next(iter(self._entries.items()))
+                if oldest_expires > now and len(self._entries) <= self.max_size:
+                    break
+                del self._entries[oldest]
+                if oldest_expires > now:
+                    self.evicted += 1
+            return True
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SQLiteSeenEvents:
+    """以 SQLite 記錄處理過的事件，多個 worker 共用"""
+
+    def __init__(self, path, ttl=DEDUP_TTL, purge_interval=60):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS seen_events (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+        self.evicted = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM seen_events").fetchone()[0]
+
+    def add(self, key):
+        now = time.time()
+        conn = self._conn()
+        if now - self._last_purge > self.purge_interval:
+            self._last_purge = now
+            conn.execute("DELETE FROM seen_events WHERE expires_at <= ?", (now,))
+        # 已過期的舊記錄可被覆寫
+        cursor = conn.execute(
+            "INSERT INTO seen_events (key, expires_at) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET expires_at = excluded.expires_at "
+            "WHERE seen_events.expires_at <= ?",
+            (key, now + self.ttl, now)
+        )
+        return cursor.rowcount > 0
+
+    def discard(self, key):
+        self._conn().execute("DELETE FROM seen_events WHERE key = ?", (key,))
+
+
+class Deduplicator:
+    """webhook 事件去重：重送的事件直接確認，不再處理"""
+
+    def __init__(self, seen):
+        self.seen = seen
+        self._lock = threading.Lock()
+        self._counters = {'checked': 0, 'processed': 0, 'duplicates_dropped': 0, 'redeliveries': 0, 'no_key': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+
+    def once(self, func):
+        """裝飾事件處理函式；處理失敗時移除記錄，讓 LINE 重送時可以重試
+
+        SDK 依函式的參數個數決定是否傳入 destination，所以包裝後只接受 event
+        """
+        @wraps(func)
+        def wrapper(event):
+            self._count('checked')
+            delivery_context = getattr(event, 'delivery_context', None)
+            if getattr(delivery_context, 'is_redelivery', False):
+                self._count('redeliveries')
+            key = event_key(event)
+            if key is None:
+                self._count('no_key')
+            elif not self.seen.add(key):
+                self._count('duplicates_dropped')
+                logger.info(f"略過重複事件：{key}")
+                return None
+            try:
+                result = func(event)
+            except Exception:
+                if key is not None:
+                    self.seen.discard(key)
+                raise
+            self._count('processed')
+            return result
+        return wrapper
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._counters)
+        metrics.update(size=len(self.seen), evicted=self.seen.evicted,
+                       backend='sqlite' if isinstance(self.seen, SQLiteSeenEvents) else 'memory')
+        return metrics
+
+
+def create_deduplicator():
+    if DEDUP_DB_PATH:
+        return Deduplicator(SQLiteSeenEvents(DEDUP_DB_PATH))
+    return Deduplicator(SeenEvents())
@@ -0,0 +1,343 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from collections import deque
+
+from linebot.v3.messaging import ApiClient, ApiException, MessagingApi, MulticastRequest, TextMessage
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_DB_PATH = os.getenv('DELIVERY_DB_PATH', 'data/delivery.db')
+# LINE multicast 一次最多 500 位收件人、5 則訊息
+MULTICAST_LIMIT = 500
+MAX_MESSAGES = 5
+# 每秒最多送出的 multicast 請求數（LINE 的上限是 200）
+DELIVERY_RATE = float(os.getenv('DELIVERY_RATE', '20'))
+DELIVERY_MAX_ATTEMPTS = int(os.getenv('DELIVERY_MAX_ATTEMPTS', '5'))
+# 送出中的批次超過此秒數未回報結果，視為 worker 已中斷，可由其他 worker 重送
+SENDING_LEASE = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS followers (
+    user_id TEXT PRIMARY KEY,
+    active INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    messages TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL,
+    recipients TEXT NOT NULL,
+    retry_key TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_batches_due ON batches(status, next_attempt_at);
+"""
+
+
+class DeliveryError(Exception):
+    """送出失敗；retryable 表示稍後重試可能成功，retry_after 為建議等待秒數"""
+
+    def __init__(self, message, status=None, retryable=True, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class AlreadyAccepted(Exception):
+    """同一個 retry key 的請求已被 LINE 接受過（重啟後重送的批次）"""
+
+
+class TokenBucket:
+    """令牌桶限速：平均每秒 rate 個，最多累積 capacity 個"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一個令牌，不足時等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class LineMulticastSender:
+    """以 MessagingApi.multicast 送出一個批次，帶 X-Line-Retry-Key 讓重送不會重複"""
+
+    def __init__(self, configuration):
+        self.configuration = configuration
+
+    def __call__(self, recipients, messages, retry_key):
+        try:
+            with ApiClient(self.configuration) as api_client:
+                MessagingApi(api_client).multicast(
+                    MulticastRequest(to=recipients, messages=[TextMessage(text=text) for text in messages]),
+                    x_line_retry_key=retry_key
+                )
+        except ApiException as e:
+            if e.status == 409:
+                raise AlreadyAccepted(retry_key)
+            retry_after = None
+            if e.headers and e.headers.get('Retry-After', '').isdigit():
+                retry_after = int(e.headers['Retry-After'])
+            raise DeliveryError(
+                f"HTTP {e.status}: {e.reason}", status=e.status,
+                retryable=e.status == 429 or e.status >= 500, retry_after=retry_after
+            )
+        except Exception as e:
+            raise DeliveryError(str(e))
+
+
+class ThroughputStats:
+    """最近送出的批次，用來計算每秒收件人數"""
+
+    def __init__(self, window=60.0):
+        self.window = window
+        self._events = deque()
+        self.totals = {'batches_sent': 0, 'recipients_sent': 0, 'batches_retried': 0, 'batches_failed': 0}
+        self._lock = threading.Lock()
+
+    def record(self, key, recipients=0):
+        with self._lock:
+            self.totals[key] += 1
+            if key == 'batches_sent':
+                self.totals['recipients_sent'] += recipients
+                self._events.append((time.monotonic(), recipients))
+
+    def snapshot(self):
+        with self._lock:
+            cutoff = time.monotonic() - self.window
+            while self._events and self._events[0][0] < cutoff:
+                self._events.popleft()
+            recent = sum(count for _, count in self._events)
+            return dict(self.totals, recipients_per_sec=round(recent / self.window, 2))
+
+
+class DeliveryQueue:
+    """持久化的推播佇列：工作依收件人切成批次，每個批次獨立重試
+
+    每個批次建立時就產生 retry key 並存入 SQLite，重啟後重送同一批次會帶相同的 key，
+    LINE 回 409 表示先前已送達，不會重複推播。
+    """
+
+    def __init__(self, path=DELIVERY_DB_PATH, max_attempts=DELIVERY_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def follow(self, user_id):
+        self._conn().execute(
+            "INSERT INTO followers (user_id, active, updated_at) VALUES (?, 1, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET active = 1, updated_at = excluded.updated_at",
+            (user_id, time.time())
+        )
+
+    def unfollow(self, user_id):
+        self._conn().execute(
+            "UPDATE followers SET active = 0, updated_at = ? WHERE user_id = ?", (time.time(), user_id)
+        )
+
+    def followers(self):
+        return [row[0] for row in self._conn().execute("SELECT user_id FROM followers WHERE active = 1 ORDER BY user_id")]
+
+    def enqueue(self, key, messages, recipients=None):
+        """新增推播工作（recipients 省略時送給所有追蹤者），同一個 key 只會排入一次
+
+        回傳建立的批次數，key 已存在時回傳 0。
+        """
+        if isinstance(messages, str):
+            messages = [messages]
+        if not 1 <= len(messages) <= MAX_MESSAGES:
+            raise ValueError(f"每次最多 {MAX_MESSAGES} 則訊息")
+        if recipients is None:
+            recipients = self.followers()
+        recipients = list(dict.fromkeys(recipients))
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (key, messages, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(messages, ensure_ascii=False), time.time())
+            )
+            if not cursor.rowcount:
+                conn.execute("ROLLBACK")
+                return 0
+            job_id = cursor.lastrowid
+            batches = [
+                (job_id, json.dumps(recipients[i:i + MULTICAST_LIMIT]), str(uuid.uuid4()))
+                for i in range(0, len(recipients), MULTICAST_LIMIT)
+            ]
+            conn.executemany("INSERT INTO batches (job_id, recipients, retry_key) VALUES (?, ?, ?)", batches)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        logger.info(f"推播工作 {key}：{len(recipients)} 位收件人，{len(batches)} 個批次")
+        return len(batches)
+
+    def claim(self, limit=10):
+        """取出到期的批次並標記為送出中，回傳 [(批次編號, 收件人, 訊息, retry key, 已嘗試次數)]"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT b.id, b.recipients, j.messages, b.retry_key, b.attempts FROM batches b "
+                "JOIN jobs j ON j.id = b.job_id "
+                "WHERE b.status IN ('pending', 'sending') AND b.next_attempt_at <= ? "
+                "ORDER BY b.next_attempt_at, b.id LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE batches SET status = 'sending', attempts = attempts + 1, next_attempt_at = ? WHERE id = ?",
+                [(now + SENDING_LEASE, row[0]) for row in rows]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [
+            (batch_id, json.loads(recipients), json.loads(messages), retry_key, attempts + 1)
+            for batch_id, recipients, messages, retry_key, attempts in rows
+        ]
+
+    def mark_sent(self, batch_id):
+        self._conn().execute(
+            "UPDATE batches SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?", (time.time(), batch_id)
+        )
+
+    def mark_failed(self, batch_id, attempts, error):
+        """可重試的錯誤以指數退避排回佇列，超過次數或不可重試時標記為失敗"""
+        if error.retryable and attempts < self.max_attempts:
+            delay = error.retry_after or min(2 ** attempts, 300)
+            self._conn().execute(
+                "UPDATE batches SET status = 'pending', next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (time.time() + delay, str(error), batch_id)
+            )
+            return True
+        self._conn().execute(
+            "UPDATE batches SET status = 'failed', last_error = ? WHERE id = ?", (str(error), batch_id)
+        )
+        return False
+
+    def counts(self):
+        return dict(self._conn().execute("SELECT status, COUNT(*) FROM batches GROUP BY status").fetchall())
+
+
+class DeliveryWorker:
+    """從佇列取出批次，經限速後送出；失敗的批次各自重試"""
+
+    def __init__(self, queue, send, rate=DELIVERY_RATE, poll_interval=1.0):
+        self.queue = queue
+        self.send = send
+        self.bucket = TokenBucket(rate)
+        self.poll_interval = poll_interval
+        self.stats = ThroughputStats()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def run_once(self, limit=10):
+        """處理一輪到期的批次，回傳處理的批次數"""
+        batches = self.queue.claim(limit)
+        for batch_id, recipients, messages, retry_key, attempts in batches:
+            self.bucket.acquire()
+            try:
+                self.send(recipients, messages, retry_key)
+            except AlreadyAccepted:
+                logger.info(f"批次 {batch_id} 先前已送出")
+            except DeliveryError as e:
+                if self.queue.mark_failed(batch_id, attempts, e):
+                    self.stats.record('batches_retried')
+                    logger.warning(f"批次 {batch_id} 第 {attempts} 次送出失敗，稍後重試：{str(e)}")
+                else:
+                    self.stats.record('batches_failed')
+                    logger.error(f"批次 {batch_id} 送出失敗：{str(e)}")
+                continue
+            self.queue.mark_sent(batch_id)
+            self.stats.record('batches_sent', len(recipients))
+        return len(batches)
+
+    def notify(self):
+        """有新工作時喚醒背景執行緒"""
+        self._wake.set()
+
+    def drain(self, timeout=None):
+        """處理到佇列中沒有到期的批次為止"""
+        end = None if timeout is None else time.monotonic() + timeout
+        while self.run_once():
+            if end is not None and time.monotonic() >= end:
+                break
+
+    def start(self):
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    if self.run_once():
+                        continue
+                except Exception as e:
+                    logger.error(f"推播佇列處理錯誤：{str(e)}")
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+        thread = threading.Thread(target=loop, name='delivery-worker', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def metrics(self):
+        return dict(self.stats.snapshot(), queue=self.queue.counts())
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_delivery_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = DeliveryQueue()
+    return _queue
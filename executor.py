@@ -0,0 +1,218 @@
+import contextvars
+import os
+import threading
+import time
+import weakref
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(Exception):
+    """超過期限或已被取消"""
+
+
+class Rejected(Exception):
+    """執行緒池與佇列都已滿"""
+
+
+class Deadline:
+    """請求的期限，也是協作式取消的信號：工作在各個檢查點呼叫 check()"""
+
+    def __init__(self, seconds):
+        self.expires = time.monotonic() + seconds
+        self._cancelled = threading.Event()
+
+    def remaining(self):
+        return max(self.expires - time.monotonic(), 0.0)
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def expired(self):
+        return self.cancelled or self.remaining() <= 0
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def check(self):
+        if self.cancelled:
+            raise DeadlineExceeded("工作已被取消")
+        if self.remaining() <= 0:
+            raise DeadlineExceeded("已超過期限")
+
+    def wait(self, seconds):
+        """等待 seconds 秒（不超過期限），被取消時立即返回"""
+        self._cancelled.wait(min(seconds, self.remaining()))
+        self.check()
+
+
+_current_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+def current_deadline():
+    return _current_deadline.get()
+
+
+def check_deadline():
+    """檢查目前的期限，已逾時或被取消時拋出 DeadlineExceeded"""
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.check()
+
+
+def remaining_timeout(default):
+    """HTTP 請求用的逾時秒數：不超過 default，也不超過目前期限的剩餘時間"""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return default
+    deadline.check()
+    return max(min(default, deadline.remaining()), 0.001)
+
+
+@contextmanager
+def deadline_scope(seconds):
+    """在此範圍內設定期限；已有較早的期限時沿用較早者"""
+    outer = _current_deadline.get()
+    if outer is not None and outer.remaining() <= seconds:
+        yield outer
+        return
+    deadline = Deadline(seconds)
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+class BoundedExecutor:
+    """有上限的共用執行緒池：佇列滿時拒絕，工作帶著期限執行，逾時的工作會收到取消通知"""
+
+    def __init__(self, name, max_workers, max_queue):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._start()
+        _executors.add(self)
+
+    def _start(self):
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._metrics = {
+            'submitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0,
+            'timed_out': 0, 'cancelled_in_queue': 0,
+            'active': 0, 'abandoned': 0, 'abandoned_total': 0,
+        }
+
+    def _count(self, key, delta=1):
+        with self._lock:
+            self._metrics[key] += delta
+
+    def submit(self, fn, *args, deadline=None, **kwargs):
+        """送出工作並回傳 Future；佇列已滿時拋出 Rejected"""
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise Rejected(f"{self.name} 執行緒池已滿")
+        self._count('submitted')
+        ctx = contextvars.copy_context()
+        state = {'abandoned': False, 'finished': False}
+
+        def run():
+            self._count('active')
+            try:
+                if deadline is not None:
+                    # 排隊期間已逾時的工作直接略過
+                    deadline.check()
+                    ctx.run(_current_deadline.set, deadline)
+                return ctx.run(fn, *args, **kwargs)
+            finally:
+                # future 要等 run() 返回後才標記完成，以 finished 與 _abandon 在同一把鎖下判斷
+                with self._lock:
+                    state['finished'] = True
+                    self._metrics['active'] -= 1
+                    if state['abandoned']:
+                        self._metrics['abandoned'] -= 1
+
+        def done(future):
+            self._slots.release()
+            if future.cancelled():
+                self._count('cancelled_in_queue')
+            elif future.exception() is not None:
+                self._count('failed')
+            else:
+                self._count('completed')
+
+        future = self._pool.submit(run)
+        future.add_done_callback(done)
+        future.deadline = deadline
+        future.abandon = lambda: self._abandon(future, state)
+        return future
+
+    def _abandon(self, future, state):
+        """呼叫端不再等待：通知工作取消，仍在執行的計入 abandoned"""
+        if future.deadline is not None:
+            future.deadline.cancel()
+        if future.cancel():
+            return
+        with self._lock:
+            if not state['finished'] and not state['abandoned']:
+                state['abandoned'] = True
+                self._metrics['abandoned'] += 1
+                self._metrics['abandoned_total'] += 1
+
+    def call(self, fn, *args, timeout, **kwargs):
+        """在執行緒池中執行並等待結果，超過 timeout 秒拋出 DeadlineExceeded"""
+        outer = _current_deadline.get()
+        if outer is not None:
+            timeout = min(timeout, outer.remaining())
+        deadline = Deadline(timeout)
+        future = self.submit(fn, *args, deadline=deadline, **kwargs)
+        try:
+            return future.result(timeout=deadline.remaining())
+        except FutureTimeout:
+            self._count('timed_out')
+            future.abandon()
+            raise DeadlineExceeded(f"{getattr(fn, '__name__', fn)} 超過 {timeout:.1f} 秒")
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics.update(max_workers=self.max_workers, max_queue=self.max_queue)
+        return metrics
+
+
+_executors = weakref.WeakSet()
+
+
+def _restart_after_fork():
+    """fork 出的子行程（例如 gunicorn 的 worker）沒有父行程的執行緒，繼承的執行緒池送出的工作永遠不會執行；
+    換成新的執行緒池、名額與計數"""
+    for executor in list(_executors):
+        executor._start()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+# 處理請求時的逾時呼叫，以及對上游的 HTTP 請求各用一個池，避免互相等待而卡死
+request_executor = BoundedExecutor(
+    'request',
+    int(os.getenv('REQUEST_EXECUTOR_WORKERS', '8')),
+    int(os.getenv('REQUEST_EXECUTOR_QUEUE', '32'))
+)
+upstream_executor = BoundedExecutor(
+    'upstream',
+    int(os.getenv('UPSTREAM_EXECUTOR_WORKERS', '8')),
+    int(os.getenv('UPSTREAM_EXECUTOR_QUEUE', '32'))
+)
+
+
+def executor_metrics():
+    return {
+        executor.name: executor.metrics()
+        for executor in (request_executor, upstream_executor)
+    }
@@ -0,0 +1,115 @@
+"""開獎資料匯出：依期號或日期區間逐筆輸出 JSON Lines / CSV，可即時 gzip 壓縮"""
+import csv
+import io
+import json
+import re
+import zlib
+from bisect import bisect_left, bisect_right
+
+from storage import record_timestamp
+
+FORMATS = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+CSV_HEADER = ['期號', '日期', '時間', '是否前一天'] + [f'號碼{i}' for i in range(1, 21)] + ['超級獎號']
+# 累積到這個大小才送出一個區塊
+CHUNK_SIZE = 64 * 1024
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+def parse_range(args):
+    """解析查詢參數 start/end（期號）與 from/to（YYYY-MM-DD），格式錯誤時拋出 ValueError"""
+    start = args.get('start')
+    end = args.get('end')
+    date_from = args.get('from')
+    date_to = args.get('to')
+    for value in (start, end):
+        if value is not None and not value.isdigit():
+            raise ValueError("期號必須是數字")
+    for value in (date_from, date_to):
+        if value is not None and not DATE_PATTERN.match(value):
+            raise ValueError("日期格式必須是 YYYY-MM-DD")
+    if start and end and int(start) > int(end):
+        raise ValueError("起始期號不可大於結束期號")
+    if date_from and date_to and date_from > date_to:
+        raise ValueError("起始日期不可晚於結束日期")
+    return {
+        'start_period': int(start) if start else None,
+        'end_period': int(end) if end else None,
+        'start_ts': f"{date_from} 00:00" if date_from else None,
+        'end_ts': f"{date_to} 23:59" if date_to else None,
+    }
+
+
+def select_range(records, start_period=None, end_period=None, start_ts=None, end_ts=None):
+    """從依開獎先後排列的序列（list 或 SharedRecords）以二分搜尋取出區間，逐筆產生"""
+    lo, hi = 0, len(records)
+    period = lambda r: int(r['期號'])
+    if start_period is not None:
+        lo = max(lo, bisect_left(records, start_period, key=period))
+    if end_period is not None:
+        hi = min(hi, bisect_right(records, end_period, key=period))
+    if start_ts is not None:
+        lo = max(lo, bisect_left(records, start_ts, key=record_timestamp))
+    if end_ts is not None:
+        hi = min(hi, bisect_right(records, end_ts, key=record_timestamp))
+    for i in range(lo, hi):
+        yield records[i]
+
+
+def _batched(lines):
+    """把小字串累積成約 CHUNK_SIZE 的區塊"""
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def iter_jsonl(records):
+    return _batched(json.dumps(r, ensure_ascii=False) + '\n' for r in records)
+
+
+def iter_csv(records):
+    def lines():
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(CSV_HEADER)
+        for r in records:
+            writer.writerow(
+                [r['期號'], r.get('日期', ''), r.get('時間', ''), int(bool(r.get('是否前一天', False)))]
+                + list(r['開獎號碼']) + [r['超級獎號']]
+            )
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+
+    return _batched(lines())
+
+
+def gzip_stream(chunks, level=6):
+    """即時 gzip 壓縮，每個輸入區塊都 flush，讓用戶端可以邊收邊解壓"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def make_etag(latest_period, fmt, query, gzipped):
+    """ETag 由最新期號與查詢條件組成：有新開獎時才會改變"""
+    key = zlib.crc32(json.dumps([fmt, sorted(query.items())]).encode())
+    return f"{latest_period}-{key:08x}" + ('-gz' if gzipped else '')
+
+
+def stream(records, fmt, gzipped=False):
+    chunks = iter_jsonl(records) if fmt == 'jsonl' else iter_csv(records)
+    return gzip_stream(chunks) if gzipped else chunks
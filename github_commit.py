@@ -0,0 +1,173 @@
+"""以 GitHub Git Data API 提交檔案：只讀取 ref、commit 與 tree 的中繼資料，不下載要取代的檔案內容"""
+import base64
+import hashlib
+import os
+import logging
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# GITHUB_API_URL 可指向本機替身伺服器（測試用），GitHub Actions 也會自動設定
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', 'https://api.github.com')
+GITHUB_BRANCH = os.getenv('GITHUB_BRANCH', 'main')
+GITHUB_API_TIMEOUT = float(os.getenv('GITHUB_API_TIMEOUT', '30'))
+
+
+class GitHubError(Exception):
+    """GitHub API 回傳錯誤"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def blob_sha(content):
+    """與 git 相同的 blob SHA，用來判斷檔案內容是否改變"""
+    if isinstance(content, FileContent):
+        return content.blob_sha()
+    return hashlib.sha1(b'blob %d\0' % len(content) + content).hexdigest()
+
+
+class FileContent:
+    """以本機檔案作為提交內容；計算 SHA 與上傳時都逐塊讀取，不把整個檔案放進記憶體"""
+
+    # 3 的倍數，各塊分別以 base64 編碼後可直接串接
+    CHUNK_SIZE = 3 * 64 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+
+    def chunks(self):
+        with open(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(self.CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    def blob_sha(self):
+        digest = hashlib.sha1(b'blob %d\0' % self.size)
+        for chunk in self.chunks():
+            digest.update(chunk)
+        return digest.hexdigest()
+
+
+class _BlobUploadBody:
+    """POST git/blobs 的 JSON 本文：逐塊讀檔並以 base64 編碼，長度事先算好（不用 chunked 傳輸）"""
+
+    def __init__(self, content):
+        self._prefix = b'{"encoding": "base64", "content": "'
+        self._suffix = b'"}'
+        self._length = len(self._prefix) + 4 * ((content.size + 2) // 3) + len(self._suffix)
+        self._parts = self._iter_parts(content)
+        self._pending = b''
+        self._offset = 0
+
+    def _iter_parts(self, content):
+        yield self._prefix
+        for chunk in content.chunks():
+            yield base64.b64encode(chunk)
+        yield self._suffix
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        # http.client 每次只讀一小段，以位移取出，不重複複製整個區塊
+        if size is None or size < 0:
+            data = self._pending[self._offset:] + b''.join(self._parts)
+            self._pending, self._offset = b'', 0
+            return data
+        while self._offset >= len(self._pending):
+            self._pending, self._offset = next(self._parts, b''), 0
+            if not self._pending:
+                return b''
+        data = self._pending[self._offset:self._offset + size]
+        self._offset += len(data)
+        return data
+
+
+class GitHubCommitter:
+    """把多個檔案寫成同一個 commit；內容與現有 blob 相同的檔案不上傳，全部相同時不提交"""
+
+    def __init__(self, repo, token, branch=GITHUB_BRANCH, api_url=GITHUB_API_URL, timeout=GITHUB_API_TIMEOUT):
+        self.repo = repo
+        self.branch = branch
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'Bearer {token}',
+            'Accept': 'application/vnd.github+json',
+            'X-GitHub-Api-Version': '2022-11-28',
+        })
+
+    def _request(self, method, path, payload=None, data=None):
+        url = f"{self.api_url}/repos/{self.repo}/{path}"
+        headers = {'Content-Type': 'application/json'} if data is not None else None
+        response = self.session.request(method, url, json=payload, data=data, headers=headers, timeout=self.timeout)
+        if response.status_code >= 400:
+            raise GitHubError(f"{method} {path} 失敗：HTTP {response.status_code} {response.text[:200]}",
+                              response.status_code)
+        return response.json()
+
+    def head(self):
+        """回傳分支目前的 (commit SHA, tree SHA)"""
+        ref = self._request('GET', f"git/ref/heads/{self.branch}")
+        commit_sha = ref['object']['sha']
+        commit = self._request('GET', f"git/commits/{commit_sha}")
+        return commit_sha, commit['tree']['sha']
+
+    def _tree(self, tree_sha, directory):
+        """逐層取得目錄的 tree（非遞迴），回傳 {檔名: blob SHA}，目錄不存在時回傳空字典"""
+        for part in filter(None, directory.split('/')):
+            entries = self._request('GET', f"git/trees/{tree_sha}")['tree']
+            tree_sha = next((e['sha'] for e in entries if e['path'] == part and e['type'] == 'tree'), None)
+            if tree_sha is None:
+                return {}
+        entries = self._request('GET', f"git/trees/{tree_sha}")['tree']
+        return {e['path']: e['sha'] for e in entries if e['type'] == 'blob'}
+
+    def changed_files(self, files, tree_sha):
+        """找出內容與現有 blob 不同的檔案"""
+        trees = {}
+        changed = {}
+        for path, content in files.items():
+            directory, _, name = path.rpartition('/')
+            if directory not in trees:
+                trees[directory] = self._tree(tree_sha, directory)
+            if trees[directory].get(name) != blob_sha(content):
+                changed[path] = content
+        return changed
+
+    def commit_files(self, files, message):
+        """files 為 {路徑: bytes、str 或 FileContent}，回傳新的 commit SHA；沒有檔案改變時回傳 None"""
+        files = {path: content.encode('utf-8') if isinstance(content, str) else content
+                 for path, content in files.items()}
+        head_sha, tree_sha = self.head()
+        changed = self.changed_files(files, tree_sha)
+        if not changed:
+            logger.info("檔案內容沒有改變，略過提交")
+            return None
+
+        entries = []
+        for path, content in changed.items():
+            if isinstance(content, FileContent):
+                blob = self._request('POST', 'git/blobs', data=_BlobUploadBody(content))
+            else:
+                try:
+                    payload = {'content': content.decode('utf-8'), 'encoding': 'utf-8'}
+                except UnicodeDecodeError:
+                    payload = {'content': base64.b64encode(content).decode('ascii'), 'encoding': 'base64'}
+                blob = self._request('POST', 'git/blobs', payload)
+            entries.append({'path': path, 'mode': '100644', 'type': 'blob', 'sha': blob['sha']})
+        tree = self._request('POST', 'git/trees', {'base_tree': tree_sha, 'tree': entries})
+        commit = self._request('POST', 'git/commits', {
+            'message': message, 'tree': tree['sha'], 'parents': [head_sha]
+        })
+        # 不強制更新：期間分支有其他提交時會失敗，避免覆蓋
+        self._request('PATCH', f"git/refs/heads/{self.branch}", {'sha': commit['sha'], 'force': False})
+        logger.info(f"已提交 {len(changed)} 個檔案：{commit['sha'][:7]}")
+        return commit['sha']
@@ -0,0 +1,60 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+_publisher = None
+
+
+def on_starting(server):
+    """在 master 行程載入歷史資料並發布到共享記憶體，worker 只需附加"""
+    global _publisher
+    _bootstrap_tiered()
+    name = os.getenv('BINGO_SHM_NAME')
+    if not name:
+        return
+    from scraper import scrape_bingo
+    from shared_history import SharedHistoryPublisher
+
+    _publisher = SharedHistoryPublisher(name)
+    _publisher.refresh(scrape_bingo)
+
+
+def _bootstrap_tiered():
+    """分層儲存還沒有資料時，在開始接受請求前下載全部歷史；失敗時由 worker 在背景重試"""
+    directory = os.getenv('BINGO_TIERED_DIR')
+    if not directory:
+        return
+    from scraper import stream_history
+    from tiered_store import TieredStore
+
+    # 另開一個實例並在完成後關閉，worker 不會繼承這個檔案（共用 fd 會共用檔案鎖）
+    store = TieredStore(directory)
+    try:
+        store.sync(stream_history, min_interval=0)
+        logger.info(f"分層儲存共有 {len(store)} 期")
+    finally:
+        store.close()
+
+
+def when_ready(server):
+    # 定期檢查新期號並切換世代
+    if _publisher is not None:
+        from scraper import scrape_bingo
+        from shared_cache import get_shared_cache
+        _publisher.start(scrape_bingo)
+        # 有共用快取時，其他實例抓到新期號就立即發布，不必等下一次檢查
+        cache = get_shared_cache()
+        if cache is not None:
+            cache.add_listener(lambda records: _publisher.refresh(lambda: records))
+
+
+def post_worker_init(worker):
+    # 推播送出與訂閱比對只需要一份，由取得檔案鎖的 worker 啟動
+    import line_bot
+    line_bot.start_background_tasks()
+
+
+def on_exit(server):
+    if _publisher is not None:
+        _publisher.close()
@@ -0,0 +1,181 @@
+"""bingo_history.json 的串流讀寫：逐筆解析、合併與寫出，記憶體用量與歷史長度無關
+
+檔案格式與 json.dumps(data, ensure_ascii=False, indent=2) 相同：
+{"last_updated": "...", "records": [期號由大到小的開獎資料]}
+"""
+import codecs
+import json
+
+CHUNK_SIZE = 64 * 1024
+EMPTY_HISTORY = b'{"last_updated": "", "records": []}'
+
+_decoder = json.JSONDecoder()
+_encoder = json.JSONEncoder(ensure_ascii=False, indent=2)
+_WHITESPACE = ' \t\n\r'
+
+
+def file_chunks(path, chunk_size=CHUNK_SIZE):
+    """逐塊讀取檔案"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+class HistoryReader:
+    """由 bytes 區塊逐筆解析開獎歷史；records() 依檔案順序產生每一筆，
+    讀到 last_updated 後即可從屬性取得（本專案寫出的檔案中它在 records 之前）"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self.last_updated = None
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(file_chunks(path))
+
+    def _fill(self):
+        """讀入下一個區塊，已解析的部分同時丟掉；沒有更多資料時回傳 False"""
+        if self._eof:
+            return False
+        self._buf = self._buf[self._pos:]
+        self._pos = 0
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            self._buf += self._text.decode(b'', final=True)
+            return False
+        self._buf += self._text.decode(chunk)
+        return True
+
+    def _peek(self):
+        """略過空白，回傳下一個字元，結尾時回傳空字串"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def _next_char(self, expected):
+        char = self._peek()
+        if char not in expected:
+            raise ValueError(f"歷史資料格式錯誤：預期 {' 或 '.join(expected)}，實際為 {char or '檔案結尾'!r}")
+        self._pos += 1
+        return char
+
+    def _value(self):
+        """解析下一個完整的 JSON 值，區塊不足時再讀入"""
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as e:
+                if self._eof:
+                    raise ValueError(f"歷史資料格式錯誤：{str(e)}") from e
+            else:
+                # 數字可能剛好被區塊截斷，後面還有字元才確定完整
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            self._fill()
+
+    def _array(self):
+        self._next_char('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._next_char(',]') == ']':
+                return
+
+    def records(self):
+        """依檔案順序產生每一筆開獎資料"""
+        self._next_char('{')
+        if self._peek() == '}':
+            return
+        while True:
+            key = self._value()
+            self._next_char(':')
+            if key == 'records':
+                yield from self._array()
+            else:
+                value = self._value()
+                if key == 'last_updated':
+                    self.last_updated = value
+            if self._next_char(',}') == '}':
+                return
+
+
+def iter_records(chunks):
+    """由 bytes 區塊逐筆產生開獎資料"""
+    return HistoryReader(chunks).records()
+
+
+class HistoryWriter:
+    """逐筆寫出，結果與 json.dumps(data, ensure_ascii=False, indent=2) 相同"""
+
+    def __init__(self, f, last_updated):
+        self.f = f
+        self.count = 0
+        f.write('{\n  "last_updated": ' + json.dumps(last_updated, ensure_ascii=False) + ',\n  "records": [')
+
+    def write(self, record):
+        text = _encoder.encode(record)
+        self.f.write(('\n    ' if self.count == 0 else ',\n    ') + text.replace('\n', '\n    '))
+        self.count += 1
+
+    def close(self):
+        self.f.write('\n  ]\n}' if self.count else ']\n}')
+
+
+def merge_records(existing, new_records, added=None):
+    """合併期號由大到小的現有資料與新資料，同一期保留先出現的那筆
+
+    existing 逐筆讀取，只有 new_records（通常是一天內的資料）放在記憶體中。
+    新加入的期號會附加到 added。
+    """
+    pending = {}
+    for record in new_records:
+        pending.setdefault(int(record['期號']), record)
+    queue = sorted(pending.items(), reverse=True)
+    i = 0
+    previous = None
+    for record in existing:
+        period = int(record['期號'])
+        if previous is not None:
+            if period == previous:
+                continue
+            if period > previous:
+                raise ValueError(f"現有歷史資料未依期號由大到小排列：{previous} 之後為 {period}")
+        previous = period
+        while i < len(queue) and queue[i][0] > period:
+            if added is not None:
+                added.append(queue[i][1]['期號'])
+            yield queue[i][1]
+            i += 1
+        if i < len(queue) and queue[i][0] == period:
+            i += 1
+        yield record
+    for _, record in queue[i:]:
+        if added is not None:
+            added.append(record['期號'])
+        yield record
+
+
+def write_history(path, records, last_updated):
+    """把 records 逐筆寫到 path，回傳筆數"""
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        writer = HistoryWriter(f, last_updated)
+        for record in records:
+            writer.write(record)
+        writer.close()
+    return writer.count
@@ -1,4 +1,4 @@
-from flask import Flask, request, abort, jsonify
+from flask import Flask, request, abort, jsonify, Response
 from linebot.v3 import (
     WebhookHandler
 )
@@ -10,12 +10,16 @@ from linebot.v3.messaging import (
     TextMessage
 )
 from linebot.v3.exceptions import InvalidSignatureError
-from linebot.v3.webhooks import MessageEvent, TextMessageContent
+from linebot.v3.webhooks import MessageEvent, TextMessageContent, FollowEvent, UnfollowEvent
 from datetime import datetime, timedelta
 import random
 from collections import Counter
-import threading
 from functools import wraps
+from itertools import islice
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import fcntl
+import threading
+import uuid
 import time
 import os
 import logging
@@ -29,7 +33,9 @@ LINE_CHANNEL_ACCESS_TOKEN = os.getenv('LINE_CHANNEL_ACCESS_TOKEN', 'k0LFxb148FVT
 LINE_CHANNEL_SECRET = os.getenv('LINE_CHANNEL_SECRET', 'd287b4093d6679fc40b0ab8d01e5cda7')
 
 # 初始化 LINE Bot API
-configuration = Configuration(access_token=LINE_CHANNEL_ACCESS_TOKEN)
+# LINE_API_HOST 可指向本機替身伺服器（壓測用）
+LINE_API_HOST = os.getenv('LINE_API_HOST', 'https://api.line.me')
+configuration = Configuration(access_token=LINE_CHANNEL_ACCESS_TOKEN, host=LINE_API_HOST)
 handler = WebhookHandler(LINE_CHANNEL_SECRET)
 
 # 驗證令牌是否有效
@@ -47,30 +53,74 @@ except Exception as e:
     app.logger.error(f"使用的 secret: {LINE_CHANNEL_SECRET}")
 
 # 導入原本的賓果分析功能
-from scraper import scrape_bingo, get_best_combination, scrape_bingo_history
+from scraper import scrape_bingo, scrape_latest, stream_history, get_best_combination, scrape_bingo_history, source_stats
+from storage import get_store
+from tiered_store import get_tiered_store
+from executor import DeadlineExceeded, Rejected, deadline_scope, executor_metrics, request_executor
+from number_index import index_for
+from shared_history import get_shared_history, memory_usage
+import export
+from subscriptions import TicketWatcher, get_subscription_store, parse_subscription
+from dedup import create_deduplicator
+from shared_cache import get_shared_cache
+from analytics import get_analytics, pack_history
+from stats_cube import StatsCube, parse_query
+from profiler import get_profiler, section
+from delivery import DeliveryWorker, LineMulticastSender, get_delivery_queue
+from messages import (
+    LONG_SEPARATOR, format_draws, format_history, format_matches, format_recommendations,
+    format_tickets, format_win_notification, format_announcement, build_matches_reply,
+    format_odds_summary, format_odds_detail, format_number_analysis, format_frequency_report,
+    format_slot_report
+)
+
+# 每個 webhook 請求的處理期限（秒），期限會傳遞到對上游的 HTTP 請求
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', '25'))
+# 檢查新開獎並比對訂閱的間隔（秒），0 表示停用
+TICKET_WATCH_INTERVAL = float(os.getenv('TICKET_WATCH_INTERVAL', '60'))
+# 是否把每期開獎推播給所有追蹤者（會用掉 LINE 的推播額度）
+DRAW_ANNOUNCE = os.getenv('DRAW_ANNOUNCE', 'false').lower() == 'true'
+# 推播佇列的背景送出執行緒
+DELIVERY_WORKER = os.getenv('DELIVERY_WORKER', 'true').lower() == 'true'
+# 背景執行緒只由取得這個檔案鎖的 worker 啟動（gunicorn 的 post_worker_init 或直接執行時）
+BACKGROUND_LOCK_PATH = os.getenv('BACKGROUND_LOCK_PATH', os.path.join('data', 'background.lock'))
+# 分析在這個秒數內完成就直接回覆，否則先回覆計算中，完成後再推播
+ANALYTICS_REPLY_WAIT = float(os.getenv('ANALYTICS_REPLY_WAIT', '1'))
+# 星期與時段統計每次補上新期數時讀取的最新期數（約一天），落後更多時由全部歷史重建
+STATS_CUBE_CATCH_UP = int(os.getenv('STATS_CUBE_CATCH_UP', '203'))
+
+# LINE 在 webhook 回應太慢時會重送事件，以 webhookEventId 去重
+deduplicator = create_deduplicator()
+# 管理員指令或 X-Profile 標頭啟動後才分析請求
+profiler = get_profiler()
+
+_delivery_worker = None
+_delivery_worker_lock = threading.Lock()
+
+def get_delivery_worker():
+    """推播佇列的送出者；用到時才建立佇列的 SQLite 檔案"""
+    global _delivery_worker
+    if _delivery_worker is None:
+        with _delivery_worker_lock:
+            if _delivery_worker is None:
+                _delivery_worker = DeliveryWorker(get_delivery_queue(), LineMulticastSender(configuration))
+    return _delivery_worker
 
 # 添加超時裝飾器
 def timeout(seconds):
+    """在共用執行緒池中執行，超過 seconds 秒回傳 None；逾時的工作會收到取消通知"""
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            result = [None]
-            def worker():
-                try:
-                    result[0] = func(*args, **kwargs)
-                except Exception as e:
-                    print(f"Error in worker: {e}")
-                    result[0] = None
-            
-            thread = threading.Thread(target=worker)
-            thread.daemon = True
-            thread.start()
-            thread.join(seconds)
-            
-            if thread.is_alive():
+            try:
+                return request_executor.call(func, *args, timeout=seconds, **kwargs)
+            except DeadlineExceeded:
                 print("Function call timed out")
-                return None
-            return result[0]
+            except Rejected:
+                print("Function call rejected: executor is full")
+            except Exception as e:
+                print(f"Error in worker: {e}")
+            return None
         return wrapper
     return decorator
 
@@ -94,7 +144,8 @@ def webhook():
     app.logger.info(f"Signature: {signature}")
     
     try:
-        handler.handle(body, signature)
+        with profiler.requested(request.headers.get('X-Profile')):
+            handler.handle(body, signature)
         app.logger.info("webhook 處理成功")
     except InvalidSignatureError:
         app.logger.error("Invalid signature")
@@ -110,22 +161,89 @@ def webhook():
 def hello():
     return 'Hello, World!'
 
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    """執行緒池與上游來源的統計"""
+    cache = get_shared_cache()
+    tiered = get_tiered_store()
+    return jsonify({
+        'executors': executor_metrics(),
+        'sources': source_stats(),
+        'delivery': get_delivery_worker().metrics(),
+        'dedup': deduplicator.metrics(),
+        'shared_cache': cache.metrics() if cache is not None else None,
+        'tiered': tiered.metrics() if tiered is not None else None,
+        'analytics': get_analytics().metrics(),
+        'profiler': profiler.metrics()
+    }), 200
+
 @app.route("/health", methods=['GET'])
 def health_check():
     """健康檢查端點"""
     try:
         # 嘗試獲取最新數據，確認服務正常
-        data = scrape_bingo()
+        data = load_draws(1)
         if data:
             return jsonify({
                 'status': 'healthy',
-                'last_draw': data[0]['期號'] if data else None
+                'last_draw': data[0]['期號'] if data else None,
+                'memory': memory_usage(),
+                'sources': source_stats()
             }), 200
         return jsonify({'status': 'degraded'}), 200
     except Exception as e:
         app.logger.error(f"健康檢查失敗：{str(e)}")
         return jsonify({'status': 'unhealthy'}), 500
 
+def export_source():
+    """回傳 (最新期號, 依條件取出區間的函式)，資料來源順序與 load_draws 相同"""
+    shared = get_shared_history()
+    records = shared.refresh() if shared is not None else None
+    if records is not None:
+        latest = records.periods[-1] if len(records) else None
+        return latest, lambda **query: export.select_range(records, **query)
+    store = get_store()
+    if store is not None:
+        store.sync(stream_history)
+        return store.latest_period(), store.iter_records
+    tiered = tiered_draws()
+    if tiered is not None:
+        if not len(tiered):
+            return None, None
+        return tiered.latest_period, lambda **query: export.select_range(tiered, **query)
+    data = scrape_bingo()
+    if not data:
+        return None, None
+    chronological = data[::-1]
+    return data[0]['期號'], lambda **query: export.select_range(chronological, **query)
+
+@app.route("/export/draws.<fmt>", methods=['GET'])
+def export_draws(fmt):
+    """匯出開獎資料：/export/draws.jsonl 或 .csv，參數 start/end（期號）、from/to（YYYY-MM-DD）"""
+    if fmt not in export.FORMATS:
+        return jsonify({'error': f'不支援的格式：{fmt}'}), 404
+    try:
+        query = export.parse_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    latest, select = export_source()
+    if select is None:
+        return jsonify({'error': '無法獲取開獎資料'}), 503
+    gzipped = 'gzip' in request.accept_encodings
+    etag = export.make_etag(latest, fmt, query, gzipped)
+    headers = {'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+    else:
+        if gzipped:
+            headers['Content-Encoding'] = 'gzip'
+        # 沒有 Content-Length，以 chunked 傳輸逐塊送出
+        response = Response(
+            export.stream(select(**query), fmt, gzipped), content_type=export.FORMATS[fmt], headers=headers
+        )
+    response.set_etag(etag)
+    return response
+
 def send_line_message_with_retry(line_bot_api, reply_token, message, max_retries=3):
     """添加重試機制的訊息發送函數"""
     for attempt in range(max_retries):
@@ -153,10 +271,85 @@ def get_bingo_data():
         print(f"Error getting bingo data: {e}")
         return None
 
+def tiered_draws():
+    """設定 BINGO_TIERED_DIR 時回傳已與上游同步的分層儲存；還沒有資料時在背景下載，先回傳空的儲存"""
+    tiered = get_tiered_store()
+    if tiered is None:
+        return None
+    if len(tiered):
+        tiered.sync(stream_history)
+    else:
+        # 全部歷史無法在請求的期限內下載完，不在處理請求的執行緒進行
+        tiered.bootstrap(stream_history)
+    return tiered
+
+def load_draws(limit=None):
+    """取得開獎資料，依序使用共享記憶體、SQLite、分層儲存或上游資料"""
+    shared = get_shared_history()
+    if shared is not None:
+        return shared.latest(limit)
+    store = get_store()
+    if store is not None:
+        store.sync(stream_history)
+        return store.latest_records(limit)
+    tiered = tiered_draws()
+    if tiered is not None:
+        return tiered.latest(limit)
+    if limit:
+        # 只取最新幾期時，GitHub 太慢可以改用網站的今日資料
+        data = scrape_latest()
+        return data[:limit] if data else data
+    return scrape_bingo()
+
+def find_matching_draws(numbers, start_period=None, end_period=None, limit=None):
+    """找出匹配2個以上號碼或中超級獎號的開獎，回傳 (總筆數, 由新到舊的匹配 generator)
+
+    匹配記錄在取用時才產生，最多 limit 筆。
+    """
+    shared = get_shared_history()
+    store = get_store()
+    if shared is not None:
+        total, draws = shared.index().iter_matches(
+            numbers, min_matches=2, start_period=start_period, end_period=end_period
+        )
+    elif store is not None:
+        store.sync(stream_history)
+        # 同步失敗、資料庫還沒有資料時與上游失敗相同處理
+        if store.latest_period() is None:
+            return None
+        total, draws = store.iter_matches(numbers, start_period, end_period, min_matches=2)
+    elif get_tiered_store() is not None:
+        tiered = tiered_draws()
+        # 背景下載完成前與上游失敗相同處理
+        if not len(tiered):
+            return None
+        total, draws = tiered.iter_matches(
+            numbers, min_matches=2, start_period=start_period, end_period=end_period
+        )
+    else:
+        data = scrape_bingo()
+        if not data:
+            return None
+        total, draws = index_for(data).iter_matches(
+            numbers, min_matches=2, start_period=start_period, end_period=end_period
+        )
+    
+    def matches():
+        for draw in islice(draws, limit):
+            yield {
+                '期號': draw['期號'],
+                '時間': draw['時間'],
+                '匹配數字': set(numbers) & set(draw['開獎號碼']),
+                '超級獎號': draw['超級獎號'] in numbers
+            }
+    return total, matches()
+
+@section('send_reply')
 def send_reply(event, message):
-    """發送回覆訊息的輔助函數"""
+    """發送回覆訊息的輔助函數，message 可以是字串或最多5則的訊息列表"""
+    messages = [message] if isinstance(message, str) else list(message)
     app.logger.info(f"準備發送回覆，token: {event.reply_token}")
-    app.logger.info(f"消息內容: {message[:100]}...")
+    app.logger.info(f"消息內容（{len(messages)} 則）: {messages[0][:100]}...")
     
     try:
         with ApiClient(configuration) as api_client:
@@ -165,17 +358,206 @@ def send_reply(event, message):
             response = api_instance.reply_message(
                 ReplyMessageRequest(
                     reply_token=event.reply_token,
-                    messages=[TextMessage(text=message)]
+                    messages=[TextMessage(text=text) for text in messages]
                 )
             )
             app.logger.info(f"回覆發送成功：{response}")
     except Exception as e:
         app.logger.error(f"發送回覆時發生錯誤：{str(e)}")
         app.logger.error(f"回覆 token: {event.reply_token}")
-        app.logger.error(f"消息內容: {message[:100]}...")
+        app.logger.error(f"消息內容: {messages[0][:100]}...")
+
+def notify_winners(notifications):
+    """中獎通知排入推播佇列，同一位使用者同一期合併成一則"""
+    grouped = {}
+    for n in notifications:
+        grouped.setdefault((n['user_id'], n['period']), []).append(n)
+    queue = get_delivery_queue()
+    for (user_id, period), items in grouped.items():
+        queue.enqueue(f"win:{user_id}:{period}", format_win_notification(items), [user_id])
+    get_subscription_store().mark_sent(notifications)
+    get_delivery_worker().notify()
+
+def watch_draws():
+    """訂閱比對用的開獎資料；啟用 DRAW_ANNOUNCE 時順便把最新一期排入推播"""
+    data = load_draws(20)
+    if data and DRAW_ANNOUNCE:
+        if get_delivery_queue().enqueue(f"draw:{data[0]['期號']}", format_announcement(data[0])):
+            get_delivery_worker().notify()
+    return data
+
+def analysis_source():
+    """回傳 (最新期號, 打包全部歷史的函式)；結果已快取時不需要打包"""
+    shared = get_shared_history()
+    if shared is not None:
+        # 共享記憶體中已是打包好的記錄，直接複製
+        records = shared.records
+        return str(records.periods[-1]), records.packed
+    store = get_store()
+    if store is not None:
+        store.sync(stream_history)
+        latest = store.latest_records(1)
+        return (latest[0]['期號'] if latest else None), lambda: pack_history(store.iter_records())
+    tiered = tiered_draws()
+    if tiered is not None:
+        return (str(tiered.latest_period) if tiered.latest_period else None), tiered.packed
+    data = scrape_bingo()
+    return (data[0]['期號'] if data else None), lambda: pack_history(data)
+
+_stats_cube = None
+_stats_cube_rebuild = None
+_stats_cube_lock = threading.Lock()
+
+def stats_cube():
+    """星期與時段的號碼統計：先讀 data/ 下的統計檔，之後只補上新的期數
+
+    接不上時在分析行程池中由全部歷史重建，不佔用處理 webhook 的執行緒；重建完成前回傳目前的
+    統計（可能落後），沒有統計時回傳 None。
+    """
+    global _stats_cube
+    recent = load_draws(STATS_CUBE_CATCH_UP)
+    if not recent:
+        return _stats_cube
+    with _stats_cube_lock:
+        cube = _stats_cube or StatsCube.load()
+        if cube is not None:
+            _stats_cube = cube
+            if cube.catch_up(recent) is not None:
+                return cube
+    rebuild_stats_cube()
+    return _stats_cube
+
+def stats_cube_rebuilding():
+    rebuild = _stats_cube_rebuild
+    return rebuild is not None and not rebuild.done()
+
+def rebuild_stats_cube():
+    """在背景重建星期與時段統計，完成後換上；已在重建時不重複送出"""
+    global _stats_cube_rebuild
+    with _stats_cube_lock:
+        if stats_cube_rebuilding():
+            return
+        app.logger.info("由全部歷史重建星期與時段統計")
+        future = _stats_cube_rebuild = start_analysis('stats_cube', ())
+
+    def swap(future):
+        global _stats_cube
+        try:
+            data = future.result()
+        except Exception as e:
+            app.logger.error(f"重建星期與時段統計失敗：{str(e)}")
+            return
+        if data is None:
+            return
+        cube = StatsCube.from_bytes(data)
+        with _stats_cube_lock:
+            if _stats_cube is None or cube.latest_period >= _stats_cube.latest_period:
+                _stats_cube = cube
+
+    future.add_done_callback(swap)
+
+def start_analysis(analysis, params):
+    """在執行緒池中取得並打包歷史資料再送進行程池，回傳結果的 Future；沒有開獎資料時結果為 None"""
+    result = Future()
+
+    def forward(job):
+        try:
+            result.set_result(job.result())
+        except Exception as e:
+            result.set_exception(e)
+
+    def prepare():
+        try:
+            latest_period, load = analysis_source()
+            if latest_period is None:
+                result.set_result(None)
+                return
+            get_analytics().submit(analysis, params, latest_period, load).add_done_callback(forward)
+        except Exception as e:
+            result.set_exception(e)
+
+    request_executor.submit(prepare)
+    return result
+
+def analysis_message(future, formatter):
+    """已完成的分析 Future 轉成回覆文字"""
+    try:
+        data = future.result()
+    except Rejected:
+        return "目前分析的人數較多，請稍後再試"
+    except Exception as e:
+        app.logger.error(f"分析失敗：{str(e)}")
+        return "分析時發生錯誤，請稍後再試"
+    if data is None:
+        return "無法獲取開獎資料，請稍後再試"
+    return formatter(data)
+
+def handle_analysis(event, analysis, params, formatter):
+    """取得資料與分析都不在處理 webhook 的執行緒：很快完成就直接回覆，否則先回覆計算中，完成後推播結果"""
+    try:
+        future = start_analysis(analysis, params)
+    except Rejected:
+        send_reply(event, "目前分析的人數較多，請稍後再試")
+        return
+    try:
+        future.exception(timeout=ANALYTICS_REPLY_WAIT)
+        send_reply(event, analysis_message(future, formatter))
+        return
+    except FutureTimeout:
+        pass
+    send_reply(event, "⏳ 分析計算中，完成後會傳送結果給你")
+    user_id = event.source.user_id
+
+    def push_result(future):
+        message = analysis_message(future, formatter)
+        get_delivery_queue().enqueue(f"analysis:{uuid.uuid4().hex}", message, [user_id])
+        get_delivery_worker().notify()
+
+    future.add_done_callback(push_result)
+
+@handler.add(FollowEvent)
+@deduplicator.once
+def handle_follow(event):
+    app.logger.info(f"新追蹤者：{event.source.user_id}")
+    get_delivery_queue().follow(event.source.user_id)
+
+@handler.add(UnfollowEvent)
+@deduplicator.once
+def handle_unfollow(event):
+    app.logger.info(f"取消追蹤：{event.source.user_id}")
+    get_delivery_queue().unfollow(event.source.user_id)
+
+def handle_subscription(event, text):
+    """訂閱、取消訂閱與查看訂閱"""
+    store = get_subscription_store()
+    user_id = event.source.user_id
+    if text == "我的訂閱":
+        return format_tickets(store.user_tickets(user_id))
+    if text.startswith("取消訂閱"):
+        arg = text[len("取消訂閱"):].strip()
+        if arg and not arg.isdigit():
+            return "請輸入有效的訂閱編號！\n例如：取消訂閱 3"
+        count = store.cancel(user_id, int(arg) if arg else None)
+        return f"✅ 已取消 {count} 筆訂閱" if count else "❌ 找不到可取消的訂閱"
+    try:
+        numbers, span = parse_subscription(text)
+        ticket_id = store.add_ticket(user_id, numbers, span)
+    except ValueError as e:
+        return f"{str(e)}！\n例如：訂閱 11 22 33 十期"
+    return (
+        f"✅ 訂閱成功（編號 {ticket_id}）\n"
+        f"號碼：{', '.join(f'{n:02d}' for n in numbers)}（{len(numbers)}星）\n"
+        f"期數：從下一期起連續 {span} 期\n"
+        "💡 中獎時會主動通知，輸入「我的訂閱」查看"
+    )
 
 @handler.add(MessageEvent, message=TextMessageContent)
+@deduplicator.once
 def handle_message(event):
+    with profiler.profile('handle_message', event.message.text[:50]), deadline_scope(REQUEST_DEADLINE):
+        _handle_message(event)
+
+def _handle_message(event):
     text = event.message.text.strip()
     app.logger.info(f"收到訊息：{text}")
     app.logger.info(f"來自用戶：{event.source.user_id}")
@@ -184,7 +566,7 @@ def handle_message(event):
     try:
         if text == "1":
             app.logger.info("處理推薦號碼請求")
-            data = scrape_bingo()
+            data = load_draws(10)
             app.logger.info(f"獲取到 {len(data) if data else 0} 筆開獎資料")
             
             if data:
@@ -206,28 +588,7 @@ def handle_message(event):
                 app.logger.info(f"生成了 {len(recommended_numbers)} 組推薦號碼")
                 
                 if recommended_numbers:
-                    message = (
-                        "🎯 本期推薦組合\n"
-                        "==================\n"
-                    )
-                    
-                    for i, numbers in enumerate(recommended_numbers, 1):
-                        message += (
-                            f"組合 {i}：{', '.join(f'{n:02d}' for n in numbers)}\n"
-                            "==================\n"
-                        )
-                    
-                    message += (
-                        "\n💡 投注建議：\n"
-                        "- 三星玩法\n"
-                        "- 單注金額：25元\n"
-                        "- 建議投注4倍\n"
-                        "- 總投注金額：1000元\n"
-                        "\n"
-                        "⚠️ 提醒：\n"
-                        "- 購買時請說出三星四倍十期\n"
-                        "- 理性購買，投注有節\n"
-                    )
+                    message = format_recommendations(recommended_numbers)
                 else:
                     message = "生成推薦號碼時發生錯誤，請稍後再試"
             else:
@@ -237,20 +598,10 @@ def handle_message(event):
             
         elif text == "2":
             app.logger.info("處理查詢開獎記錄請求")
-            data = scrape_bingo()
+            data = load_draws(10)
             if data and len(data) > 0:
                 recent = data[:10]  # 只顯示最近10期
-                message = "📊 最近開獎記錄\n==================\n"
-                
-                for draw in recent:
-                    message += (
-                        f"期號：{draw['期號']}\n"
-                        f"時間：{draw['時間']}\n"
-                        f"號碼：{', '.join(f'{n:02d}' for n in draw['開獎號碼'])}\n"
-                        f"超級獎號：{draw['超級獎號']:02d}\n"
-                        "==================\n"
-                    )
-                message += f"\n💡 顯示最近10期開獎記錄"
+                message = format_draws("📊 最近開獎記錄", recent, "\n💡 顯示最近10期開獎記錄")
             else:
                 message = "無法獲取開獎記錄，請稍後再試"
             
@@ -264,7 +615,7 @@ def handle_message(event):
                 "\n"
                 "1. 輸入號碼查詢\n"
                 "格式：11 22 33\n"
-                "（直接輸入3個號碼，查詢最近10期）\n"
+                "（直接輸入3個號碼，查詢全部歷史）\n"
                 "\n"
                 "2. 輸入期號區間查詢\n"
                 "格式：起始-結束 號碼1 號碼2 號碼3\n"
@@ -314,28 +665,92 @@ def handle_message(event):
                 "\n"
                 "4️⃣ 輸入數字「4」\n"
                 "- 查看更多歷史記錄\n"
+                "\n"
+                "5️⃣ 輸入「訂閱 11 22 33 十期」\n"
+                "- 中獎時主動通知，「我的訂閱」查看\n"
+                "\n"
+                "6️⃣ 輸入「賠率」\n"
+                "- 各玩法的中獎機率與期望值\n"
+                "\n"
+                "7️⃣ 輸入「分析 11 22 33」或「頻率」\n"
+                "- 全部歷史回測與冷熱號碼\n"
+                "\n"
+                "8️⃣ 輸入「熱門 週四 19點」\n"
+                "- 指定星期與時段的冷熱號碼\n"
                 "============================\n"
                 "💡 請選擇功能編號！"
             )
             send_reply(event, message)
             
+        # 處理賠率查詢
+        elif text == "賠率" or text.startswith("賠率 "):
+            app.logger.info("處理賠率查詢")
+            arg = text[len("賠率"):].strip()
+            if not arg:
+                message = format_odds_summary()
+            elif arg.isdigit() and 1 <= int(arg) <= 10:
+                message = format_odds_detail(int(arg))
+            else:
+                message = "請輸入1到10的星數！\n例如：賠率 3"
+            send_reply(event, message)
+            
+        # 處理分析（在行程池中執行）
+        elif text.startswith("分析"):
+            app.logger.info("處理號碼回測請求")
+            try:
+                numbers = sorted(set(int(n) for n in text[len("分析"):].split()))
+            except ValueError:
+                numbers = []
+            if not 1 <= len(numbers) <= 10 or not all(1 <= n <= 80 for n in numbers):
+                send_reply(event, "請輸入1到10個1-80之間的號碼！\n例如：分析 11 22 33")
+            else:
+                handle_analysis(event, 'numbers', (tuple(numbers),), format_number_analysis)
+            
+        elif text == "頻率":
+            app.logger.info("處理冷熱號碼分析")
+            handle_analysis(event, 'frequency', (), format_frequency_report)
+            
+        elif text.startswith("效能分析") and profiler.is_admin(event.source.user_id):
+            arg = text[len("效能分析"):].strip()
+            if arg.isdigit():
+                samples = profiler.arm(int(arg))
+                send_reply(event, f"接下來 {samples} 個請求會記錄效能分析\n結果寫到 {profiler.directory}")
+            else:
+                metrics = profiler.metrics()
+                send_reply(event, (
+                    f"效能分析剩餘 {metrics['remaining']} 個請求，已記錄 {metrics['profiled']} 個\n"
+                    f"最新結果：{metrics['last_summary'] or '無'}\n"
+                    f"輸入「效能分析 5」分析接下來 5 個請求（最多 {profiler.max_samples} 個）"
+                ))
+            
+        elif text == "熱門" or text.startswith("熱門 "):
+            app.logger.info("處理星期與時段冷熱查詢")
+            try:
+                weekday, hour, slot = parse_query(text)
+            except ValueError as e:
+                send_reply(event, f"{str(e)}！\n例如：熱門 週四 19點、熱門 19:05")
+            else:
+                cube = stats_cube()
+                if cube is None:
+                    send_reply(event, "⏳ 統計資料整理中，請稍後再試" if stats_cube_rebuilding()
+                               else "無法獲取開獎資料，請稍後再試")
+                else:
+                    send_reply(event, format_slot_report(cube.query(weekday, hour, slot)))
+            
+        # 處理訂閱
+        elif text.startswith("訂閱") or text.startswith("取消訂閱") or text == "我的訂閱":
+            app.logger.info("處理訂閱請求")
+            send_reply(event, handle_subscription(event, text))
+            
         # 處理最近30期查詢
         elif text == "最近":
             app.logger.info("處理最近30期查詢")
-            data = scrape_bingo()
+            data = load_draws(30)
             if data:
                 recent = data[:30]  # 改為30期
-                message = "📊 最近30期開獎記錄\n============================\n"
-                
-                for draw in recent:
-                    message += (
-                        f"期號：{draw['期號']}\n"
-                        f"時間：{draw['時間']}\n"
-                        f"號碼：{', '.join(f'{n:02d}' for n in draw['開獎號碼'])}\n"
-                        f"超級獎號：{draw['超級獎號']:02d}\n"
-                        "============================\n"
-                    )
-                message += f"\n💡 顯示最近30期開獎記錄"
+                message = format_draws(
+                    "📊 最近30期開獎記錄", recent, "\n💡 顯示最近30期開獎記錄", LONG_SEPARATOR
+                )
             else:
                 message = "無法獲取開獎資料，請稍後再試"
             
@@ -360,38 +775,14 @@ def handle_message(event):
                         if not all(1 <= n <= 80 for n in numbers):
                             message = "號碼必須在1-80之間！"
                         else:
-                            data = scrape_bingo()
-                            if data:
-                                filtered_data = [
-                                    draw for draw in data 
-                                    if start_period <= int(draw['期號']) <= end_period
-                                ]
-                                
-                                matches = []
-                                for draw in filtered_data:
-                                    matched = set(numbers) & set(draw['開獎號碼'])
-                                    is_super = draw['超級獎號'] in numbers
-                                    
-                                    # 只顯示匹配2個以上的結果
-                                    if len(matched) >= 2 or is_super:
-                                        matches.append({
-                                            '期號': draw['期號'],
-                                            '時間': draw['時間'],
-                                            '匹配數字': matched,
-                                            '超級獎號': is_super
-                                        })
-                                
-                                if matches:
-                                    message = f"🎯 期號 {start_period} 到 {end_period} 查詢結果\n==================\n"
-                                    for match in matches:
-                                        message += (
-                                            f"期號：{match['期號']}\n"
-                                            f"時間：{match['時間']}\n"
-                                            f"匹配號碼：{', '.join(f'{n:02d}' for n in match['匹配數字'])}\n"
-                                            f"超級獎號：{'中' if match['超級獎號'] else '未中'}\n"
-                                            "==================\n"
-                                        )
-                                    message += f"\n💡 共找到 {len(matches)} 筆匹配記錄"
+                            result = find_matching_draws(numbers, start_period, end_period)
+                            if result is not None:
+                                total, matches = result
+                                if total:
+                                    message = build_matches_reply(
+                                        f"🎯 期號 {start_period} 到 {end_period} 查詢結果",
+                                        matches, f"\n💡 共找到 {total} 筆匹配記錄", total
+                                    )
                                 else:
                                     message = "❌ 在指定期號範圍內未找到匹配記錄"
                             else:
@@ -404,7 +795,7 @@ def handle_message(event):
             
             send_reply(event, message)
             
-        # 處理純數字查詢（最近10期）
+        # 處理純數字查詢（全部歷史，顯示最近10筆）
         elif text.replace(" ", "").isdigit():
             app.logger.info("處理號碼查詢請求")
             try:
@@ -414,37 +805,18 @@ def handle_message(event):
                 elif not all(1 <= n <= 80 for n in numbers):
                     message = "號碼必須在1-80之間！"
                 else:
-                    data = scrape_bingo()
-                    if data:
-                        recent_data = data[:10]  # 改為10期
-                        matches = []
-                        
-                        for draw in recent_data:
-                            matched = set(numbers) & set(draw['開獎號碼'])
-                            is_super = draw['超級獎號'] in numbers
-                            
-                            # 只顯示匹配2個以上的結果
-                            if len(matched) >= 2 or is_super:
-                                matches.append({
-                                    '期號': draw['期號'],
-                                    '時間': draw['時間'],
-                                    '匹配數字': matched,
-                                    '超級獎號': is_super
-                                })
-                        
+                    result = find_matching_draws(numbers, limit=10)
+                    if result is not None:
+                        total, matches = result
+                        matches = list(matches)
                         if matches:
-                            message = "🎯 查詢結果\n============================\n"
-                            for match in matches:
-                                message += (
-                                    f"期號：{match['期號']}\n"
-                                    f"時間：{match['時間']}\n"
-                                    f"匹配號碼：{', '.join(f'{n:02d}' for n in match['匹配數字'])}\n"
-                                    f"超級獎號：{'中' if match['超級獎號'] else '未中'}\n"
-                                    "============================\n"
-                                )
-                            message += f"\n💡 共找到 {len(matches)} 筆匹配記錄"
+                            message = format_matches(
+                                "🎯 查詢結果", matches, f"\n💡 共找到 {total} 筆匹配記錄", LONG_SEPARATOR
+                            )
+                            if total > len(matches):
+                                message += f"（顯示最近 {len(matches)} 筆）"
                         else:
-                            message = "❌ 在最近10期中未找到匹配記錄"
+                            message = "❌ 在歷史紀錄中未找到匹配記錄"
                     else:
                         message = "無法獲取開獎資料，請稍後再試"
             except ValueError:
@@ -455,7 +827,7 @@ def handle_message(event):
         # 處理歷史記錄查詢
         elif text == "歷史":
             app.logger.info("處理今日歷史記錄查詢")
-            data = scrape_bingo()
+            data = load_draws(20)
             if data:
                 # 限制顯示最近20期
                 recent = data[:20]
@@ -464,25 +836,10 @@ def handle_message(event):
                 start_period = recent[-1]['期號']  # 最早的期號
                 end_period = recent[0]['期號']    # 最新的期號
                 
-                message = (
-                    f"📊 今日 {start_period} 至 {end_period}\n"
-                    "============================\n"
+                message = format_history(
+                    f"📊 今日 {start_period} 至 {end_period}", recent,
+                    f"\n💡 顯示 {start_period} 至 {end_period}"
                 )
-                
-                for draw in recent:
-                    # 縮短顯示格式
-                    numbers_str = ', '.join(f'{n:02d}' for n in draw['開獎號碼'][:10])
-                    if len(draw['開獎號碼']) > 10:
-                        numbers_str += "..."
-                    
-                    message += (
-                        f"期號：{draw['期號']}\n"  # 顯示完整期號
-                        f"時間：{draw['時間']}\n"
-                        f"號碼：{numbers_str}\n"
-                        f"超級：{draw['超級獎號']:02d}\n"
-                        "----------------------------\n"
-                    )
-                message += f"\n💡 顯示 {start_period} 至 {end_period}"
             else:
                 message = "無法獲取開獎資料，請稍後再試"
             
@@ -497,7 +854,7 @@ def handle_message(event):
                 elif num > 50:
                     message = "最多只能查詢50期！"
                 else:
-                    data = scrape_bingo()
+                    data = load_draws(20)
                     if data:
                         # 限制最多顯示20期
                         num = min(num, 20)
@@ -507,25 +864,10 @@ def handle_message(event):
                         start_period = recent[-1]['期號']  # 最早的期號
                         end_period = recent[0]['期號']    # 最新的期號
                         
-                        message = (
-                            f"📊 期號 {start_period} 至 {end_period}\n"
-                            "============================\n"
+                        message = format_history(
+                            f"📊 期號 {start_period} 至 {end_period}", recent,
+                            f"\n💡 顯示 {start_period} 至 {end_period}"
                         )
-                        
-                        for draw in recent:
-                            # 縮短顯示格式
-                            numbers_str = ', '.join(f'{n:02d}' for n in draw['開獎號碼'][:10])
-                            if len(draw['開獎號碼']) > 10:
-                                numbers_str += "..."
-                            
-                            message += (
-                                f"期號：{draw['期號']}\n"  # 顯示完整期號
-                                f"時間：{draw['時間']}\n"
-                                f"號碼：{numbers_str}\n"
-                                f"超級：{draw['超級獎號']:02d}\n"
-                                "----------------------------\n"
-                            )
-                        message += f"\n💡 顯示 {start_period} 至 {end_period}"
                     else:
                         message = "無法獲取開獎資料，請稍後再試"
             except ValueError:
@@ -538,11 +880,48 @@ def handle_message(event):
             
     except Exception as e:
         app.logger.error(f"處理訊息時發生錯誤：{str(e)}")
-        app.logger.exception(e)
         message = "系統發生錯誤，請稍後再試"
         send_reply(event, message)
+        # 交給 deduplicator 移除記錄，LINE 重送時可以重試；webhook() 會記錄例外
+        raise
+
+_background_lock = None
+_background_start_lock = threading.Lock()
+
+def start_background_tasks():
+    """啟動推播送出與訂閱比對的背景執行緒；多個 worker 中只有取得檔案鎖的一個會啟動
+
+    匯入模組時不啟動，由 gunicorn.conf.py 的 post_worker_init 或直接執行時呼叫。
+    其他 worker 排入的推播由這個 worker 在下一次輪詢時送出。回傳是否已啟動。
+    """
+    global _background_lock
+    if not DELIVERY_WORKER and TICKET_WATCH_INTERVAL <= 0:
+        return False
+    with _background_start_lock:
+        if _background_lock is not None:
+            return True
+        directory = os.path.dirname(BACKGROUND_LOCK_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock = open(BACKGROUND_LOCK_PATH, 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return False
+        # 持有到行程結束；worker 中止後由 gunicorn 重新啟動的 worker 取得
+        _background_lock = lock
+    app.logger.info(f"背景執行緒由行程 {os.getpid()} 負責")
+    if DELIVERY_WORKER:
+        get_delivery_worker().start()
+    if TICKET_WATCH_INTERVAL > 0:
+        TicketWatcher(
+            get_subscription_store(), watch_draws, notify_winners, TICKET_WATCH_INTERVAL
+        ).start()
+    return True
 
 if __name__ == "__main__":
+    start_background_tasks()
     # 如果是在本地運行
     if os.environ.get('RENDER') != 'true':
         app.run(
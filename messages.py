@@ -0,0 +1,316 @@
+"""LINE 回覆訊息的格式化"""
+import odds_tables
+
+# 日期欄位與星期查詢使用的星期名稱，索引與 date.weekday() 相同
+WEEKDAYS = '一二三四五六日'
+
+SEPARATOR = "==================\n"
+LONG_SEPARATOR = "============================\n"
+DASH_SEPARATOR = "----------------------------\n"
+
+
+def format_numbers(numbers):
+    return ', '.join(f'{n:02d}' for n in numbers)
+
+
+def format_draw(draw, separator=SEPARATOR):
+    """完整格式：期號、時間、全部號碼與超級獎號"""
+    return (
+        f"期號：{draw['期號']}\n"
+        f"時間：{draw['時間']}\n"
+        f"號碼：{format_numbers(draw['開獎號碼'])}\n"
+        f"超級獎號：{draw['超級獎號']:02d}\n"
+        f"{separator}"
+    )
+
+
+def format_short_draw(draw):
+    """縮短格式：最多顯示10個號碼"""
+    numbers_str = format_numbers(draw['開獎號碼'][:10])
+    if len(draw['開獎號碼']) > 10:
+        numbers_str += "..."
+    return (
+        f"期號：{draw['期號']}\n"  # 顯示完整期號
+        f"時間：{draw['時間']}\n"
+        f"號碼：{numbers_str}\n"
+        f"超級：{draw['超級獎號']:02d}\n"
+        f"{DASH_SEPARATOR}"
+    )
+
+
+def format_match(match, separator=SEPARATOR):
+    return (
+        f"期號：{match['期號']}\n"
+        f"時間：{match['時間']}\n"
+        f"匹配號碼：{format_numbers(match['匹配數字'])}\n"
+        f"超級獎號：{'中' if match['超級獎號'] else '未中'}\n"
+        f"{separator}"
+    )
+
+
+def format_draws(title, draws, footer, separator=SEPARATOR):
+    """開獎記錄列表"""
+    return f"{title}\n{separator}" + ''.join(format_draw(d, separator) for d in draws) + footer
+
+
+def format_history(title, draws, footer):
+    """歷史記錄列表（縮短格式）"""
+    return f"{title}\n{LONG_SEPARATOR}" + ''.join(format_short_draw(d) for d in draws) + footer
+
+
+def format_matches(title, matches, footer, separator=SEPARATOR):
+    """號碼查詢結果列表"""
+    return f"{title}\n{separator}" + ''.join(format_match(m, separator) for m in matches) + footer
+
+
+def format_recommendations(recommended_numbers):
+    message = (
+        "🎯 本期推薦組合\n"
+        "==================\n"
+    )
+
+    for i, numbers in enumerate(recommended_numbers, 1):
+        message += (
+            f"組合 {i}：{format_numbers(numbers)}\n"
+            "==================\n"
+        )
+
+    message += (
+        "\n💡 投注建議：\n"
+        "- 三星玩法\n"
+        "- 單注金額：25元\n"
+        "- 建議投注4倍\n"
+        "- 總投注金額：1000元\n"
+        "\n"
+        "⚠️ 提醒：\n"
+        "- 購買時請說出三星四倍十期\n"
+        "- 理性購買，投注有節\n"
+    )
+    return message
+
+
+def format_tickets(tickets):
+    """使用者的訂閱列表，tickets 為 [(編號, 號碼, 剩餘期數)]"""
+    if not tickets:
+        return "目前沒有訂閱\n💡 輸入「訂閱 11 22 33 十期」開始訂閱"
+    message = f"📋 我的訂閱\n{SEPARATOR}"
+    for ticket_id, numbers, remaining in tickets:
+        message += (
+            f"編號：{ticket_id}\n"
+            f"號碼：{format_numbers(numbers)}（{len(numbers)}星）\n"
+            f"剩餘：{remaining}期\n"
+            f"{SEPARATOR}"
+        )
+    message += "\n💡 輸入「取消訂閱 編號」取消單筆，「取消訂閱」取消全部"
+    return message
+
+
+def format_win_notification(notifications):
+    """同一位使用者在同一期的中獎通知"""
+    draw = notifications[0]['draw']
+    message = f"🎉 訂閱號碼中獎通知\n{SEPARATOR}" + format_draw(draw)
+    for n in notifications:
+        matched = sorted(set(n['numbers']) & set(draw['開獎號碼']))
+        message += (
+            f"訂閱 {n['ticket_id']}：{format_numbers(n['numbers'])}\n"
+            f"中 {n['hits']} 個：{format_numbers(matched)}\n"
+            f"超級獎號：{'中' if n['is_super'] else '未中'}\n"
+            f"{SEPARATOR}"
+        )
+    return message
+
+
+def format_announcement(draw):
+    """推播給追蹤者的最新開獎"""
+    return f"🔔 最新開獎\n{SEPARATOR}" + format_draw(draw) + "\n💡 輸入「訂閱 11 22 33 十期」中獎時主動通知"
+
+
+# LINE 每則文字訊息最多 5000 字，一次回覆最多 5 則
+TEXT_LIMIT = 5000
+MAX_REPLY_MESSAGES = 5
+
+
+def text_length(text):
+    """LINE 以 UTF-16 計算字數，emoji 佔 2 個字"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def truncate_text(text, limit):
+    """截到最多 limit 個 UTF-16 字，不會切開 emoji 的代理對"""
+    return text.encode('utf-16-le')[:limit * 2].decode('utf-16-le', errors='ignore')
+
+
+class ReplyBuilder:
+    """把逐項格式化的文字依序填入最多 max_messages 則訊息
+
+    項目以 generator 提供，放不下時就停止取用，格式化的成本只跟輸出長度有關。
+    最後一則會保留頁尾與「還有 N 筆」提示的空間；項目較少時頁尾放不下就另起一則。
+    """
+
+    def __init__(self, header='', footer='', limit=TEXT_LIMIT, max_messages=MAX_REPLY_MESSAGES):
+        self.header = header
+        self.footer = footer
+        self.limit = limit
+        self.max_messages = max_messages
+
+    def more_text(self, remaining):
+        if remaining is None:
+            return "\n⚠️ 還有更多結果未顯示，請縮小查詢範圍"
+        return f"\n⚠️ 還有 {remaining} 筆未顯示，請縮小查詢範圍"
+
+    def build(self, chunks, total=None):
+        """回傳訊息列表；total 為項目總數（用來計算未顯示的筆數）"""
+        footer_size = text_length(self.footer)
+        # 最後一則要放得下頁尾與提示
+        reserve = footer_size + text_length(self.more_text(total))
+        messages = []
+        parts = [self.header]
+        size = text_length(self.header)
+        shown = 0
+        truncated = False
+        for chunk in chunks:
+            chunk_size = text_length(chunk)
+            if chunk_size > self.limit - reserve:
+                # 單一項目不會超過一則訊息
+                chunk = truncate_text(chunk, self.limit - reserve)
+                chunk_size = text_length(chunk)
+            while True:
+                last = len(messages) == self.max_messages - 1
+                budget = self.limit - reserve if last else self.limit
+                if size + chunk_size <= budget:
+                    parts.append(chunk)
+                    size += chunk_size
+                    shown += 1
+                    break
+                if last:
+                    truncated = True
+                    break
+                messages.append(''.join(parts))
+                parts = []
+                size = 0
+            if truncated:
+                break
+        if truncated:
+            parts.append(self.more_text(total - shown if total is not None else None))
+        elif size + footer_size > self.limit:
+            # 不是最後一則時沒有保留頁尾的空間，放不下就另起一則
+            messages.append(''.join(parts))
+            parts = []
+        parts.append(self.footer)
+        messages.append(''.join(parts))
+        return messages
+
+
+def build_matches_reply(title, matches, footer, total=None, separator=SEPARATOR):
+    """號碼查詢結果，自動拆成多則訊息"""
+    builder = ReplyBuilder(f"{title}\n{separator}", footer)
+    return builder.build((format_match(m, separator) for m in matches), total)
+
+
+def format_odds_summary():
+    """各星數的中獎機率與每注期望值"""
+    message = (
+        f"🎲 各玩法理論賠率（每注 {odds_tables.BET_UNIT} 元）\n"
+        f"{LONG_SEPARATOR}"
+    )
+    for stars, ev in odds_tables.EXPECTED_VALUE.items():
+        win = odds_tables.WIN_PROBABILITY[stars]
+        message += (
+            f"{stars}星：中獎率 {win * 100:.2f}%，"
+            f"期望值 {ev:+.2f} 元（回收 {(ev + odds_tables.BET_UNIT) / odds_tables.BET_UNIT * 100:.1f}%）\n"
+        )
+    message += (
+        f"超級獎號：中獎率 {odds_tables.SUPER_PROBABILITY * 100:.2f}%，"
+        f"期望值 {odds_tables.SUPER_EXPECTED_VALUE:+.2f} 元\n"
+        f"{LONG_SEPARATOR}"
+        "💡 輸入「賠率 3」查看三星各中獎數的機率\n"
+        "⚠️ 期望值皆為負，理性購買，投注有節"
+    )
+    return message
+
+
+def format_odds_detail(stars):
+    """單一星數各中獎數的機率與獎金"""
+    payouts = odds_tables.PAYOUTS[stars]
+    message = f"🎲 {stars}星 各中獎數機率（每注 {odds_tables.BET_UNIT} 元）\n{LONG_SEPARATOR}"
+    for hits, probability in sorted(odds_tables.PROBABILITIES[stars].items(), reverse=True):
+        prize = payouts.get(hits)
+        odds = f"1/{1 / probability:,.0f}" if probability < 0.01 else f"{probability * 100:.2f}%"
+        message += f"中 {hits} 個：{odds}" + (f"，獎金 {prize:,} 元" if prize else "") + "\n"
+    ev = odds_tables.EXPECTED_VALUE[stars]
+    message += (
+        f"{LONG_SEPARATOR}"
+        f"中獎率：{odds_tables.WIN_PROBABILITY[stars] * 100:.2f}%\n"
+        f"期望值：{ev:+.2f} 元（回收 {(ev + odds_tables.BET_UNIT) / odds_tables.BET_UNIT * 100:.1f}%）"
+    )
+    return message
+
+
+def format_number_analysis(result):
+    """號碼的全部歷史回測"""
+    stars = result['stars']
+    periods = result['periods']
+    theory = odds_tables.PROBABILITIES[stars]
+    message = (
+        f"📈 號碼回測 {format_numbers(result['numbers'])}（{stars}星）\n"
+        f"{LONG_SEPARATOR}"
+        f"分析期數：{periods} 期（{result['first_period']} 至 {result['last_period']}）\n"
+        f"{DASH_SEPARATOR}"
+    )
+    for hits in range(stars, -1, -1):
+        count = result['match_counts'][hits]
+        message += f"中 {hits} 個：{count} 次（實際 {count / periods * 100:.2f}%，理論 {theory[hits] * 100:.2f}%）\n"
+    message += (
+        f"{DASH_SEPARATOR}"
+        f"超級獎號命中：{result['super_matches']} 次\n"
+        f"中獎：{result['wins']} 次"
+        + (f"，最近一次 {result['last_win_period']}\n" if result['last_win_period'] else "\n")
+        + f"最長連續未中：{result['longest_gap']} 期\n"
+        f"每期投注 {odds_tables.BET_UNIT} 元：投入 {result['cost']:,} 元，獎金 {result['total_payout']:,} 元，"
+        f"回收 {result['total_payout'] / result['cost'] * 100:.1f}%\n"
+        f"理論回收：{(odds_tables.EXPECTED_VALUE[stars] + odds_tables.BET_UNIT) / odds_tables.BET_UNIT * 100:.1f}%\n"
+        f"{LONG_SEPARATOR}"
+        "⚠️ 過去結果不代表未來，理性購買"
+    )
+    return message
+
+
+def format_frequency_report(report):
+    """各區間的冷熱號碼"""
+    message = f"🔥 號碼冷熱分析\n{LONG_SEPARATOR}"
+    for window in report:
+        label = f"全部 {window['periods']} 期" if window['all'] else f"最近 {window['periods']} 期"
+        message += (
+            f"{label}（每個號碼平均 {window['expected']:.1f} 次）\n"
+            f"熱門：{' '.join(f'{n:02d}({c})' for n, c in window['hot'])}\n"
+            f"冷門：{' '.join(f'{n:02d}({c})' for n, c in window['cold'])}\n"
+            f"超級獎號：{' '.join(f'{n:02d}({c})' for n, c in window['super_hot'])}\n"
+            f"{DASH_SEPARATOR}"
+        )
+    message += "💡 括號內為出現次數，開獎號碼皆為隨機"
+    return message
+
+
+def format_slot_report(report):
+    """指定星期與時段的冷熱號碼"""
+    labels = []
+    if report['weekday'] is not None:
+        labels.append(f"星期{WEEKDAYS[report['weekday']]}")
+    if report['slot'] is not None:
+        minutes = report['slot'] * 5
+        labels.append(f"{minutes // 60:02d}:{minutes % 60:02d}")
+    elif report['hour'] is not None:
+        labels.append(f"{report['hour']:02d}:00-{report['hour']:02d}:59")
+    label = ' '.join(labels) or '全部時段'
+    if not report['draws']:
+        return f"🕘 {label} 尚無開獎資料"
+    return (
+        f"🕘 {label} 冷熱號碼\n"
+        f"{LONG_SEPARATOR}"
+        f"共 {report['draws']} 期（每個號碼平均 {report['expected']:.1f} 次）\n"
+        f"熱門：{' '.join(f'{n:02d}({c})' for n, c in report['hot'])}\n"
+        f"冷門：{' '.join(f'{n:02d}({c})' for n, c in report['cold'])}\n"
+        f"超級獎號：{' '.join(f'{n:02d}({c})' for n, c in report['super_hot'])}\n"
+        f"{LONG_SEPARATOR}"
+        "💡 括號內為出現次數，開獎號碼皆為隨機"
+    )
@@ -0,0 +1,190 @@
+"""號碼倒排索引：每個號碼一個期別點陣圖，以位元運算找出中獎期數
+
+點陣圖用不壓縮的 Python 整數：每期開出 20 個號碼，每個號碼約在四分之一的期數出現，
+壓縮格式（如 Roaring 在密度超過 1/16 時）也會改用一般點陣圖，壓縮只多出解碼的成本。
+"""
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from operator import add
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_NUMBER = 80
+
+
+def _bitset_from_positions(positions, size):
+    """由位置列表建立點陣圖（Python 整數，第 i 位代表第 i 期）"""
+    buf = bytearray((size + 7) // 8)
+    for pos in positions:
+        buf[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(buf, 'little')
+
+
+def add_bitsets(bitsets):
+    """逐位累加點陣圖，回傳每個位置命中次數的二進位各位（counters[i] 為第 i 位）"""
+    counters = []
+    for bits in bitsets:
+        carry = bits
+        for i in range(len(counters)):
+            if not carry:
+                break
+            counters[i], carry = counters[i] ^ carry, counters[i] & carry
+        if carry:
+            counters.append(carry)
+    return counters
+
+
+def at_least(counters, k, mask):
+    """由累加結果取出命中次數 >= k 的位置"""
+    if k <= 0:
+        return mask
+    if k.bit_length() > len(counters):
+        return 0
+    greater = 0
+    equal = mask
+    for i in range(len(counters) - 1, -1, -1):
+        bit = counters[i]
+        if (k >> i) & 1:
+            equal &= bit
+        else:
+            greater |= equal & bit
+            equal &= mask ^ bit
+    return greater | equal
+
+
+def iter_positions_desc(bits, limit=None):
+    """由高到低列出點陣圖中為 1 的位置"""
+    if not bits:
+        return
+    nbytes = (bits.bit_length() + 63) // 64 * 8
+    words = memoryview(bits.to_bytes(nbytes, 'little')).cast('Q')
+    found = 0
+    for w in range(len(words) - 1, -1, -1):
+        word = words[w]
+        while word:
+            high = word.bit_length() - 1
+            yield w * 64 + high
+            found += 1
+            if limit is not None and found >= limit:
+                return
+            word ^= 1 << high
+
+
+def positions(bits):
+    """由低到高列出點陣圖中為 1 的位置；以字串分割與 accumulate 在 C 層計算，不逐位元執行 Python 迴圈"""
+    # 反轉後第 i 個字元為第 i 位，兩個 1 之間的 0 的個數即為位置的差距減 1
+    gaps = bin(bits)[:1:-1].split('1')
+    gaps.pop()
+    return map(add, accumulate(map(len, gaps)), range(len(gaps)))
+
+
+_BIT_BYTES = bytes.maketrans(b'01', b'\x00\x01')
+
+
+def bit_bytes(bits, size):
+    """點陣圖轉成每個位置一個位元組（0 或 1），長度為 size"""
+    return bin(bits)[:1:-1].ljust(size, '0').encode('ascii').translate(_BIT_BYTES)
+
+
+class NumberIndex:
+    """號碼倒排索引：每個號碼（1-80）與超級獎號各對應一個期別點陣圖"""
+
+    def __init__(self, records=()):
+        # 位置依開獎先後排列，0 為最舊的一期
+        self.records = []
+        self.periods = []
+        self.number_bits = [0] * (MAX_NUMBER + 1)
+        self.super_bits = [0] * (MAX_NUMBER + 1)
+        if records:
+            self._build(records)
+
+    @property
+    def size(self):
+        return len(self.records)
+
+    @property
+    def latest_period(self):
+        return self.records[-1]['期號'] if self.records else None
+
+    def _build(self, records):
+        ordered = sorted(records, key=lambda r: int(r['期號']))
+        number_positions = [[] for _ in range(MAX_NUMBER + 1)]
+        super_positions = [[] for _ in range(MAX_NUMBER + 1)]
+        for pos, record in enumerate(ordered):
+            for n in record['開獎號碼']:
+                number_positions[n].append(pos)
+            super_positions[record['超級獎號']].append(pos)
+        size = len(ordered)
+        self.records = ordered
+        self.periods = [int(r['期號']) for r in ordered]
+        self.number_bits = [_bitset_from_positions(p, size) for p in number_positions]
+        self.super_bits = [_bitset_from_positions(p, size) for p in super_positions]
+
+    def add(self, record):
+        """加入一筆較新的開獎"""
+        pos = len(self.records)
+        bit = 1 << pos
+        for n in record['開獎號碼']:
+            self.number_bits[n] |= bit
+        self.super_bits[record['超級獎號']] |= bit
+        self.records.append(record)
+        self.periods.append(int(record['期號']))
+
+    def _range_mask(self, start_period=None, end_period=None):
+        lo = bisect_left(self.periods, int(start_period)) if start_period is not None else 0
+        hi = bisect_right(self.periods, int(end_period)) if end_period is not None else len(self.periods)
+        if hi <= lo:
+            return 0
+        return ((1 << hi) - 1) ^ ((1 << lo) - 1)
+
+    def match_bits(self, numbers, min_matches=2, start_period=None, end_period=None, include_super=True):
+        """回傳至少中 min_matches 個號碼（或中超級獎號）的期別點陣圖"""
+        mask = self._range_mask(start_period, end_period)
+        if not mask:
+            return 0
+        numbers = set(numbers)
+        counters = add_bitsets(self.number_bits[n] & mask for n in numbers)
+        bits = at_least(counters, min_matches, mask)
+        if include_super:
+            for n in numbers:
+                bits |= self.super_bits[n] & mask
+        return bits
+
+    def count_matches(self, numbers, min_matches=2, start_period=None, end_period=None):
+        return self.match_bits(numbers, min_matches, start_period, end_period).bit_count()
+
+    def find_matches(self, numbers, min_matches=2, start_period=None, end_period=None, limit=None):
+        """回傳 (符合期數, 最新的符合開獎列表)"""
+        bits = self.match_bits(numbers, min_matches, start_period, end_period)
+        records = [self.records[pos] for pos in iter_positions_desc(bits, limit)]
+        return bits.bit_count(), records
+
+    def iter_matches(self, numbers, min_matches=2, start_period=None, end_period=None):
+        """回傳 (符合期數, 由新到舊逐筆產生開獎的 generator)"""
+        bits = self.match_bits(numbers, min_matches, start_period, end_period)
+        return bits.bit_count(), (self.records[pos] for pos in iter_positions_desc(bits))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def index_for(data):
+    """取得對應 data（期號由大到小）的索引，新期別以增量方式加入"""
+    global _index
+    if not data:
+        return NumberIndex()
+    with _index_lock:
+        index = _index
+        if index is not None and index.size and len(data) >= index.size:
+            latest = int(index.latest_period)
+            new_records = [r for r in data[:len(data) - index.size] if int(r['期號']) > latest]
+            if len(new_records) + index.size == len(data) and data[len(new_records)]['期號'] == index.latest_period:
+                for record in reversed(new_records):
+                    index.add(record)
+                return index
+        logger.info(f"重建號碼索引：{len(data)} 期")
+        _index = NumberIndex(data)
+        return _index
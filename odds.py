@@ -0,0 +1,107 @@
+"""賓果賓果的理論機率、獎金與期望值
+
+每期從 1-80 開出 20 個號碼，選 N 星中 k 個的機率為超幾何分布
+C(20, k) * C(60, N - k) / C(80, N)。執行本檔會產生 odds_tables.py，
+執行時只查表，不重新計算組合數：
+
+    python odds.py          # 重新產生 odds_tables.py
+    python odds.py --check  # 檢查 odds_tables.py 是否與計算結果一致
+"""
+import os
+import sys
+from fractions import Fraction
+from math import comb
+
+TOTAL_NUMBERS = 80
+DRAWN_NUMBERS = 20
+BET_UNIT = 25
+MAX_STARS = 10
+
+# 單注 25 元的獎金（元），依官方獎金表；7-10 星全不中也有獎金
+PAYOUTS = {
+    1: {1: 50},
+    2: {2: 75, 1: 25},
+    3: {3: 500, 2: 50},
+    4: {4: 1000, 3: 100, 2: 25},
+    5: {5: 7500, 4: 500, 3: 50},
+    6: {6: 25000, 5: 1000, 4: 200, 3: 25},
+    7: {7: 80000, 6: 3000, 5: 300, 4: 50, 0: 25},
+    8: {8: 500000, 7: 20000, 6: 1000, 5: 200, 4: 25, 0: 25},
+    9: {9: 1000000, 8: 100000, 7: 3000, 6: 500, 5: 100, 4: 25, 0: 50},
+    10: {10: 5000000, 9: 250000, 8: 25000, 7: 2500, 6: 250, 5: 25, 0: 125},
+}
+# 超級獎號玩法：猜中 20 個號碼中最後開出的那一個
+SUPER_PAYOUT = 1200
+
+TABLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'odds_tables.py')
+
+
+def hit_probability(stars, hits):
+    """選 stars 個號碼恰好中 hits 個的機率（分數）"""
+    if not 0 <= hits <= stars:
+        return Fraction(0)
+    return Fraction(
+        comb(DRAWN_NUMBERS, hits) * comb(TOTAL_NUMBERS - DRAWN_NUMBERS, stars - hits),
+        comb(TOTAL_NUMBERS, stars)
+    )
+
+
+def compute_tables():
+    """回傳要寫入 odds_tables.py 的各個表"""
+    probabilities = {}
+    win_probability = {}
+    expected_value = {}
+    for stars in range(1, MAX_STARS + 1):
+        exact = {hits: hit_probability(stars, hits) for hits in range(stars + 1)}
+        payouts = PAYOUTS[stars]
+        probabilities[stars] = {hits: float(p) for hits, p in exact.items()}
+        win_probability[stars] = float(sum(exact[hits] for hits in payouts))
+        # 期望值為每注 25 元的平均獎金減去本金
+        expected_value[stars] = float(sum(exact[hits] * prize for hits, prize in payouts.items()) - BET_UNIT)
+    super_probability = Fraction(1, TOTAL_NUMBERS)
+    return {
+        'PROBABILITIES': probabilities,
+        'WIN_PROBABILITY': win_probability,
+        'EXPECTED_VALUE': expected_value,
+        'SUPER_PROBABILITY': float(super_probability),
+        'SUPER_EXPECTED_VALUE': float(super_probability * SUPER_PAYOUT - BET_UNIT),
+    }
+
+
+def render_tables(tables):
+    lines = [
+        '"""由 odds.py 產生，請勿手動修改"""',
+        '',
+        f'BET_UNIT = {BET_UNIT}',
+        f'PAYOUTS = {PAYOUTS!r}',
+        f'SUPER_PAYOUT = {SUPER_PAYOUT}',
+        '',
+        '# PROBABILITIES[星數][中幾個]：恰好中幾個的機率',
+    ]
+    for name, value in tables.items():
+        if isinstance(value, dict):
+            lines.append(f'{name} = {{')
+            for key, item in value.items():
+                lines.append(f'    {key!r}: {item!r},')
+            lines.append('}')
+        else:
+            lines.append(f'{name} = {value!r}')
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    content = render_tables(compute_tables())
+    if '--check' in sys.argv:
+        with open(TABLES_PATH, encoding='utf-8') as f:
+            if f.read() != content:
+                print("odds_tables.py 與計算結果不一致，請執行 python odds.py")
+                sys.exit(1)
+        print("odds_tables.py 為最新")
+        return
+    with open(TABLES_PATH, 'w', encoding='utf-8') as f:
+        f.write(content)
+    print(f"已產生 {TABLES_PATH}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""由 odds.py 產生，請勿手動修改"""
+
+BET_UNIT = 25
+PAYOUTS = {1: {1: 50}, 2: {2: 75, 1: 25}, 3: {3: 500, 2: 50}, 4: {4: 1000, 3: 100, 2: 25}, 5: {5: 7500, 4: 500, 3: 50}, 6: {6: 25000, 5: 1000, 4: 200, 3: 25}, 7: {7: 80000, 6: 3000, 5: 300, 4: 50, 0: 25}, 8: {8: 500000, 7: 20000, 6: 1000, 5: 200, 4: 25, 0: 25}, 9: {9: 1000000, 8: 100000, 7: 3000, 6: 500, 5: 100, 4: 25, 0: 50}, 10: {10: 5000000, 9: 250000, 8: 25000, 7: 2500, 6: 250, 5: 25, 0: 125}}
+SUPER_PAYOUT = 1200
+
+# PROBABILITIES[星數][中幾個]：恰好中幾個的機率
+PROBABILITIES = {
+    1: {0: 0.75, 1: 0.25},
+    2: {0: 0.560126582278481, 1: 0.379746835443038, 2: 0.060126582278481014},
+    3: {0: 0.41650438169425513, 1: 0.4308666017526777, 2: 0.13875365141187926, 3: 0.013875365141187927},
+    4: {0: 0.308321425410033, 1: 0.4327318251368884, 2: 0.21263546580002277, 3: 0.04324789134915717, 4: 0.003063392303898633},
+    5: {0: 0.22718420819686644, 1: 0.4056860860658329, 2: 0.27045739071055525, 3: 0.08393505228948267, 4: 0.01209233804170513, 5: 0.0006449246955576069},
+    6: {0: 0.16660175267770205, 1: 0.36349473311498626, 2: 0.308321425410033, 3: 0.12981954754106653, 4: 0.028537917778424106, 5: 0.0030956385386765135, 6: 0.0001289849391115214},
+    7: {0: 0.12157425195399879, 1: 0.3151925050659228, 2: 0.3266540507046836, 3: 0.17499324144893766, 4: 0.05219096674792877, 5: 0.008638504841036487, 6: 0.00073207668144377, 7: 2.440255604812567e-05},
+    8: {0: 0.08826623772002652, 1: 0.26646411387177815, 2: 0.3281456217124676, 3: 0.21478622512088785, 4: 0.08150370149676549, 5: 0.01830258559927365, 6: 0.0023667136550784896, 7: 0.00016045516305616877, 8: 4.345660666104571e-06},
+    9: {0: 0.06374783835335249, 1: 0.2206655943000663, 2: 0.31642613522273655, 3: 0.24610921628435067, 4: 0.11410518209547167, 5: 0.03260148059870619, 6: 0.005719557999773016, 7: 0.0005916784137696224, 8: 3.2592454995784283e-05, 9: 7.242767776840952e-07},
+    10: {0: 0.04579070078902784, 1: 0.17957137564324643, 2: 0.2952567811057225, 3: 0.2674023677938619, 4: 0.14731889707161835, 5: 0.05142768770500132, 6: 0.011479394577009222, 7: 0.0016111430985276101, 8: 0.00013541935526417413, 9: 6.120648825499396e-06, 10: 1.122118951341556e-07},
+}
+WIN_PROBABILITY = {
+    1: 0.25,
+    2: 0.439873417721519,
+    3: 0.15262901655306718,
+    4: 0.25894674945307855,
+    5: 0.0966723150267454,
+    6: 0.16158208879727867,
+    7: 0.18316020278045594,
+    8: 0.1906040392948664,
+    9: 0.21679905419284645,
+    10: 0.1104505783855508,
+}
+EXPECTED_VALUE = {
+    1: -12.5,
+    2: -10.996835443037975,
+    3: -11.124634858812074,
+    4: -12.295931916185081,
+    5: -9.920143147991249,
+    6: -9.726665739323968,
+    7: -12.611109383261281,
+    8: -9.346587150471318,
+    9: -7.081493951617066,
+    10: -5.616058254525175,
+}
+SUPER_PROBABILITY = 0.0125
+SUPER_EXPECTED_VALUE = -10.0
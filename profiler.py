@@ -0,0 +1,206 @@
+"""按需的請求效能分析：以 cProfile 記錄接下來的幾個請求，結果寫到 PROFILE_DIR
+
+預設不分析任何請求。管理員以「效能分析 N」指令啟動，或 webhook 請求帶有
+X-Profile 標頭（值須等於 PROFILE_TOKEN）時分析該請求。每個請求寫出兩個檔案：
+.prof 可用 pstats 或 snakeviz 開啟，.txt 是各區段耗時與累計時間最多的函式。
+
+開銷控制：一次最多啟動 PROFILE_MAX_SAMPLES 個、逾 PROFILE_ARM_TTL 秒未用完作廢、
+同一時間只分析一個請求（其餘照常處理）、只保留最新的 PROFILE_KEEP 份結果；
+未啟動時每個區段只多一次 ContextVar 讀取。次數由每個 worker 各自計算。
+"""
+import contextvars
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join('data', 'profiles'))
+# 可使用「效能分析」指令的 LINE user ID，以逗號分隔
+PROFILE_ADMINS = {user_id for user_id in os.getenv('PROFILE_ADMINS', '').split(',') if user_id}
+# 未設定時不接受 X-Profile 標頭
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_MAX_SAMPLES = int(os.getenv('PROFILE_MAX_SAMPLES', '20'))
+PROFILE_ARM_TTL = float(os.getenv('PROFILE_ARM_TTL', '600'))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '50'))
+PROFILE_TOP = int(os.getenv('PROFILE_TOP', '30'))
+
+_session = contextvars.ContextVar('profile_session', default=None)
+_requested = contextvars.ContextVar('profile_requested', default=False)
+
+
+class RequestProfiler:
+    """記錄接下來 N 個請求的 cProfile 與各區段耗時"""
+
+    def __init__(self, directory=PROFILE_DIR, max_samples=PROFILE_MAX_SAMPLES, arm_ttl=PROFILE_ARM_TTL,
+                 keep=PROFILE_KEEP, top=PROFILE_TOP, admins=PROFILE_ADMINS, token=PROFILE_TOKEN):
+        self.directory = directory
+        self.max_samples = max_samples
+        self.arm_ttl = arm_ttl
+        self.keep = keep
+        self.top = top
+        self.admins = set(admins)
+        self.token = token
+        self._remaining = 0
+        self._expires = 0.0
+        self._seq = 0
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+        self._counters = {'profiled': 0, 'skipped_busy': 0, 'write_errors': 0}
+        self.last_summary = None
+
+    def is_admin(self, user_id):
+        return user_id in self.admins
+
+    def arm(self, samples):
+        """分析接下來的 samples 個請求（不超過上限），回傳實際啟動的次數"""
+        samples = max(0, min(samples, self.max_samples))
+        with self._lock:
+            self._remaining = samples
+            self._expires = time.monotonic() + self.arm_ttl
+        logger.info(f"效能分析已啟動：接下來 {samples} 個請求")
+        return samples
+
+    @contextmanager
+    def requested(self, header):
+        """webhook 請求帶有正確的 X-Profile 標頭時，分析此請求中處理的事件"""
+        # 以固定時間比較，不從回應時間透露 token 內容
+        if not (self.token and header and hmac.compare_digest(header.encode(), self.token.encode())):
+            yield
+            return
+        token = _requested.set(True)
+        try:
+            yield
+        finally:
+            _requested.reset(token)
+
+    def _claim(self):
+        if _requested.get():
+            return True
+        with self._lock:
+            if self._remaining <= 0:
+                return False
+            if time.monotonic() > self._expires:
+                self._remaining = 0
+                return False
+            self._remaining -= 1
+            return True
+
+    @contextmanager
+    def profile(self, name, detail=''):
+        """已啟動時以 cProfile 記錄此範圍；正在分析其他請求時不等待，直接略過
+
+        同時只允許一個 cProfile（新版 Python 整個行程只能有一個）。
+        """
+        if _session.get() is not None or not (self._remaining > 0 or _requested.get()):
+            yield
+            return
+        if not self._busy.acquire(blocking=False):
+            with self._lock:
+                self._counters['skipped_busy'] += 1
+            yield
+            return
+        if not self._claim():
+            self._busy.release()
+            yield
+            return
+        try:
+            session = {'name': name, 'detail': detail, 'sections': []}
+            token = _session.set(session)
+            profile = cProfile.Profile()
+            started = time.perf_counter()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                session['elapsed'] = time.perf_counter() - started
+                _session.reset(token)
+                self._write(session, profile)
+        finally:
+            self._busy.release()
+
+    def _write(self, session, profile):
+        with self._lock:
+            self._seq += 1
+            self._counters['profiled'] += 1
+            seq = self._seq
+        base = os.path.join(
+            self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{seq:04d}-{session['name']}"
+        )
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            profile.dump_stats(f"{base}.prof")
+            with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+                f.write(self.summarize(session, profile))
+            self._prune()
+        except OSError as e:
+            with self._lock:
+                self._counters['write_errors'] += 1
+            logger.error(f"寫入效能分析結果失敗：{str(e)}")
+            return
+        self.last_summary = f"{base}.txt"
+        logger.info(f"效能分析 {session['name']} 耗時 {session['elapsed'] * 1000:.1f} ms：{base}.txt")
+
+    def summarize(self, session, profile):
+        """各區段耗時與累計時間最多的 top 個函式"""
+        lines = [f"{session['name']} {session['detail']}".rstrip(), f"總耗時：{session['elapsed'] * 1000:.1f} ms", ""]
+        for name, elapsed, thread in session['sections']:
+            lines.append(f"{name:<16} {elapsed * 1000:>9.1f} ms  {thread}")
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(self.top)
+        return '\n'.join(lines) + '\n\n' + out.getvalue()
+
+    def _prune(self):
+        """只保留最新的 keep 份結果"""
+        names = sorted(name[:-len('.prof')] for name in os.listdir(self.directory) if name.endswith('.prof'))
+        for name in names[:max(len(names) - self.keep, 0)]:
+            for suffix in ('.prof', '.txt'):
+                try:
+                    os.remove(os.path.join(self.directory, name + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._counters)
+            remaining = self._remaining if time.monotonic() <= self._expires else 0
+        metrics.update(remaining=remaining, directory=self.directory, last_summary=self.last_summary)
+        return metrics
+
+
+def section(name):
+    """記錄函式在被分析的請求中的耗時；在執行緒池中執行時也會記到同一個請求"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            session = _session.get()
+            if session is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                session['sections'].append((name, time.perf_counter() - started, threading.current_thread().name))
+        return wrapper
+    return decorator
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    global _profiler
+    if _profiler is None:
+        with _profiler_lock:
+            if _profiler is None:
+                _profiler = RequestProfiler()
+    return _profiler
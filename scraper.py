@@ -1,8 +1,4 @@
 import requests
-from bs4 import BeautifulSoup
-import urllib3
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
 import time
 from collections import Counter
 import random
@@ -10,6 +6,13 @@ from datetime import datetime, timedelta, timezone
 import logging
 import os
 
+import odds_tables
+from sources import Source, HedgedFetcher
+from shared_cache import get_shared_cache
+from history_stream import CHUNK_SIZE, iter_records
+from executor import DeadlineExceeded, check_deadline, current_deadline, remaining_timeout
+from profiler import section
+
 # 設置日誌
 logging.basicConfig(
     level=logging.INFO,
@@ -17,41 +20,131 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def get_history_from_github():
+def history_url():
+    """歷史數據的下載網址，可用 HISTORY_URL 覆寫（例如本機壓測的替身伺服器）"""
+    url = os.environ.get('HISTORY_URL')
+    if url:
+        return url
+    repo_name = os.environ.get('REPO_NAME', 'YOUR_USERNAME/YOUR_REPO')
+    return f"https://raw.githubusercontent.com/{repo_name}/main/data/bingo_history.json"
+
+def get_history_from_github(timeout=None):
     """從 GitHub 獲取歷史數據"""
     try:
-        repo_name = os.environ.get('REPO_NAME', 'YOUR_USERNAME/YOUR_REPO')
-        url = f"https://raw.githubusercontent.com/{repo_name}/main/data/bingo_history.json"
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            return data['records']
+        url = history_url()
+        with requests.get(url, timeout=remaining_timeout(timeout or GITHUB_TIMEOUT), stream=True) as response:
+            if response.status_code == 200:
+                # 逐塊解析，不保留整份回應本文；每塊之間檢查是否已被取消
+                return list(iter_records(_checked_chunks(response)))
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"從 GitHub 獲取數據失敗：{str(e)}")
     return None
 
+def _checked_chunks(response):
+    for chunk in response.iter_content(CHUNK_SIZE):
+        check_deadline()
+        yield chunk
+
+@section('scrape_bingo')
 def scrape_bingo():
-    """抓取開獎數據"""
-    # 先嘗試從 GitHub 獲取數據
-    github_data = get_history_from_github()
-    if github_data:
-        logger.info(f"從 GitHub 獲取到 {len(github_data)} 筆數據")
-        return github_data
-        
-    # 如果無法從 GitHub 獲取，則爬取網站
-    logger.info("從網站爬取數據...")
+    """抓取全部歷史的開獎數據；設定 REDIS_URL 時經由多個實例共用的快取，只有持有租約的實例向上游抓取
+
+    只採用有全部歷史的來源，GitHub 無法取得時回傳空列表，不會以網站的今日資料代替。
+    """
+    cache = get_shared_cache()
+    if cache is not None:
+        return cache.draws(fetch_upstream)
+    return fetch_upstream()
+
+@section('scrape_latest')
+def scrape_latest():
+    """抓取最新的開獎數據，可能只有今日的期數（GitHub 太慢或失敗時改用網站）
+
+    只適用於取最新幾期的請求；有共用快取時與 scrape_bingo() 相同。
+    """
+    cache = get_shared_cache()
+    if cache is not None:
+        return cache.draws(fetch_upstream)
+    return fetch_upstream(full=False)
+
+def stream_history():
+    """期號由大到小逐筆產生開獎資料；呼叫端讀到需要的期數就關閉，不必下載整份歷史
+
+    有共用快取時直接使用快取中的資料；GitHub 無法串流讀取時改用 fetch_upstream()（同樣只用完整來源）。
+    """
+    cache = get_shared_cache()
+    if cache is not None:
+        yield from cache.draws(fetch_upstream)
+        return
+    try:
+        with requests.get(history_url(), timeout=remaining_timeout(GITHUB_TIMEOUT), stream=True) as response:
+            if response.status_code == 200:
+                yield from iter_records(_checked_chunks(response))
+                return
+            logger.error(f"從 GitHub 獲取數據失敗：HTTP {response.status_code}")
+    except (requests.RequestException, ValueError) as e:
+        logger.error(f"從 GitHub 串流獲取數據失敗：{str(e)}")
+    yield from fetch_upstream()
+
+def fetch_upstream(full=True):
+    """向上游抓取：優先使用 GitHub，full 為 False 時逾時未回應會同時爬取網站，採用先回來的有效結果"""
+    data = _fetcher.fetch(full=full)
+    if data:
+        return data
+    logger.error("所有來源皆無法取得開獎資料")
+    return []
+
+_DeadlineRetry = None
+
+def deadline_retry(**kwargs):
+    """建立會檢查目前期限的 Retry；urllib3 的 Retry 在第一次爬取網站時才載入"""
+    global _DeadlineRetry
+    if _DeadlineRetry is None:
+        from urllib3.util.retry import Retry
+
+        class DeadlineRetry(Retry):
+            """重試前先檢查目前的期限；已逾時或被取消就不再重試，等待退避時也會被取消喚醒"""
+
+            def increment(self, *args, **kwargs):
+                check_deadline()
+                return super().increment(*args, **kwargs)
+
+            def sleep(self, response=None):
+                deadline = current_deadline()
+                if deadline is None:
+                    return super().sleep(response)
+                backoff = self.get_backoff_time()
+                if backoff > 0:
+                    deadline.wait(backoff)
+
+        _DeadlineRetry = DeadlineRetry
+    return _DeadlineRetry(**kwargs)
+
+def scraping_session(retry_strategy):
+    """爬取網站用的 session（關閉 SSL 警告並掛上重試策略）"""
+    import urllib3
+    from requests.adapters import HTTPAdapter
+
     # 關閉 SSL 警告
     urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=1,
-        status_forcelist=[500, 502, 503, 504]
-    )
     adapter = HTTPAdapter(max_retries=retry_strategy)
     session = requests.Session()
     session.mount("http://", adapter)
     session.mount("https://", adapter)
+    return session
+
+def scrape_pilio(timeout=None):
+    """從網站爬取今日開獎數據"""
+    logger.info("從網站爬取數據...")
+    from bs4 import BeautifulSoup
+
+    session = scraping_session(deadline_retry(
+        total=3,
+        backoff_factor=1,
+        status_forcelist=[500, 502, 503, 504]
+    ))
     
     try:
         print("開始爬取開獎數據...")
@@ -84,15 +177,16 @@ def scrape_bingo():
         print(f"開獎日期：{current_time.strftime('%Y/%m/%d')}({weekday_map[weekday]})")
         
         # 抓取網頁資料
-        url = "http://www.pilio.idv.tw/bingo/list.asp?auto=1"
+        url = os.environ.get('PILIO_URL', "http://www.pilio.idv.tw/bingo/list.asp?auto=1")
         response = session.get(
             url, 
             headers={
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
             },
             verify=False,
-            timeout=30
+            timeout=remaining_timeout(timeout or PILIO_TIMEOUT)
         )
+        check_deadline()
         
         soup = BeautifulSoup(response.content, 'html.parser')
         tables = soup.find_all('table')
@@ -189,6 +283,24 @@ def scrape_bingo():
         print(f"錯誤追蹤:\n{traceback.format_exc()}")
         return []
 
+# 上游來源：GitHub raw 為主，網站為備援
+GITHUB_TIMEOUT = float(os.environ.get('GITHUB_TIMEOUT', '5'))
+PILIO_TIMEOUT = float(os.environ.get('PILIO_TIMEOUT', '30'))
+# GitHub 超過此秒數仍未回應時，同時向網站發出請求
+HEDGE_AFTER = float(os.environ.get('HEDGE_AFTER', '1.5'))
+_fetcher = HedgedFetcher(
+    [
+        Source('github', get_history_from_github, GITHUB_TIMEOUT),
+        # 網站只有今日的開獎
+        Source('pilio', scrape_pilio, PILIO_TIMEOUT, partial=True),
+    ],
+    hedge_after=HEDGE_AFTER
+)
+
+def source_stats():
+    """各來源的延遲與斷路器狀態"""
+    return _fetcher.stats()
+
 def get_best_combination(data, periods=10):
     """獲取最佳投注組合"""
     recent_data = data[:periods]
@@ -242,18 +354,14 @@ def get_best_combination(data, periods=10):
 
 def scrape_bingo_history(days=7):
     """抓取指定天數的歷史開獎數據"""
-    # 關閉 SSL 警告
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    
-    retry_strategy = Retry(
+    from bs4 import BeautifulSoup
+    from urllib3.util.retry import Retry
+
+    session = scraping_session(Retry(
         total=3,
         backoff_factor=1,
         status_forcelist=[500, 502, 503, 504]
-    )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session = requests.Session()
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
+    ))
     
     try:
         print(f"開始爬取 {days} 天的歷史開獎數據...")
@@ -372,6 +480,9 @@ def analyze_results(data, bet_numbers):
     super_matches = 0
     match_counts = {0: 0, 1: 0, 2: 0, 3: 0}
     periods_analyzed = 0
+    stars = len(set(bet_numbers))
+    payouts = odds_tables.PAYOUTS.get(stars, {})
+    total_payout = 0
     
     # 分析每一期的匹配情況
     for result in data:
@@ -380,6 +491,7 @@ def analyze_results(data, bet_numbers):
         matches = len(set(bet_numbers) & set(result['開獎號碼']))
         match_counts[matches] = match_counts.get(matches, 0) + 1
         total_matches += matches
+        total_payout += payouts.get(matches, 0)
         
         # 檢查超級獎號匹配
         if result['超級獎號'] in bet_numbers:
@@ -410,6 +522,18 @@ def analyze_results(data, bet_numbers):
         print(f"中獎率: {(win_count / periods_analyzed * 100):.2f}%")
     else:
         print("\n尚未中獎")
+    
+    # 與理論機率比較（查表，不重新計算組合數）
+    if payouts and periods_analyzed > 0:
+        print(f"\n{stars}星理論機率 vs 實際:")
+        for matches, probability in sorted(odds_tables.PROBABILITIES[stars].items()):
+            actual = match_counts.get(matches, 0) / periods_analyzed * 100
+            print(f"匹配 {matches} 個號碼: 理論 {probability * 100:.2f}% / 實際 {actual:.2f}%")
+        cost = periods_analyzed * odds_tables.BET_UNIT
+        print(f"\n每期投注 {odds_tables.BET_UNIT} 元回測：投入 {cost} 元，獎金 {total_payout} 元，"
+              f"回收 {total_payout / cost * 100:.1f}%")
+        print(f"理論期望值：每注 {odds_tables.EXPECTED_VALUE[stars]:+.2f} 元"
+              f"（回收 {(odds_tables.EXPECTED_VALUE[stars] + odds_tables.BET_UNIT) / odds_tables.BET_UNIT * 100:.1f}%）")
 
 def query_winning(data):
     """互動式中獎查詢"""
@@ -0,0 +1,402 @@
+"""多個實例共用的開獎資料快取（Redis 協定）
+
+設定 REDIS_URL 後，scrape_bingo 依序使用本行程的副本、Redis 中的資料，
+都過期時只有取得租約（SET NX PX）的實例向上游抓取，寫回 Redis 並在出現新期號時
+發布 new-draw 事件，其他實例收到後立即換上新資料。Redis 無法連線時直接向上游抓取。
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+import logging
+from collections import Counter
+from urllib.parse import unquote, urlparse
+
+from executor import current_deadline
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = os.getenv('SHARED_CACHE_PREFIX', 'bingo')
+# 快取資料視為最新的秒數，過期後由一個實例向上游更新
+CACHE_TTL = float(os.getenv('SHARED_CACHE_TTL', '30'))
+# 向上游抓取的租約秒數，持有者當掉時其他實例最多等這麼久
+LEASE_TTL = float(os.getenv('SHARED_CACHE_LEASE', '15'))
+REDIS_TIMEOUT = float(os.getenv('REDIS_TIMEOUT', '2'))
+# 衍生統計使用的最近期數
+STATS_WINDOW = 100
+# 比對後刪除：只有租約仍是自己的 token 時才刪除，在 Redis 中一次完成
+RELEASE_LEASE_SCRIPT = (
+    "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) else return 0 end"
+)
+
+
+class RedisError(Exception):
+    """Redis 無法連線或回傳錯誤"""
+
+
+def parse_redis_url(url):
+    """redis://[:密碼@]主機[:埠]/[資料庫] → (主機, 埠, 密碼, 資料庫)"""
+    parsed = urlparse(url)
+    if parsed.scheme != 'redis':
+        raise ValueError(f"不支援的 Redis 網址：{url}")
+    password = unquote(parsed.password) if parsed.password else None
+    return parsed.hostname or 'localhost', parsed.port or 6379, password, int(parsed.path.lstrip('/') or 0)
+
+
+class RedisConnection:
+    """一條 RESP 連線"""
+
+    def __init__(self, host, port, password=None, db=0, timeout=REDIS_TIMEOUT):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+        if password:
+            self.execute('AUTH', password)
+        if db:
+            self.execute('SELECT', db)
+
+    def send(self, *args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self.sock.sendall(b''.join(parts))
+
+    def read_reply(self):
+        line = self.reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError('Redis 連線已中斷')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise RedisError(rest.decode(errors='replace'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError('Redis 連線已中斷')
+            return data[:-2]
+        if kind == b'*':
+            count = int(rest)
+            return None if count < 0 else [self.read_reply() for _ in range(count)]
+        raise RedisError(f"無法解析的回應：{line[:50]!r}")
+
+    def execute(self, *args):
+        self.send(*args)
+        return self.read_reply()
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.reader.close()
+        self.sock.close()
+
+
+class RedisClient:
+    """共用一條連線的簡易用戶端，連線出錯時下次呼叫再重新連線"""
+
+    def __init__(self, url, timeout=REDIS_TIMEOUT):
+        self.host, self.port, self.password, self.db = parse_redis_url(url)
+        self.timeout = timeout
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        return RedisConnection(self.host, self.port, self.password, self.db, self.timeout)
+
+    def execute(self, *args):
+        with self._lock:
+            try:
+                if self._conn is None:
+                    self._conn = self.connect()
+                return self._conn.execute(*args)
+            except OSError as e:
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+                raise RedisError(f"Redis 連線失敗：{str(e)}") from e
+
+    def get(self, key):
+        return self.execute('GET', key)
+
+    def set(self, key, value, nx=False, px=None):
+        """寫入成功回傳 True；nx=True 且 key 已存在時回傳 False"""
+        args = ['SET', key, value]
+        if px is not None:
+            args += ['PX', int(px)]
+        if nx:
+            args.append('NX')
+        return self.execute(*args) is not None
+
+    def delete(self, *keys):
+        return self.execute('DEL', *keys)
+
+    def eval(self, script, keys=(), args=()):
+        return self.execute('EVAL', script, len(keys), *keys, *args)
+
+    def publish(self, channel, message):
+        return self.execute('PUBLISH', channel, message)
+
+    def subscribe(self, channel):
+        """回傳已訂閱 channel 的獨立連線，之後以 read_reply() 等待訊息"""
+        try:
+            conn = self.connect()
+            conn.execute('SUBSCRIBE', channel)
+        except OSError as e:
+            raise RedisError(f"Redis 連線失敗：{str(e)}") from e
+        conn.sock.settimeout(None)
+        return conn
+
+
+def derive_stats(records, window=STATS_WINDOW):
+    """最近 window 期（records 由新到舊）的號碼與超級獎號出現次數，索引即號碼"""
+    recent = records[:window]
+    number_freq = Counter()
+    super_freq = Counter()
+    for draw in recent:
+        number_freq.update(draw['開獎號碼'])
+        super_freq[draw['超級獎號']] += 1
+    return {
+        'window': len(recent),
+        'number_freq': [number_freq[n] for n in range(81)],
+        'super_freq': [super_freq[n] for n in range(81)],
+        'hot': [n for n, _ in number_freq.most_common(10)],
+    }
+
+
+def _version(payload):
+    """比較新舊：期號較大者較新，同期號時抓取時間較晚者較新"""
+    return (int(payload['latest_period']), payload['fetched_at'])
+
+
+class SharedDrawCache:
+    """跨實例共用的最新開獎資料與衍生統計"""
+
+    def __init__(self, client, ttl=CACHE_TTL, lease_ttl=LEASE_TTL, prefix=CACHE_PREFIX):
+        self.client = client
+        self.ttl = ttl
+        self.lease_ttl = lease_ttl
+        self.data_key = f"{prefix}:draws"
+        self.lease_key = f"{prefix}:lease"
+        self.channel = f"{prefix}:new-draw"
+        self._local = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._subscriber = None
+        self._counters = {
+            'local_hits': 0, 'shared_hits': 0, 'upstream_fetches': 0, 'lease_waits': 0,
+            'stale_served': 0, 'published': 0, 'new_draw_events': 0, 'redis_errors': 0,
+        }
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+
+    def _fresh(self, payload):
+        return payload is not None and time.time() - payload['fetched_at'] < self.ttl
+
+    def _payload(self, records):
+        return {
+            'fetched_at': time.time(),
+            'latest_period': max((r['期號'] for r in records), key=int),
+            'records': records,
+            'stats': derive_stats(records),
+        }
+
+    def _load(self):
+        raw = self.client.get(self.data_key)
+        return json.loads(raw) if raw else None
+
+    def add_listener(self, callback):
+        """出現新期號時以 callback(records) 通知"""
+        self._listeners.append(callback)
+
+    def _swap(self, payload):
+        """換上較新的資料，回傳是否換上了新期號"""
+        with self._lock:
+            current = self._local
+            if current is not None and _version(current) >= _version(payload):
+                return False
+            self._local = payload
+        if current is not None and current['latest_period'] == payload['latest_period']:
+            return False
+        for callback in list(self._listeners):
+            try:
+                callback(payload['records'])
+            except Exception as e:
+                logger.error(f"通知新期號失敗：{str(e)}")
+        return True
+
+    def draws(self, fetch):
+        """回傳最新開獎資料（由新到舊），需要更新時以 fetch() 向上游抓取"""
+        local = self._local
+        if self._fresh(local):
+            self._count('local_hits')
+            return local['records']
+        try:
+            shared = self._load()
+            if self._fresh(shared):
+                self._swap(shared)
+                self._count('shared_hits')
+                return shared['records']
+            token = uuid.uuid4().hex
+            if self.client.set(self.lease_key, token, nx=True, px=self.lease_ttl * 1000):
+                return self._refresh(fetch, token, shared)
+        except RedisError as e:
+            self._count('redis_errors')
+            logger.warning(f"共用快取無法使用，直接向上游抓取：{str(e)}")
+            return self._fetch_local(fetch)
+        return self._wait_for_leader(fetch, shared)
+
+    def _refresh(self, fetch, token, shared):
+        """持有租約：向上游抓取並寫回 Redis，有新期號時發布事件"""
+        self._count('upstream_fetches')
+        try:
+            records = fetch()
+            if not records:
+                stale = self._local or shared
+                return stale['records'] if stale else records
+            payload = self._payload(records)
+            # 先換上本行程的副本，收到自己發布的事件時就不會再讀一次
+            self._swap(payload)
+            try:
+                self.client.set(self.data_key, json.dumps(payload, ensure_ascii=False))
+                if shared is None or shared['latest_period'] != payload['latest_period']:
+                    self.client.publish(self.channel, payload['latest_period'])
+                    self._count('published')
+            except RedisError as e:
+                self._count('redis_errors')
+                logger.warning(f"寫入共用快取失敗：{str(e)}")
+            return records
+        finally:
+            # 租約已過期並被其他實例取得時不能刪除，比對與刪除須在 Redis 中一次完成
+            try:
+                self.client.eval(RELEASE_LEASE_SCRIPT, [self.lease_key], [token])
+            except RedisError:
+                pass
+
+    def _wait_for_leader(self, fetch, shared):
+        """其他實例正在向上游抓取：有舊資料先回傳舊資料，沒有時等待對方寫入"""
+        if shared is not None:
+            self._swap(shared)
+        stale = self._local
+        if stale is not None:
+            self._count('stale_served')
+            return stale['records']
+        self._count('lease_waits')
+        end = time.monotonic() + self.lease_ttl
+        deadline = current_deadline()
+        if deadline is not None:
+            end = min(end, time.monotonic() + deadline.remaining())
+        while time.monotonic() < end:
+            time.sleep(0.05)
+            try:
+                shared = self._load()
+            except RedisError:
+                break
+            if shared is not None:
+                self._swap(shared)
+                return shared['records']
+        logger.warning("等待其他實例更新共用快取逾時，直接向上游抓取")
+        return self._fetch_local(fetch)
+
+    def _fetch_local(self, fetch):
+        """不經 Redis 向上游抓取，結果只保留在本行程"""
+        records = fetch()
+        if records:
+            self._swap(self._payload(records))
+            return records
+        stale = self._local
+        return stale['records'] if stale else records
+
+    def _on_new_draw(self, period):
+        local = self._local
+        if local is not None and local['latest_period'] == period:
+            return
+        shared = self._load()
+        if shared is not None and self._swap(shared):
+            self._count('new_draw_events')
+            logger.info(f"共用快取收到新期號：{shared['latest_period']}")
+
+    def _listen(self):
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                self._subscriber = self.client.subscribe(self.channel)
+                backoff = 1
+                # 重新連線期間可能錯過事件，訂閱後先同步一次
+                self._on_new_draw(None)
+                while not self._stop.is_set():
+                    reply = self._subscriber.read_reply()
+                    if isinstance(reply, list) and reply[0] == b'message':
+                        self._on_new_draw(reply[2].decode())
+            except (RedisError, OSError, ValueError) as e:
+                if not self._stop.is_set():
+                    logger.warning(f"共用快取訂閱中斷，{backoff} 秒後重新連線：{str(e)}")
+            finally:
+                if self._subscriber is not None:
+                    self._subscriber.close()
+                    self._subscriber = None
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def start(self):
+        """啟動背景訂閱執行緒"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._listen, name='shared-cache-listener', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        subscriber = self._subscriber
+        if subscriber is not None:
+            subscriber.close()
+
+    def stats(self):
+        """目前資料的衍生統計，尚未載入時回傳 None"""
+        local = self._local
+        return local['stats'] if local else None
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._counters)
+        local = self._local
+        metrics.update(
+            latest_period=local['latest_period'] if local else None,
+            age_s=round(time.time() - local['fetched_at'], 1) if local else None,
+            subscribed=self._subscriber is not None,
+        )
+        return metrics
+
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """取得共用快取，未設定 REDIS_URL 時回傳 None；fork 出的行程會建立自己的連線與訂閱"""
+    global _cache, _cache_pid
+    url = os.getenv('REDIS_URL')
+    if not url:
+        return None
+    if _cache is None or _cache_pid != os.getpid():
+        with _cache_lock:
+            if _cache is None or _cache_pid != os.getpid():
+                _cache = SharedDrawCache(RedisClient(url))
+                _cache.start()
+                _cache_pid = os.getpid()
+    return _cache
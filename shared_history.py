@@ -0,0 +1,354 @@
+import mmap
+import os
+import struct
+import threading
+import time
+import logging
+from datetime import date
+from multiprocessing import shared_memory
+
+from messages import WEEKDAYS
+from number_index import NumberIndex, MAX_NUMBER, _bitset_from_positions
+
+logger = logging.getLogger(__name__)
+
+# 設定 BINGO_SHM_NAME 後，由 gunicorn master 載入歷史資料並放進共享記憶體
+# 僅支援以 /dev/shm 提供 POSIX 共享記憶體的 Linux，預設不啟用
+SHM_NAME_ENV = 'BINGO_SHM_NAME'
+REFRESH_INTERVAL = int(os.getenv('BINGO_SHM_REFRESH', '60'))
+# 讀取控制區時等待 master 寫完的最長秒數，逾時就繼續使用目前的世代
+CONTROL_TIMEOUT = float(os.getenv('BINGO_SHM_CONTROL_TIMEOUT', '0.5'))
+
+MAGIC = b'BINGOSHM'
+
+# 期號、日期序數、時、分、是否前一天、超級獎號、20 個號碼（不足補 0）
+RECORD = struct.Struct('<IIBBBB20s')
+# magic、世代、筆數、每個點陣圖的位元組數
+HEADER = struct.Struct('<8sQQQ')
+# 控制區：seqlock 序號、世代、目前資料段名稱
+CONTROL = struct.Struct('<QQ64s')
+BITSET_COUNT = (MAX_NUMBER + 1) * 2
+
+
+def pack_record(record):
+    """將一筆開獎資料打包成 32 位元組"""
+    try:
+        d = date(*(int(x) for x in record.get('日期', '')[:10].split('/')))
+        ordinal = d.toordinal()
+    except (TypeError, ValueError):
+        ordinal = 0
+    try:
+        hour, minute = (int(x) for x in record.get('時間', '').split(':'))
+    except ValueError:
+        hour = minute = 255
+    numbers = bytes(record['開獎號碼'][:20])
+    return RECORD.pack(
+        int(record['期號']), ordinal, hour, minute,
+        int(bool(record.get('是否前一天', False))), int(record['超級獎號']),
+        numbers
+    )
+
+
+def unpack_record(buf, offset=0):
+    """由 32 位元組還原成開獎資料 dict"""
+    period, ordinal, hour, minute, is_previous_day, super_number, numbers = RECORD.unpack_from(buf, offset)
+    if ordinal:
+        d = date.fromordinal(ordinal)
+        draw_date = f"{d.strftime('%Y/%m/%d')}({WEEKDAYS[d.weekday()]})"
+    else:
+        draw_date = ''
+    return {
+        '期號': str(period),
+        '開獎號碼': [n for n in numbers if n],
+        '超級獎號': super_number,
+        '時間': f"{hour:02d}:{minute:02d}" if hour != 255 else '',
+        '是否前一天': bool(is_previous_day),
+        '日期': draw_date
+    }
+
+
+class _ReadOnlySegment:
+    """以唯讀方式映射既有的共享記憶體
+
+    不透過 SharedMemory 附加，以免 worker 的 resource_tracker 註冊後在結束時刪除資料段。
+    """
+
+    def __init__(self, name):
+        fd = os.open(os.path.join('/dev/shm', name), os.O_RDONLY)
+        try:
+            self._mmap = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        self.buf = memoryview(self._mmap)
+
+    def close(self):
+        self.buf.release()
+        self._mmap.close()
+
+
+class SharedRecords:
+    """共享記憶體中的開獎資料（依開獎先後排列），讀取時才解碼"""
+
+    def __init__(self, segment, count):
+        self._segment = segment
+        self._buf = segment.buf
+        self._count = count
+        self.periods = self._buf[HEADER.size + count * RECORD.size:][:count * 4].cast('I')
+
+    def __del__(self):
+        # 舊世代不再被引用時才釋放映射
+        try:
+            self.periods.release()
+            self._segment.close()
+        except (AttributeError, BufferError):
+            pass
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return unpack_record(self._buf, HEADER.size + i * RECORD.size)
+
+    def packed(self):
+        """依開獎先後排列的原始記錄（每筆 RECORD.size 位元組）的複本"""
+        return bytes(self._buf[HEADER.size:HEADER.size + self._count * RECORD.size])
+
+    def latest(self, limit=None):
+        """最新的開獎資料（期號由大到小）"""
+        stop = 0 if limit is None else max(self._count - limit, 0)
+        return [self[i] for i in range(self._count - 1, stop - 1, -1)]
+
+
+def build_segment(name, records, generation):
+    """建立一個新的資料段並寫入開獎資料與號碼點陣圖"""
+    ordered = sorted(records, key=lambda r: int(r['期號']))
+    count = len(ordered)
+    bitset_bytes = (count + 7) // 8
+    size = HEADER.size + count * (RECORD.size + 4) + BITSET_COUNT * bitset_bytes
+    shm = shared_memory.SharedMemory(name=name, create=True, size=max(size, 1))
+    buf = shm.buf
+    number_positions = [[] for _ in range(BITSET_COUNT)]
+    offset = HEADER.size
+    for pos, record in enumerate(ordered):
+        buf[offset:offset + RECORD.size] = pack_record(record)
+        offset += RECORD.size
+        for n in record['開獎號碼']:
+            number_positions[n].append(pos)
+        number_positions[MAX_NUMBER + 1 + record['超級獎號']].append(pos)
+    struct.pack_into(f'<{count}I', buf, offset, *(int(r['期號']) for r in ordered))
+    offset += count * 4
+    for positions in number_positions:
+        buf[offset:offset + bitset_bytes] = _bitset_from_positions(positions, count).to_bytes(bitset_bytes, 'little')
+        offset += bitset_bytes
+    HEADER.pack_into(buf, 0, MAGIC, generation, count, bitset_bytes)
+    return shm
+
+
+class SharedHistoryPublisher:
+    """在 master 行程中載入資料，並以世代切換的方式發布新資料段"""
+
+    def __init__(self, name):
+        self.name = name
+        self.generation = 0
+        self._segments = []
+        try:
+            stale = shared_memory.SharedMemory(name=f"{name}_ctl")
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        self._control = shared_memory.SharedMemory(name=f"{name}_ctl", create=True, size=CONTROL.size)
+        CONTROL.pack_into(self._control.buf, 0, 0, 0, b'')
+        self._stop = threading.Event()
+        self._refresh_lock = threading.Lock()
+        self.latest_period = None
+
+    def publish(self, records):
+        """發布新世代：先寫好新資料段，再原子地切換控制區"""
+        self.generation += 1
+        segment_name = f"{self.name}_{os.getpid()}_{self.generation}"
+        shm = build_segment(segment_name, records, self.generation)
+        seq = struct.unpack_from('<Q', self._control.buf, 0)[0]
+        struct.pack_into('<Q', self._control.buf, 0, seq + 1)
+        CONTROL.pack_into(self._control.buf, 0, seq + 1, self.generation, segment_name.encode())
+        struct.pack_into('<Q', self._control.buf, 0, seq + 2)
+        self._segments.append(shm)
+        # 保留前一世代給仍在讀取的 worker，更舊的才刪除
+        while len(self._segments) > 2:
+            old = self._segments.pop(0)
+            old.close()
+            old.unlink()
+        self.latest_period = max((r['期號'] for r in records), key=int) if records else None
+        logger.info(f"發布共享歷史資料第 {self.generation} 代：{len(records)} 期")
+
+    def refresh(self, fetch):
+        """上游有新期號時才發布新世代；定期檢查與共用快取的通知可能同時呼叫"""
+        records = fetch()
+        if not records:
+            return False
+        latest = max((r['期號'] for r in records), key=int)
+        with self._refresh_lock:
+            if self.latest_period is not None and int(latest) <= int(self.latest_period):
+                return False
+            self.publish(records)
+        return True
+
+    def start(self, fetch, interval=REFRESH_INTERVAL):
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.refresh(fetch)
+                except Exception as e:
+                    logger.error(f"更新共享歷史資料失敗：{str(e)}")
+                self._stop.wait(interval)
+
+        thread = threading.Thread(target=loop, name='shared-history-publisher', daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        self._stop.set()
+        for shm in self._segments + [self._control]:
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._segments = []
+
+
+class SharedHistoryReader:
+    """worker 端：零複製附加到目前世代的資料段
+
+    開獎資料與期號陣列直接讀共享記憶體；號碼索引的點陣圖則複製成每個 worker 自己的 Python 整數
+    （見 index()）。
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._control = None
+        self._segment = None
+        self.generation = 0
+        self.records = None
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _read_control(self):
+        """回傳 (世代, 資料段名稱)；master 在更新途中停止時等到逾時，回傳 None"""
+        if self._control is None:
+            self._control = _ReadOnlySegment(f"{self.name}_ctl")
+        deadline = time.monotonic() + CONTROL_TIMEOUT
+        while True:
+            seq, generation, segment_name = CONTROL.unpack_from(self._control.buf, 0)
+            if seq % 2 == 0 and struct.unpack_from('<Q', self._control.buf, 0)[0] == seq:
+                return generation, segment_name.rstrip(b'\0').decode()
+            if time.monotonic() > deadline:
+                logger.warning(f"共享記憶體控制區 {self.name}_ctl 一直在更新中，沿用第 {self.generation} 代")
+                return None
+            time.sleep(0)
+
+    def _current(self):
+        """控制區世代改變時改附加新的資料段，回傳在鎖內一起取得的 (資料段, 開獎資料)"""
+        control = self._read_control()
+        with self._lock:
+            if control is not None:
+                generation, segment_name = control
+                if generation and generation != self.generation:
+                    segment = _ReadOnlySegment(segment_name)
+                    magic, _, count, _ = HEADER.unpack_from(segment.buf, 0)
+                    if magic != MAGIC:
+                        segment.close()
+                        raise ValueError(f"共享記憶體格式錯誤：{segment_name}")
+                    # 舊世代可能仍在其他請求中使用，不主動關閉
+                    self._segment = segment
+                    self.records = SharedRecords(segment, count)
+                    self.generation = generation
+                    self._index = None
+            return self._segment, self.records
+
+    def refresh(self):
+        """控制區世代改變時改附加新的資料段"""
+        return self._current()[1]
+
+    def latest(self, limit=None):
+        records = self.refresh()
+        return records.latest(limit) if records is not None else None
+
+    def index(self):
+        """由共享記憶體中的點陣圖建立號碼索引（開獎資料本身不複製）
+
+        位元運算需要 Python 整數，點陣圖會複製到每個 worker：每世代 162 個、各 期數/8 位元組，
+        30 萬期約 6 MB。以 benchmarks/load_test.py --shm --memory 量測 4 個 worker、30 萬期時，
+        每個 worker 的 PSS 約 70 MB（只有 147 期時約 58 MB），不使用共享記憶體時為 107-141 MB。
+        """
+        segment, records = self._current()
+        if records is None:
+            return None
+        index = self._index
+        # 快取的索引可能屬於已被切換掉的世代
+        if index is None or index.records is not records:
+            _, _, count, bitset_bytes = HEADER.unpack_from(segment.buf, 0)
+            offset = HEADER.size + count * (RECORD.size + 4)
+            bitsets = []
+            for _ in range(BITSET_COUNT):
+                bitsets.append(int.from_bytes(segment.buf[offset:offset + bitset_bytes], 'little'))
+                offset += bitset_bytes
+            index = NumberIndex()
+            index.records = records
+            index.periods = records.periods
+            index.number_bits = bitsets[:MAX_NUMBER + 1]
+            index.super_bits = bitsets[MAX_NUMBER + 1:]
+            with self._lock:
+                if self.records is records:
+                    self._index = index
+        return index
+
+
+_reader = None
+
+
+def get_shared_history():
+    """取得 worker 端的共享資料讀取器，未設定 BINGO_SHM_NAME 或尚未發布時回傳 None"""
+    global _reader
+    name = os.getenv(SHM_NAME_ENV)
+    if not name:
+        return None
+    if _reader is None:
+        _reader = SharedHistoryReader(name)
+    try:
+        if _reader.refresh() is None:
+            return None
+    except FileNotFoundError:
+        return None
+    return _reader
+
+
+def memory_usage(pid='self'):
+    """回傳行程的 RSS 與 PSS（KB），PSS 會按比例分攤共享分頁"""
+    usage = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    usage['rss_kb'] = int(line.split()[1])
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    usage['pss_kb'] = int(line.split()[1])
+    except OSError:
+        pass
+    return usage
+
+
+if __name__ == '__main__':
+    import sys
+
+    # 用法：python shared_history.py <worker pid> ...
+    for pid in sys.argv[1:]:
+        print(pid, memory_usage(pid))
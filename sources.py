@@ -0,0 +1,234 @@
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+
+from executor import Deadline, DeadlineExceeded, Rejected, current_deadline, remaining_timeout, upstream_executor
+
+logger = logging.getLogger(__name__)
+
+
+class SourceUnavailable(Exception):
+    """來源暫時不可用（斷路器開啟或回傳無效資料）"""
+
+
+def is_valid_records(records):
+    """至少要有一筆包含期號與開獎號碼的資料"""
+    return (
+        isinstance(records, list) and len(records) > 0
+        and isinstance(records[0], dict)
+        and '期號' in records[0] and '開獎號碼' in records[0]
+    )
+
+
+class CircuitBreaker:
+    """連續失敗達門檻後暫停使用該來源，冷卻後只放行一個試探請求"""
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._trial_in_flight = False
+            if self.state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logger.warning(f"斷路器開啟（連續失敗 {self.failures} 次）")
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class LatencyStats:
+    """保留最近的請求延遲，計算百分位數"""
+
+    def __init__(self, window=200):
+        self._latencies = deque(maxlen=window)
+        self.successes = 0
+        self.failures = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds, ok, error=None):
+        with self._lock:
+            self._latencies.append(seconds)
+            if ok:
+                self.successes += 1
+            else:
+                self.failures += 1
+                self.last_error = error
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            successes, failures, last_error = self.successes, self.failures, self.last_error
+
+        def pct(p):
+            if not latencies:
+                return None
+            return round(latencies[min(int(len(latencies) * p / 100), len(latencies) - 1)] * 1000, 1)
+
+        return {
+            'successes': successes,
+            'failures': failures,
+            'p50_ms': pct(50),
+            'p95_ms': pct(95),
+            'max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+            'last_error': last_error,
+        }
+
+
+def _cancelled():
+    deadline = current_deadline()
+    return deadline is not None and deadline.cancelled
+
+
+class Source:
+    """一個上游資料來源：fetch(timeout=秒數) 回傳開獎列表
+
+    partial 為 True 表示來源只有部分期數（例如只有今日的開獎），不能用於需要全部歷史的請求。
+    """
+
+    def __init__(self, name, fetch, deadline, breaker=None, validate=is_valid_records, partial=False):
+        self.name = name
+        self.fetch = fetch
+        self.deadline = deadline
+        self.breaker = breaker or CircuitBreaker()
+        self.validate = validate
+        self.partial = partial
+        self.latency = LatencyStats()
+
+    def call(self):
+        if not self.breaker.allow():
+            raise SourceUnavailable(f"{self.name} 斷路器開啟中")
+        start = time.monotonic()
+        try:
+            result = self.fetch(timeout=remaining_timeout(self.deadline))
+        except Exception as e:
+            if _cancelled():
+                # 因其他來源已回應而被取消，不算失敗
+                raise
+            self.latency.record(time.monotonic() - start, False, str(e))
+            self.breaker.record_failure()
+            raise
+        elapsed = time.monotonic() - start
+        if not self.validate(result):
+            if _cancelled():
+                raise DeadlineExceeded(f"{self.name} 已被取消")
+            self.latency.record(elapsed, False, '無效資料')
+            self.breaker.record_failure()
+            raise SourceUnavailable(f"{self.name} 回傳無效資料")
+        self.latency.record(elapsed, True)
+        self.breaker.record_success()
+        return result
+
+
+class HedgedFetcher:
+    """依序使用多個來源：前一個來源超過 hedge_after 秒未回應或失敗時啟動下一個，採用最先回來的有效結果"""
+
+    def __init__(self, sources, hedge_after=1.5, executor=None):
+        self.sources = list(sources)
+        self.hedge_after = hedge_after
+        self.executor = executor or upstream_executor
+        self.hedged = 0
+        self.wins = {source.name: 0 for source in self.sources}
+
+    def fetch(self, deadline=None, full=False):
+        """回傳第一個有效結果，全部失敗或超過 deadline 時回傳 None
+
+        full 為 True 時只使用有全部歷史的來源，不會由只有部分期數的來源回覆。
+        """
+        sources = [source for source in self.sources if not (full and source.partial)]
+        if not sources:
+            return None
+        deadline = deadline or max(source.deadline for source in sources)
+        outer = current_deadline()
+        if outer is not None:
+            deadline = min(deadline, outer.remaining())
+        end = time.monotonic() + deadline
+        waiting = list(sources)
+        pending = {}
+        next_hedge = 0.0
+
+        def launch():
+            nonlocal next_hedge
+            source = waiting.pop(0)
+            next_hedge = time.monotonic() + self.hedge_after
+            budget = min(source.deadline, end - time.monotonic())
+            try:
+                pending[self.executor.submit(source.call, deadline=Deadline(budget))] = source
+            except Rejected as e:
+                logger.warning(f"來源 {source.name} 無法排入執行緒池：{str(e)}")
+
+        try:
+            launch()
+            while pending or waiting:
+                now = time.monotonic()
+                if now >= end:
+                    break
+                if not pending:
+                    launch()
+                    continue
+                timeout = end - now
+                if waiting:
+                    timeout = min(timeout, max(next_hedge - now, 0))
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    source = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.warning(f"來源 {source.name} 失敗：{str(e)}")
+                        continue
+                    self.wins[source.name] += 1
+                    return result
+                if not done and waiting and time.monotonic() >= next_hedge:
+                    slow = ', '.join(s.name for s in pending.values())
+                    logger.info(f"{slow} 超過 {self.hedge_after} 秒未回應，同時請求 {waiting[0].name}")
+                    self.hedged += 1
+                    launch()
+            if pending:
+                logger.error(f"取得資料逾時（{deadline:.1f} 秒）")
+            return None
+        finally:
+            # 未採用的請求收到取消通知，在下一個檢查點結束
+            for future in pending:
+                future.abandon()
+
+    def stats(self):
+        return {
+            'hedged': self.hedged,
+            'sources': {
+                source.name: {
+                    'breaker': source.breaker.state,
+                    'partial': source.partial,
+                    'wins': self.wins[source.name],
+                    **source.latency.snapshot()
+                }
+                for source in self.sources
+            }
+        }
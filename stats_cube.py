@@ -0,0 +1,225 @@
+"""號碼依星期與開獎時段的出現次數：星期 × 5 分鐘時段 × 號碼的整數陣列
+
+每期開獎只需更新一格（20 個號碼與超級獎號），查詢「週四 19 點的熱門號碼」
+時加總選到的格子即可，不必掃描歷史。整份統計以 zlib 壓縮後存在 data/ 下，
+與 bingo_history.json 一起由 update_history 提交。
+"""
+import os
+import re
+import struct
+import sys
+import zlib
+import logging
+from array import array
+from datetime import date
+
+from messages import WEEKDAYS
+from shared_history import RECORD
+
+logger = logging.getLogger(__name__)
+
+STATS_CUBE_PATH = os.getenv('STATS_CUBE_PATH', os.path.join('data', 'stats_cube.bin'))
+
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOTS_PER_HOUR = 60 // SLOT_MINUTES
+NUMBERS = 81
+CELLS = 7 * SLOTS_PER_DAY
+
+MAGIC = b'BINGOCUB'
+# magic、版本、每天時段數、最新期號、總期數
+HEADER = struct.Struct('<8sHHIQ')
+VERSION = 1
+
+
+def cell_of(record):
+    """(星期, 時段)，星期一為 0；日期或時間無法解析時回傳 None"""
+    try:
+        weekday = date(*(int(x) for x in record['日期'][:10].split('/'))).weekday()
+        hour, minute = (int(x) for x in record['時間'].split(':'))
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        return None
+    return weekday, (hour * 60 + minute) // SLOT_MINUTES
+
+
+class StatsCube:
+    """各 (星期, 時段) 的開獎期數、號碼與超級獎號次數"""
+
+    def __init__(self):
+        self.counts = array('I', bytes(4 * CELLS * NUMBERS))
+        self.super_counts = array('I', bytes(4 * CELLS * NUMBERS))
+        self.draws = array('I', bytes(4 * CELLS))
+        # 已統計的總期數（含無法歸入時段的），用來確認與歷史資料一致
+        self.total = 0
+        self.latest_period = 0
+
+    def _add(self, period, cell, numbers, super_number):
+        # 日期或時間無法解析的期數只計入總期數
+        if cell is not None:
+            weekday, slot = cell
+            index = weekday * SLOTS_PER_DAY + slot
+            base = index * NUMBERS
+            counts = self.counts
+            for n in numbers:
+                counts[base + n] += 1
+            self.super_counts[base + super_number] += 1
+            self.draws[index] += 1
+        self.total += 1
+        if period > self.latest_period:
+            self.latest_period = period
+
+    def add(self, record):
+        """加入一期開獎；不檢查重複，由呼叫端保證"""
+        self._add(int(record['期號']), cell_of(record), record['開獎號碼'], record['超級獎號'])
+
+    def add_packed(self, packed):
+        """加入 shared_history.RECORD 格式打包的開獎資料"""
+        for period, ordinal, hour, minute, _, super_number, numbers in RECORD.iter_unpack(packed):
+            # date.fromordinal(1) 是星期一；號碼不足 20 個時補的 0 落在不使用的 0 號
+            cell = ((ordinal - 1) % 7, (hour * 60 + minute) // SLOT_MINUTES) if ordinal and hour < 24 else None
+            self._add(period, cell, numbers, super_number)
+
+    @classmethod
+    def from_records(cls, records):
+        cube = cls()
+        for record in records:
+            cube.add(record)
+        return cube
+
+    @classmethod
+    def from_packed(cls, packed):
+        cube = cls()
+        cube.add_packed(packed)
+        return cube
+
+    def catch_up(self, recent):
+        """由最新的開獎（期號由大到小）補上尚未統計的期數，回傳補上的期數
+
+        recent 包含目前的最新期號，或最舊的一期緊接在最新期號之後時才接得上；中間有缺口時
+        不更新並回傳 None，須重建。
+        """
+        periods = [int(r['期號']) for r in recent]
+        if not periods or periods[0] <= self.latest_period:
+            return 0
+        if self.latest_period in periods:
+            new_records = recent[:periods.index(self.latest_period)]
+        elif min(periods) == self.latest_period + 1:
+            new_records = recent
+        else:
+            return None
+        for record in reversed(new_records):
+            self.add(record)
+        return len(new_records)
+
+    def _cells(self, weekday=None, hour=None, slot=None):
+        weekdays = range(7) if weekday is None else (weekday,)
+        if slot is not None:
+            slots = (slot,)
+        elif hour is not None:
+            slots = range(hour * SLOTS_PER_HOUR, (hour + 1) * SLOTS_PER_HOUR)
+        else:
+            slots = range(SLOTS_PER_DAY)
+        return [w * SLOTS_PER_DAY + s for w in weekdays for s in slots]
+
+    def query(self, weekday=None, hour=None, slot=None, top=5):
+        """加總選到的格子：期數、每個號碼的平均次數、熱門、冷門與超級獎號熱門"""
+        counts = [0] * NUMBERS
+        super_counts = [0] * NUMBERS
+        draws = 0
+        for cell in self._cells(weekday, hour, slot):
+            if not self.draws[cell]:
+                continue
+            draws += self.draws[cell]
+            base = cell * NUMBERS
+            counts = list(map(int.__add__, counts, self.counts[base:base + NUMBERS]))
+            super_counts = list(map(int.__add__, super_counts, self.super_counts[base:base + NUMBERS]))
+        ranked = sorted(range(1, NUMBERS), key=lambda n: (-counts[n], n))
+        return {
+            'weekday': weekday,
+            'hour': hour,
+            'slot': slot,
+            'draws': draws,
+            'expected': draws * 20 / 80,
+            'hot': [(n, counts[n]) for n in ranked[:top]],
+            'cold': [(n, counts[n]) for n in reversed(ranked[-top:])],
+            'super_hot': [(n, super_counts[n]) for n in sorted(range(1, NUMBERS), key=lambda n: (-super_counts[n], n))[:3]],
+        }
+
+    def to_bytes(self):
+        arrays = [self.counts, self.super_counts, self.draws]
+        if sys.byteorder == 'big':
+            arrays = [array('I', a) for a in arrays]
+            for a in arrays:
+                a.byteswap()
+        return (HEADER.pack(MAGIC, VERSION, SLOTS_PER_DAY, self.latest_period, self.total)
+                + zlib.compress(b''.join(a.tobytes() for a in arrays)))
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, slots, latest_period, total = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION or slots != SLOTS_PER_DAY:
+            raise ValueError("統計檔格式不符")
+        body = zlib.decompress(data[HEADER.size:])
+        cube = cls()
+        size = 4 * CELLS * NUMBERS
+        if len(body) != 2 * size + 4 * CELLS:
+            raise ValueError("統計檔長度不符")
+        cube.counts = array('I', body[:size])
+        cube.super_counts = array('I', body[size:2 * size])
+        cube.draws = array('I', body[2 * size:])
+        if sys.byteorder == 'big':
+            for a in (cube.counts, cube.super_counts, cube.draws):
+                a.byteswap()
+        cube.latest_period = latest_period
+        cube.total = total
+        return cube
+
+    def save(self, path=STATS_CUBE_PATH):
+        """先寫暫存檔再取代，讀取端不會看到寫一半的檔案"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self.to_bytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=STATS_CUBE_PATH):
+        """讀取統計檔，檔案不存在或損毀時回傳 None"""
+        try:
+            with open(path, 'rb') as f:
+                return cls.from_bytes(f.read())
+        except FileNotFoundError:
+            return None
+        except (ValueError, struct.error, zlib.error) as e:
+            logger.warning(f"統計檔 {path} 無法讀取：{str(e)}")
+            return None
+
+
+def rebuild(packed):
+    """在分析行程中由全部歷史（shared_history.RECORD 格式）重建，回傳 to_bytes() 的結果
+
+    壓縮後的位元組比整個物件小得多，傳回主行程較快。
+    """
+    return StatsCube.from_packed(packed).to_bytes()
+
+
+def parse_query(text):
+    """解析「熱門 週四 19點」「熱門 四」「熱門 19:05」，回傳 (星期, 小時, 時段)，未指定的為 None"""
+    weekday = hour = slot = None
+    for token in text[len('熱門'):].split():
+        match = re.fullmatch(r'(?:星期|週|周|禮拜)?([一二三四五六日天])', token)
+        if match and weekday is None:
+            weekday = WEEKDAYS.index(match.group(1).replace('天', '日'))
+            continue
+        match = re.fullmatch(r'(\d{1,2})(?:[:：](\d{2})|點|時)?', token)
+        if match and hour is None:
+            hour = int(match.group(1))
+            minute = int(match.group(2)) if match.group(2) else None
+            if not 0 <= hour < 24 or (minute is not None and not 0 <= minute < 60):
+                raise ValueError("時間必須在 00:00 到 23:59 之間")
+            if minute is not None:
+                slot = (hour * 60 + minute) // SLOT_MINUTES
+            continue
+        raise ValueError(f"無法辨識「{token}」")
+    return weekday, hour, slot
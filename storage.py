@@ -0,0 +1,291 @@
+import os
+import sqlite3
+import threading
+import time
+import logging
+from itertools import islice
+
+from history_stream import HistoryReader
+
+logger = logging.getLogger(__name__)
+
+# 設定 BINGO_DB_PATH 後才啟用 SQLite 儲存
+DB_PATH_ENV = 'BINGO_DB_PATH'
+# 與上游同步的最短間隔（秒），開獎每 5 分鐘一次
+SYNC_INTERVAL = int(os.getenv('BINGO_DB_SYNC_INTERVAL', '60'))
+IMPORT_BATCH_SIZE = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS draws (
+    period INTEGER PRIMARY KEY,
+    draw_ts TEXT NOT NULL,
+    draw_time TEXT NOT NULL,
+    draw_date TEXT NOT NULL,
+    is_previous_day INTEGER NOT NULL,
+    super_number INTEGER NOT NULL,
+    numbers TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_draws_ts ON draws(draw_ts);
+CREATE INDEX IF NOT EXISTS idx_draws_super ON draws(super_number, period);
+CREATE TABLE IF NOT EXISTS draw_numbers (
+    number INTEGER NOT NULL,
+    period INTEGER NOT NULL,
+    PRIMARY KEY (number, period)
+) WITHOUT ROWID;
+"""
+
+# 固定 SQL 字串搭配參數綁定，sqlite3 會快取成預備語句
+INSERT_DRAW_SQL = (
+    "INSERT OR IGNORE INTO draws "
+    "(period, draw_ts, draw_time, draw_date, is_previous_day, super_number, numbers) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+INSERT_NUMBER_SQL = "INSERT OR IGNORE INTO draw_numbers (number, period) VALUES (?, ?)"
+SELECT_COLUMNS = "period, draw_time, draw_date, is_previous_day, super_number, numbers"
+LATEST_SQL = f"SELECT {SELECT_COLUMNS} FROM draws ORDER BY period DESC LIMIT ?"
+RANGE_SQL = (
+    f"SELECT {SELECT_COLUMNS} FROM draws "
+    "WHERE period BETWEEN ? AND ? ORDER BY period DESC"
+)
+EXPORT_SQL = (
+    f"SELECT {SELECT_COLUMNS} FROM draws "
+    "WHERE period BETWEEN ? AND ? AND draw_ts BETWEEN ? AND ? ORDER BY period"
+)
+TS_RANGE_SQL = (
+    f"SELECT {SELECT_COLUMNS} FROM draws "
+    "WHERE draw_ts BETWEEN ? AND ? ORDER BY period DESC"
+)
+
+
+def record_timestamp(record):
+    """由 '日期' 與 '時間' 組成可排序的時間字串"""
+    date = record.get('日期', '')[:10].replace('/', '-')
+    return f"{date} {record.get('時間', '')}".strip()
+
+
+def _record_to_row(record):
+    return (
+        int(record['期號']),
+        record_timestamp(record),
+        record.get('時間', ''),
+        record.get('日期', ''),
+        int(bool(record.get('是否前一天', False))),
+        int(record['超級獎號']),
+        ','.join(str(n) for n in record['開獎號碼'])
+    )
+
+
+def _row_to_record(row):
+    period, draw_time, draw_date, is_previous_day, super_number, numbers = row
+    return {
+        '期號': str(period),
+        '開獎號碼': [int(n) for n in numbers.split(',') if n],
+        '超級獎號': super_number,
+        '時間': draw_time,
+        '是否前一天': bool(is_previous_day),
+        '日期': draw_date
+    }
+
+
+class SQLiteStore:
+    """以 SQLite 儲存開獎資料，期號、時間與號碼皆有索引"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._sync_lock = threading.Lock()
+        self._last_sync = 0.0
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self):
+        # 每個執行緒一條連線，WAL 模式下讀寫互不阻塞
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def upsert_records(self, records):
+        """寫入開獎資料，已存在的期號會略過，回傳新增筆數"""
+        conn = self._conn()
+        with conn:
+            before = conn.total_changes
+            rows = [_record_to_row(record) for record in records]
+            conn.executemany(INSERT_DRAW_SQL, rows)
+            inserted = conn.total_changes - before
+            conn.executemany(INSERT_NUMBER_SQL, (
+                (int(n), row[0]) for row in rows for n in row[6].split(',') if n
+            ))
+        return inserted
+
+    def import_json(self, path):
+        """從 bingo_history.json 逐批匯入，不把整份檔案載入記憶體"""
+        records = HistoryReader.from_file(path).records()
+        total = 0
+        while True:
+            batch = list(islice(records, IMPORT_BATCH_SIZE))
+            if not batch:
+                break
+            total += self.upsert_records(batch)
+        logger.info(f"從 {path} 匯入 {total} 筆新資料")
+        return total
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM draws").fetchone()[0]
+
+    def latest_period(self):
+        row = self._conn().execute("SELECT MAX(period) FROM draws").fetchone()
+        return str(row[0]) if row[0] is not None else None
+
+    def latest_records(self, limit=None):
+        """取得最新的開獎資料（期號由大到小）"""
+        limit = -1 if limit is None else limit
+        return [_row_to_record(row) for row in self._conn().execute(LATEST_SQL, (limit,))]
+
+    def records_in_range(self, start_period, end_period):
+        rows = self._conn().execute(RANGE_SQL, (int(start_period), int(end_period)))
+        return [_row_to_record(row) for row in rows]
+
+    def records_between(self, start_ts, end_ts):
+        """依時間區間查詢，格式為 'YYYY-MM-DD HH:MM'"""
+        rows = self._conn().execute(TS_RANGE_SQL, (start_ts, end_ts))
+        return [_row_to_record(row) for row in rows]
+
+    def iter_records(self, start_period=None, end_period=None, start_ts=None, end_ts=None):
+        """依開獎先後逐筆產生區間內的開獎資料（不一次讀入記憶體）"""
+        rows = self._conn().execute(
+            EXPORT_SQL,
+            (
+                int(start_period) if start_period is not None else 0,
+                int(end_period) if end_period is not None else 2 ** 62,
+                start_ts or '', end_ts or '9999',
+            )
+        )
+        for row in rows:
+            yield _row_to_record(row)
+
+    def match_periods(self, numbers, start_period=None, end_period=None, min_matches=2):
+        """期號區間內至少中 min_matches 個號碼或中超級獎號的期號（由大到小）"""
+        numbers = sorted(set(int(n) for n in numbers))
+        if not numbers:
+            return []
+        start = int(start_period) if start_period is not None else 0
+        end = int(end_period) if end_period is not None else 2 ** 62
+        placeholders = ','.join('?' * len(numbers))
+        conn = self._conn()
+        periods = {row[0] for row in conn.execute(
+            f"SELECT period FROM draw_numbers "
+            f"WHERE number IN ({placeholders}) AND period BETWEEN ? AND ? "
+            f"GROUP BY period HAVING COUNT(*) >= ?",
+            (*numbers, start, end, min_matches)
+        )}
+        periods.update(row[0] for row in conn.execute(
+            f"SELECT period FROM draws "
+            f"WHERE super_number IN ({placeholders}) AND period BETWEEN ? AND ?",
+            (*numbers, start, end)
+        ))
+        return sorted(periods, reverse=True)
+
+    def records_for_periods(self, periods):
+        """依期號取得開獎資料（期號由大到小）"""
+        ordered = sorted((int(p) for p in periods), reverse=True)
+        results = []
+        conn = self._conn()
+        for i in range(0, len(ordered), 500):
+            chunk = ordered[i:i + 500]
+            rows = conn.execute(
+                f"SELECT {SELECT_COLUMNS} FROM draws "
+                f"WHERE period IN ({','.join('?' * len(chunk))}) ORDER BY period DESC",
+                chunk
+            )
+            results.extend(_row_to_record(row) for row in rows)
+        return results
+
+    def find_matches(self, numbers, start_period=None, end_period=None, min_matches=2, limit=None):
+        """回傳 (符合期數, 最新的符合開獎列表)"""
+        periods = self.match_periods(numbers, start_period, end_period, min_matches)
+        shown = periods if limit is None else periods[:limit]
+        return len(periods), self.records_for_periods(shown)
+
+    def iter_matches(self, numbers, start_period=None, end_period=None, min_matches=2, chunk_size=100):
+        """回傳 (符合期數, 由新到舊逐筆產生開獎的 generator)，開獎資料分批讀取"""
+        periods = self.match_periods(numbers, start_period, end_period, min_matches)
+
+        def generate():
+            for i in range(0, len(periods), chunk_size):
+                yield from self.records_for_periods(periods[i:i + chunk_size])
+
+        return len(periods), generate()
+
+    def sync(self, fetch, min_interval=SYNC_INTERVAL):
+        """定期由 fetch()（期號由大到小的可迭代物件）補上新期號，讀到已有的期號就停止，不必下載整份歷史"""
+        now = time.monotonic()
+        if self._last_sync and now - self._last_sync < min_interval:
+            return 0
+        if not self._sync_lock.acquire(blocking=False):
+            return 0
+        try:
+            self._last_sync = now
+            latest = int(self.latest_period() or 0)
+            new_records = []
+            # 讀到已有的期號（或資料庫還是空的）才表示新資料與現有資料相接
+            connected = not latest
+            records = fetch()
+            try:
+                for record in records or ():
+                    if int(record['期號']) <= latest:
+                        connected = True
+                        break
+                    new_records.append(record)
+            finally:
+                close = getattr(records, 'close', None)
+                if close is not None:
+                    close()
+            if not new_records:
+                return 0
+            oldest = min(int(record['期號']) for record in new_records)
+            if not connected and oldest != latest + 1:
+                # 來源只有最近的部分期數，寫入後下次同步會停在缺口前面；捨棄，下次同步再補
+                logger.warning(f"上游資料只到期號 {oldest}，接不上已有的 {latest}，捨棄這次的 {len(new_records)} 期")
+                return 0
+            inserted = self.upsert_records(new_records)
+            if inserted:
+                logger.info(f"SQLite 新增 {inserted} 筆開獎資料")
+            return inserted
+        except Exception as e:
+            logger.error(f"同步 SQLite 資料失敗：{str(e)}")
+            return 0
+        finally:
+            self._sync_lock.release()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """取得 SQLite 儲存，未設定 BINGO_DB_PATH 時回傳 None"""
+    global _store
+    path = os.getenv(DB_PATH_ENV)
+    if not path:
+        return None
+    if _store is None or _store.path != path:
+        with _store_lock:
+            if _store is None or _store.path != path:
+                _store = SQLiteStore(path)
+    return _store
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) < 2:
+        print("用法: python storage.py <bingo_history.json> [資料庫路徑]")
+        sys.exit(1)
+    db_path = sys.argv[2] if len(sys.argv) > 2 else os.getenv(DB_PATH_ENV, 'data/bingo.db')
+    store = SQLiteStore(db_path)
+    store.import_json(sys.argv[1])
+    print(f"資料庫共有 {store.count()} 期，最新期號 {store.latest_period()}")
@@ -0,0 +1,436 @@
+import heapq
+import os
+import re
+import sqlite3
+import threading
+import time
+import logging
+
+import odds_tables
+from number_index import add_bitsets, at_least, bit_bytes, positions
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTIONS_DB_PATH = os.getenv('SUBSCRIPTIONS_DB_PATH', 'data/subscriptions.db')
+MIN_STARS = 3
+MAX_STARS = 10
+MAX_SPAN = 50
+MAX_TICKETS_PER_USER = 20
+
+# N 星至少要中幾個號碼才有獎金，由獎金表推得（不含 7-10 星全不中的安慰獎）
+MIN_WIN_HITS = {
+    stars: min(hits for hits, payout in payouts.items() if payout and hits > 0)
+    for stars, payouts in odds_tables.PAYOUTS.items()
+}
+
+CHINESE_DIGITS = {'一': 1, '二': 2, '兩': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    numbers TEXT NOT NULL,
+    start_seq INTEGER NOT NULL,
+    end_seq INTEGER NOT NULL,
+    active INTEGER NOT NULL DEFAULT 1,
+    seq INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_user ON tickets(user_id, active);
+CREATE INDEX IF NOT EXISTS idx_tickets_seq ON tickets(seq);
+CREATE TABLE IF NOT EXISTS watch_state (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS notifications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticket_id INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    period TEXT NOT NULL,
+    hits INTEGER NOT NULL,
+    is_super INTEGER NOT NULL,
+    sent INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (ticket_id, period)
+);
+"""
+
+
+def parse_chinese_number(text):
+    """解析「十」「十二」「二十」「12」等期數寫法"""
+    text = text.strip()
+    if text.isdigit():
+        return int(text)
+    if '十' in text:
+        tens, _, ones = text.partition('十')
+        tens_value = CHINESE_DIGITS.get(tens, 1) if tens else 1
+        ones_value = CHINESE_DIGITS.get(ones, 0) if ones else 0
+        if (tens and tens not in CHINESE_DIGITS) or (ones and ones not in CHINESE_DIGITS):
+            raise ValueError(text)
+        return tens_value * 10 + ones_value
+    if text in CHINESE_DIGITS:
+        return CHINESE_DIGITS[text]
+    raise ValueError(text)
+
+
+def parse_subscription(text):
+    """解析「訂閱 11 22 33 十期」，回傳 (號碼列表, 期數)"""
+    body = text[len('訂閱'):].strip()
+    span = 1
+    try:
+        match = re.search(r'([0-9一二兩三四五六七八九十]+)期$', body)
+        if match:
+            span = parse_chinese_number(match.group(1))
+            body = body[:match.start()].strip()
+        numbers = [int(n) for n in body.split()]
+    except ValueError:
+        raise ValueError("請輸入有效的號碼與期數")
+    if not MIN_STARS <= len(numbers) <= MAX_STARS:
+        raise ValueError(f"請輸入{MIN_STARS}到{MAX_STARS}個號碼")
+    if len(set(numbers)) != len(numbers):
+        raise ValueError("號碼不可重複")
+    if not all(1 <= n <= 80 for n in numbers):
+        raise ValueError("號碼必須在1-80之間")
+    if not 1 <= span <= MAX_SPAN:
+        raise ValueError(f"期數必須在1-{MAX_SPAN}之間")
+    return sorted(numbers), span
+
+
+# TicketIndex.match 中每個位置的位元組 -> (中獎數, 是否中超級獎號)
+_CODE_HITS = tuple(code >> 1 for code in range(256))
+_CODE_SUPER = tuple(bool(code & 1) for code in range(256))
+
+
+class TicketIndex:
+    """以號碼為鍵的訂閱索引：每個號碼對應一個持有該號碼的訂閱點陣圖
+
+    開獎時把 20 個開獎號碼的點陣圖逐位相加，再依各訂閱的中獎門檻取出中獎者；訂閱的期數範圍
+    也以點陣圖表示。成本取決於點陣圖長度與中獎人數，而不是逐筆比對每張訂閱，中獎者的位置與資料
+    以 positions() 與依位置排列的列表一次取出。
+    """
+
+    def __init__(self):
+        self.tickets = {}          # 訂閱編號 -> (slot, user_id, numbers, start_seq, end_seq)
+        self.slot_ticket = []      # slot -> 訂閱編號（None 表示空位）
+        self.slot_user = []
+        self.slot_numbers = []
+        self.free_slots = []
+        self.number_bits = [0] * 81
+        self.threshold_bits = {hits: 0 for hits in set(MIN_WIN_HITS.values())}
+        self.active_bits = 0
+        # 還沒到 start_seq 的訂閱
+        self.waiting_bits = 0
+        self._starts = []          # (start_seq, 訂閱編號)
+        self._expiry = []          # (end_seq, 訂閱編號)
+
+    def __len__(self):
+        return len(self.tickets)
+
+    def add(self, ticket_id, user_id, numbers, start_seq, end_seq):
+        if ticket_id in self.tickets:
+            return
+        # tuple 只含整數，不會被 GC 追蹤；大量訂閱時每次產生中獎結果觸發的 GC 不必掃描它們
+        numbers = tuple(numbers)
+        slot = self.free_slots.pop() if self.free_slots else len(self.slot_ticket)
+        if slot == len(self.slot_ticket):
+            self.slot_ticket.append(ticket_id)
+            self.slot_user.append(user_id)
+            self.slot_numbers.append(numbers)
+        else:
+            self.slot_ticket[slot] = ticket_id
+            self.slot_user[slot] = user_id
+            self.slot_numbers[slot] = numbers
+        bit = 1 << slot
+        for n in numbers:
+            self.number_bits[n] |= bit
+        self.threshold_bits[MIN_WIN_HITS[len(numbers)]] |= bit
+        self.active_bits |= bit
+        self.waiting_bits |= bit
+        self.tickets[ticket_id] = (slot, user_id, numbers, start_seq, end_seq)
+        heapq.heappush(self._starts, (start_seq, ticket_id))
+        heapq.heappush(self._expiry, (end_seq, ticket_id))
+
+    def remove(self, ticket_id):
+        ticket = self.tickets.pop(ticket_id, None)
+        if ticket is None:
+            return
+        slot, _, numbers, _, _ = ticket
+        clear = ~(1 << slot)
+        for n in numbers:
+            self.number_bits[n] &= clear
+        self.threshold_bits[MIN_WIN_HITS[len(numbers)]] &= clear
+        self.active_bits &= clear
+        self.waiting_bits &= clear
+        self.slot_ticket[slot] = None
+        self.slot_user[slot] = None
+        self.slot_numbers[slot] = None
+        self.free_slots.append(slot)
+
+    def expire(self, seq):
+        """移除 end_seq <= seq 的訂閱"""
+        expired = []
+        while self._expiry and self._expiry[0][0] <= seq:
+            _, ticket_id = heapq.heappop(self._expiry)
+            if ticket_id in self.tickets and self.tickets[ticket_id][4] <= seq:
+                self.remove(ticket_id)
+                expired.append(ticket_id)
+        return expired
+
+    def _start(self, seq):
+        """start_seq <= seq 的訂閱開始參與比對"""
+        while self._starts and self._starts[0][0] <= seq:
+            _, ticket_id = heapq.heappop(self._starts)
+            ticket = self.tickets.get(ticket_id)
+            if ticket is not None:
+                self.waiting_bits &= ~(1 << ticket[0])
+
+    def match(self, draw, seq):
+        """回傳此期中獎的訂閱：[(訂閱編號, user_id, 號碼, 中獎數, 是否中超級獎號)]
+
+        中獎判定與 check_win 相同：中獎數達門檻或中超級獎號。中獎數由位元計數器分層取得，期數範圍
+        以點陣圖過濾；中獎者的位置只取一次，各自的中獎數由計數器轉成每個位置一個位元組後查出，
+        逐筆的處理都在 C 層（map、zip）。
+        """
+        # 已結束的訂閱先移除，還沒開始的留在 waiting_bits
+        self.expire(seq - 1)
+        self._start(seq)
+        live = self.active_bits & ~self.waiting_bits
+        if not live:
+            return []
+        counters = add_bitsets(self.number_bits[n] for n in draw['開獎號碼'])
+        super_bits = self.number_bits[draw['超級獎號']] & live
+        # 門檻由低到高累積：allowed 為門檻 <= hits 的訂閱
+        winners = super_bits
+        allowed = 0
+        for hits in range(1, MAX_STARS + 1):
+            allowed |= self.threshold_bits.get(hits, 0)
+            winners |= at_least(counters, hits, live) & allowed & ~at_least(counters, hits + 1, live)
+        if not winners:
+            return []
+        # 每個位置一個位元組：第 0 位為是否中超級獎號，其餘為中獎數
+        size = len(self.slot_ticket)
+        codes = int.from_bytes(bit_bytes(super_bits, size), 'little')
+        for i, counter in enumerate(counters):
+            codes += int.from_bytes(bit_bytes(counter & winners, size), 'little') << (i + 1)
+        codes = codes.to_bytes(size, 'little')
+        slots = list(positions(winners))
+        slot_codes = list(map(codes.__getitem__, slots))
+        return list(zip(
+            map(self.slot_ticket.__getitem__, slots), map(self.slot_user.__getitem__, slots),
+            map(self.slot_numbers.__getitem__, slots),
+            map(_CODE_HITS.__getitem__, slot_codes), map(_CODE_SUPER.__getitem__, slot_codes)
+        ))
+
+
+class SubscriptionStore:
+    """訂閱的持久化與開獎比對
+
+    多個 worker 共用同一個 SQLite 檔：每期由第一個搶到的 worker 比對並寫入中獎通知，
+    其他 worker 只同步訂閱異動。
+    """
+
+    def __init__(self, path=SUBSCRIPTIONS_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.index = TicketIndex()
+        self._synced_seq = 0
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+            conn.execute("INSERT OR IGNORE INTO watch_state (key, value) VALUES ('draw_seq', 0)")
+            conn.execute("INSERT OR IGNORE INTO watch_state (key, value) VALUES ('change_seq', 0)")
+            conn.execute("INSERT OR IGNORE INTO watch_state (key, value) VALUES ('last_period', 0)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _state(self, conn, key):
+        return conn.execute("SELECT value FROM watch_state WHERE key = ?", (key,)).fetchone()[0]
+
+    def _bump(self, conn, key):
+        conn.execute("UPDATE watch_state SET value = value + 1 WHERE key = ?", (key,))
+        return self._state(conn, key)
+
+    def add_ticket(self, user_id, numbers, span):
+        """新增訂閱，從下一期開始連續 span 期，回傳訂閱編號"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            count = conn.execute(
+                "SELECT COUNT(*) FROM tickets WHERE user_id = ? AND active = 1", (user_id,)
+            ).fetchone()[0]
+            if count >= MAX_TICKETS_PER_USER:
+                raise ValueError(f"每人最多訂閱 {MAX_TICKETS_PER_USER} 組")
+            start_seq = self._state(conn, 'draw_seq') + 1
+            seq = self._bump(conn, 'change_seq')
+            cursor = conn.execute(
+                "INSERT INTO tickets (user_id, numbers, start_seq, end_seq, seq, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, ','.join(map(str, numbers)), start_seq, start_seq + span - 1, seq, time.time())
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.lastrowid
+
+    def cancel(self, user_id, ticket_id=None):
+        """取消訂閱（未指定編號時取消全部），回傳取消筆數"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seq = self._bump(conn, 'change_seq')
+            if ticket_id is None:
+                cursor = conn.execute(
+                    "UPDATE tickets SET active = 0, seq = ? WHERE user_id = ? AND active = 1", (seq, user_id)
+                )
+            else:
+                cursor = conn.execute(
+                    "UPDATE tickets SET active = 0, seq = ? WHERE id = ? AND user_id = ? AND active = 1",
+                    (seq, ticket_id, user_id)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount
+
+    def user_tickets(self, user_id):
+        """使用者的有效訂閱：[(編號, 號碼, 剩餘期數)]"""
+        conn = self._conn()
+        draw_seq = self._state(conn, 'draw_seq')
+        rows = conn.execute(
+            "SELECT id, numbers, start_seq, end_seq FROM tickets "
+            "WHERE user_id = ? AND active = 1 AND end_seq > ? ORDER BY id",
+            (user_id, draw_seq)
+        )
+        return [
+            (ticket_id, [int(n) for n in numbers.split(',')], end_seq - max(start_seq - 1, draw_seq))
+            for ticket_id, numbers, start_seq, end_seq in rows
+        ]
+
+    def sync(self):
+        """把其他 worker 的訂閱異動套用到本地索引"""
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT id, user_id, numbers, start_seq, end_seq, active, seq FROM tickets "
+            "WHERE seq > ? ORDER BY seq",
+            (self._synced_seq,)
+        ).fetchall()
+        draw_seq = self._state(conn, 'draw_seq')
+        with self._lock:
+            for ticket_id, user_id, numbers, start_seq, end_seq, active, seq in rows:
+                if active and end_seq > draw_seq:
+                    self.index.add(ticket_id, user_id, [int(n) for n in numbers.split(',')], start_seq, end_seq)
+                else:
+                    self.index.remove(ticket_id)
+                self._synced_seq = max(self._synced_seq, seq)
+            self.index.expire(draw_seq)
+
+    def process_draws(self, records):
+        """比對尚未處理的新開獎（records 期號由大到小），回傳新增的中獎通知列表"""
+        if not records:
+            return []
+        conn = self._conn()
+        last_period = self._state(conn, 'last_period')
+        new_draws = sorted(
+            (r for r in records if int(r['期號']) > last_period), key=lambda r: int(r['期號'])
+        )
+        if not new_draws:
+            return []
+        if not last_period:
+            # 第一次啟動只記錄目前期號，不回頭比對歷史
+            conn.execute("UPDATE watch_state SET value = ? WHERE key = 'last_period'", (int(records[0]['期號']),))
+            return []
+        self.sync()
+        notifications = []
+        for draw in new_draws:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._state(conn, 'last_period') >= int(draw['期號']):
+                    # 已被其他 worker 處理
+                    conn.execute("ROLLBACK")
+                    continue
+                seq = self._bump(conn, 'draw_seq')
+                conn.execute("UPDATE watch_state SET value = ? WHERE key = 'last_period'", (int(draw['期號']),))
+                with self._lock:
+                    winners = self.index.match(draw, seq)
+                conn.executemany(
+                    "INSERT OR IGNORE INTO notifications (ticket_id, user_id, period, hits, is_super) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(ticket_id, user_id, draw['期號'], hits, int(is_super))
+                     for ticket_id, user_id, _, hits, is_super in winners]
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            with self._lock:
+                self.index.expire(seq)
+            notifications.extend(
+                {'ticket_id': ticket_id, 'user_id': user_id, 'numbers': numbers, 'period': draw['期號'],
+                 'hits': hits, 'is_super': is_super, 'draw': draw}
+                for ticket_id, user_id, numbers, hits, is_super in winners
+            )
+            logger.info(f"期號 {draw['期號']} 比對 {len(self.index)} 組訂閱，{len(winners)} 組中獎")
+        return notifications
+
+    def mark_sent(self, notifications):
+        self._conn().executemany(
+            "UPDATE notifications SET sent = 1 WHERE ticket_id = ? AND period = ?",
+            [(n['ticket_id'], n['period']) for n in notifications]
+        )
+
+
+class TicketWatcher:
+    """背景執行緒：定期取得開獎資料，比對訂閱並通知中獎者"""
+
+    def __init__(self, store, fetch, notify, interval=60):
+        self.store = store
+        self.fetch = fetch
+        self.notify = notify
+        self.interval = interval
+        self._stop = threading.Event()
+
+    def run_once(self):
+        notifications = self.store.process_draws(self.fetch())
+        if notifications:
+            self.notify(notifications)
+        return notifications
+
+    def start(self):
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.run_once()
+                except Exception as e:
+                    logger.error(f"比對訂閱時發生錯誤：{str(e)}")
+                self._stop.wait(self.interval)
+
+        thread = threading.Thread(target=loop, name='ticket-watcher', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_subscription_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SubscriptionStore()
+    return _store
@@ -0,0 +1,70 @@
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import standins
+from load_test import sign
+
+
+@pytest.fixture
+def history_bytes():
+    with open(os.path.join(ROOT, 'data', 'bingo_history.json'), 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def page_bytes():
+    with open(os.path.join(ROOT, 'page_source.html'), 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def line_api():
+    with standins.line_api() as server:
+        yield server
+
+
+@pytest.fixture(scope='session')
+def bot_line_api():
+    """line_bot 匯入時設定的 LINE API 替身，整個測試期間共用"""
+    with standins.line_api() as server:
+        yield server
+
+
+@pytest.fixture(scope='session')
+def line_bot(bot_line_api):
+    # 匯入時會向 LINE API 驗證 token，指向本機替身
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('LINE_API_HOST', bot_line_api.url)
+        import line_bot
+        yield line_bot
+
+
+@pytest.fixture
+def webhook(line_bot, bot_line_api):
+    """以 test client 送出簽章正確的文字訊息，回傳 (送出函式, 收到的回覆文字)"""
+    client = line_bot.app.test_client()
+    bot_line_api.requests.clear()
+
+    def post(body, headers=None):
+        response = client.post('/webhook', data=body, headers={
+            'Content-Type': 'application/json; charset=utf-8',
+            'X-Line-Signature': sign(body, line_bot.LINE_CHANNEL_SECRET),
+            **(headers or {}),
+        })
+        assert response.status_code == 200
+
+    def replies():
+        return [
+            message['text']
+            for method, path, body in bot_line_api.requests if path == '/v2/bot/message/reply'
+            for message in json.loads(body)['messages']
+        ]
+
+    return post, replies
@@ -0,0 +1,151 @@
+"""AnalyticsJobs 的結果快取、相同請求合併、排隊上限與行程池損壞後的恢復（以執行緒池在本行程執行）"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import analytics
+from analytics import AnalyticsJobs, pack_history
+from executor import Rejected
+
+
+class BreakablePool(ThreadPoolExecutor):
+    """broken 設定時 submit 的行為與損壞的行程池相同"""
+
+    def __init__(self, max_workers, broken=None):
+        super().__init__(max_workers)
+        self.broken = broken
+
+    def submit(self, fn, *args, **kwargs):
+        if self.broken == 'submit':
+            raise BrokenProcessPool('submit')
+        if self.broken == 'job':
+            def crash(*args):
+                raise BrokenProcessPool('worker died')
+            return super().submit(crash)
+        return super().submit(fn, *args, **kwargs)
+
+
+class ThreadJobs(AnalyticsJobs):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pools = []
+        self.break_next = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = BreakablePool(self.workers, self.break_next)
+            self.break_next = None
+            self.pools.append(self._pool)
+        return self._pool
+
+
+@pytest.fixture
+def jobs():
+    jobs = ThreadJobs(workers=2, max_pending=2, cache_size=2)
+    yield jobs
+    for pool in jobs.pools:
+        pool.shutdown(wait=True)
+
+
+@pytest.fixture
+def packed(history_bytes):
+    return pack_history(json.loads(history_bytes)['records'])
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    """分析 'slow' 等到 gate 放行才回傳，記錄被呼叫的參數"""
+    gate = threading.Event()
+    calls = []
+
+    def slow(packed, value):
+        calls.append(value)
+        assert gate.wait(5)
+        return value * 2
+
+    monkeypatch.setitem(analytics.ANALYSES, 'slow', slow)
+    gate.calls = calls
+    return gate
+
+
+def test_memo_hit_skips_load_and_compute(jobs, packed):
+    loads = []
+
+    def load():
+        loads.append(1)
+        return packed
+
+    first = jobs.submit('numbers', ((11, 22, 33),), '114008876', load).result(5)
+    assert first['periods'] == 147
+    again = jobs.submit('numbers', ((11, 22, 33),), '114008876', load)
+    assert again.done() and again.result() == first
+    assert len(loads) == 1
+    # 新期號使快取失效
+    jobs.submit('numbers', ((11, 22, 33),), '114008877', load).result(5)
+    assert len(loads) == 2
+    metrics = jobs.metrics()
+    assert (metrics['submitted'], metrics['memo_hits'], metrics['memo_size']) == (2, 1, 2)
+
+
+def test_memo_evicts_least_recently_used(jobs, packed):
+    for period in ('1', '2', '3'):
+        jobs.submit('frequency', (), period, lambda: packed).result(5)
+    assert jobs.metrics()['memo_size'] == 2
+    loads = []
+    jobs.submit('frequency', (), '1', lambda: loads.append(1) or packed).result(5)
+    assert loads == [1]
+
+
+def test_identical_requests_share_one_job(jobs, gate):
+    first = jobs.submit('slow', (21,), '1', lambda: b'')
+    second = jobs.submit('slow', (21,), '1', lambda: b'')
+    assert second is first
+    gate.set()
+    assert first.result(5) == 42
+    assert gate.calls == [21]
+    metrics = jobs.metrics()
+    assert (metrics['submitted'], metrics['coalesced'], metrics['queue_depth']) == (1, 1, 0)
+
+
+def test_rejected_at_max_pending(jobs, gate):
+    futures = [jobs.submit('slow', (n,), '1', lambda: b'') for n in (1, 2)]
+    with pytest.raises(Rejected):
+        jobs.submit('slow', (3,), '1', lambda: b'')
+    # 相同請求合併與快取命中不受上限影響
+    assert jobs.submit('slow', (1,), '1', lambda: b'') is futures[0]
+    gate.set()
+    assert [f.result(5) for f in futures] == [2, 4]
+    assert jobs.submit('slow', (3,), '1', lambda: b'').result(5) == 6
+    assert jobs.metrics()['rejected'] == 1
+
+
+def test_load_failure_is_not_cached(jobs, packed):
+    def broken_load():
+        raise OSError('no history')
+
+    with pytest.raises(OSError):
+        jobs.submit('frequency', (), '1', broken_load).result(5)
+    assert jobs.metrics()['queue_depth'] == 0
+    assert jobs.submit('frequency', (), '1', lambda: packed).result(5)[0]['periods'] == 30
+
+
+def test_broken_pool_on_submit_is_replaced(jobs, packed):
+    jobs.break_next = 'submit'
+    result = jobs.submit('frequency', (), '1', lambda: packed).result(5)
+    assert result[-1]['all']
+    assert len(jobs.pools) == 2
+    assert jobs.metrics()['pool_restarts'] == 1
+
+
+def test_broken_pool_while_running_is_replaced(jobs, packed):
+    jobs.break_next = 'job'
+    with pytest.raises(BrokenProcessPool):
+        jobs.submit('frequency', (), '1', lambda: packed).result(5)
+    assert jobs.metrics()['pool_restarts'] == 1
+    assert jobs.metrics()['queue_depth'] == 0
+    # 失敗不快取，下一次在新的池中重新計算
+    assert jobs.submit('frequency', (), '1', lambda: packed).result(5)[-1]['periods'] == 147
+    assert len(jobs.pools) == 2
@@ -0,0 +1,133 @@
+"""webhook 事件去重：LRU 集合的存活時間與容量、SQLite 記錄的過期覆寫，以及處理失敗時可重試"""
+
+import pytest
+
+import dedup
+from dedup import Deduplicator, SeenEvents, SQLiteSeenEvents
+from load_test import make_payload
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(dedup.time, 'monotonic', clock)
+    monkeypatch.setattr(dedup.time, 'time', clock)
+    return clock
+
+
+def test_seen_events_ttl(clock):
+    seen = SeenEvents(max_size=10, ttl=60)
+    assert seen.add('a')
+    assert not seen.add('a')
+    clock.now += 59
+    assert not seen.add('a')
+    clock.now += 1
+    # 過期後視為新事件
+    assert seen.add('a')
+    assert seen.evicted == 0
+
+
+def test_seen_events_drops_expired_before_evicting(clock):
+    seen = SeenEvents(max_size=3, ttl=60)
+    seen.add('old')
+    clock.now += 61
+    for key in ('a', 'b', 'c'):
+        assert seen.add(key)
+    assert len(seen) == 3
+    # 'old' 已過期被移除，不算淘汰
+    assert seen.evicted == 0
+
+
+def test_seen_events_lru_eviction(clock):
+    seen = SeenEvents(max_size=3, ttl=60)
+    for key in ('a', 'b', 'c'):
+        seen.add(key)
+    # 重複出現的 'a' 移到最新，容量不足時淘汰最久沒出現的 'b'
+    assert not seen.add('a')
+    assert seen.add('d')
+    assert len(seen) == 3
+    assert seen.evicted == 1
+    assert seen.add('b')
+    assert not seen.add('a')
+    seen.discard('a')
+    assert seen.add('a')
+
+
+def test_sqlite_seen_events_expiry_overwrite(clock, tmp_path):
+    seen = SQLiteSeenEvents(str(tmp_path / 'seen.db'), ttl=60, purge_interval=3600)
+    assert seen.add('a')
+    assert not seen.add('a')
+    clock.now += 60
+    # 還沒清除過期記錄，但過期的那筆可以被覆寫
+    assert len(seen) == 1
+    assert seen.add('a')
+    assert not seen.add('a')
+    assert seen._conn().execute("SELECT expires_at FROM seen_events").fetchall() == [(clock.now + 60,)]
+
+
+def test_sqlite_seen_events_shared_and_purged(clock, tmp_path):
+    path = str(tmp_path / 'seen.db')
+    first = SQLiteSeenEvents(path, ttl=60, purge_interval=10)
+    second = SQLiteSeenEvents(path, ttl=60, purge_interval=10)
+    assert first.add('a')
+    assert not second.add('a')
+    second.discard('a')
+    assert first.add('a')
+    first.add('b')
+    clock.now += 100
+    first.add('c')
+    assert len(first) == 1
+
+
+class Event:
+    def __init__(self, event_id):
+        self.webhook_event_id = event_id
+
+
+def test_once_discards_key_when_handler_fails():
+    deduplicator = Deduplicator(SeenEvents())
+    calls = []
+
+    @deduplicator.once
+    def handle(event):
+        calls.append(event.webhook_event_id)
+        if len(calls) == 1:
+            raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        handle(Event('e1'))
+    handle(Event('e1'))
+    handle(Event('e1'))
+    assert calls == ['e1', 'e1']
+    metrics = deduplicator.metrics()
+    assert (metrics['checked'], metrics['processed'], metrics['duplicates_dropped']) == (3, 1, 1)
+
+
+def test_failed_message_is_retried_on_redelivery(line_bot, webhook, monkeypatch):
+    post, replies = webhook
+    failures = []
+
+    def load_draws(count):
+        if not failures:
+            failures.append(count)
+            raise RuntimeError('upstream down')
+        return []
+
+    monkeypatch.setattr(line_bot, 'load_draws', load_draws)
+    body = make_payload('2')
+    post(body)
+    assert replies() == ["系統發生錯誤，請稍後再試"]
+    # 失敗的事件沒有留下記錄，重送時再處理一次；成功後的重送才略過
+    dropped = line_bot.deduplicator.metrics()['duplicates_dropped']
+    post(body)
+    post(body)
+    assert replies() == ["系統發生錯誤，請稍後再試", "無法獲取開獎記錄，請稍後再試"]
+    assert line_bot.deduplicator.metrics()['duplicates_dropped'] == dropped + 1
@@ -0,0 +1,99 @@
+"""推播佇列對 LINE API 替身的 retry key 與退避行為"""
+import time
+
+import pytest
+from linebot.v3.messaging import Configuration
+
+from delivery import DeliveryError, DeliveryQueue, DeliveryWorker, LineMulticastSender
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return DeliveryQueue(str(tmp_path / 'delivery.db'), max_attempts=3)
+
+
+@pytest.fixture
+def worker(queue, line_api):
+    sender = LineMulticastSender(Configuration(access_token='test-token', host=line_api.url))
+    return DeliveryWorker(queue, sender, rate=1000)
+
+
+def batches(queue):
+    return queue._conn().execute(
+        "SELECT status, attempts, next_attempt_at, retry_key, last_error FROM batches ORDER BY id"
+    ).fetchall()
+
+
+def make_due(queue):
+    queue._conn().execute("UPDATE batches SET next_attempt_at = 0 WHERE status = 'pending'")
+
+
+def test_batches_are_split_at_the_multicast_limit(queue):
+    assert queue.enqueue('job', 'hello', [f"U{i}" for i in range(1201)]) == 3
+    assert queue.enqueue('job', 'hello', ['U1']) == 0
+    assert len({row[3] for row in batches(queue)}) == 3
+
+
+def test_failed_batch_backs_off_and_retries_with_the_same_key(queue, worker, line_api):
+    line_api.state['fail_next'] = 1
+    queue.enqueue('job', 'hello', ['U1', 'U2'])
+    retry_key = batches(queue)[0][3]
+
+    started = time.time()
+    assert worker.run_once() == 1
+    status, attempts, next_attempt_at, _, last_error = batches(queue)[0]
+    assert (status, attempts) == ('pending', 1)
+    assert 'HTTP 500' in last_error
+    # 第 1 次失敗後等 2 秒，未到期前不會再送
+    assert started + 1.5 <= next_attempt_at <= time.time() + 2.5
+    assert worker.run_once() == 0
+
+    make_due(queue)
+    assert worker.run_once() == 1
+    assert batches(queue)[0][:2] == ('sent', 2)
+    assert line_api.state['accepted_keys'] == {retry_key}
+    assert line_api.state['delivered'] == ['U1', 'U2']
+    assert worker.stats.snapshot()['batches_retried'] == 1
+
+
+def test_resent_batch_after_restart_is_not_delivered_twice(queue, worker, line_api):
+    queue.enqueue('job', 'hello', ['U1'])
+    # 送出成功但在記錄結果前中斷：批次仍是送出中，租約到期後重送
+    batch_id, recipients, messages, retry_key, _ = queue.claim()[0]
+    worker.send(recipients, messages, retry_key)
+    queue._conn().execute("UPDATE batches SET next_attempt_at = 0 WHERE id = ?", (batch_id,))
+
+    assert worker.run_once() == 1
+    assert batches(queue)[0][0] == 'sent'
+    assert line_api.state['delivered'] == ['U1']
+    multicasts = [path for _, path, _ in line_api.requests if path == '/v2/bot/message/multicast']
+    assert len(multicasts) == 2
+
+
+def test_backoff_grows_and_gives_up_after_max_attempts(queue, line_api):
+    queue.enqueue('job', 'hello', ['U1'])
+    error = DeliveryError('HTTP 500', status=500)
+    delays = []
+    for attempts in (1, 2):
+        batch_id = queue.claim()[0][0]
+        before = time.time()
+        assert queue.mark_failed(batch_id, attempts, error)
+        delays.append(round(batches(queue)[0][2] - before))
+        make_due(queue)
+    assert delays == [2, 4]
+    batch_id = queue.claim()[0][0]
+    assert not queue.mark_failed(batch_id, 3, error)
+    assert batches(queue)[0][0] == 'failed'
+
+
+def test_retry_after_and_permanent_errors(queue):
+    queue.enqueue('job', 'hello', ['U1'])
+    batch_id = queue.claim()[0][0]
+    before = time.time()
+    assert queue.mark_failed(batch_id, 1, DeliveryError('HTTP 429', status=429, retry_after=30))
+    assert round(batches(queue)[0][2] - before) == 30
+
+    make_due(queue)
+    batch_id = queue.claim()[0][0]
+    assert not queue.mark_failed(batch_id, 2, DeliveryError('HTTP 400', status=400, retryable=False))
+    assert batches(queue)[0][0] == 'failed'
@@ -0,0 +1,165 @@
+"""有上限的執行緒池：fork、拒絕、期限與取消"""
+import os
+import threading
+import time
+
+import pytest
+
+from executor import (
+    BoundedExecutor, Deadline, DeadlineExceeded, Rejected, check_deadline, current_deadline, deadline_scope,
+    remaining_timeout, upstream_executor,
+)
+
+
+@pytest.fixture
+def executor():
+    executor = BoundedExecutor('test', max_workers=1, max_queue=1)
+    yield executor
+    executor._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def wait_for(condition, timeout=5):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end
+        time.sleep(0.005)
+
+
+def in_child(check):
+    """在 fork 出的子行程執行 check()，回傳是否成功"""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            ok = check()
+        except BaseException:
+            ok = False
+        os._exit(0 if ok else 1)
+    return os.waitpid(pid, 0)[1] == 0
+
+
+@pytest.mark.parametrize('executor', [
+    BoundedExecutor('forked', max_workers=2, max_queue=2),
+    upstream_executor,
+], ids=['new', 'module'])
+def test_executor_works_after_fork(executor):
+    # 父行程先啟動執行緒，子行程繼承的執行緒池沒有可用的執行緒
+    assert executor.submit(lambda: 1).result(timeout=5) == 1
+
+    def check():
+        futures = [executor.submit(lambda i=i: i) for i in range(4)]
+        results = [future.result(timeout=5) for future in futures]
+        return results == [0, 1, 2, 3] and executor.metrics()['submitted'] == 4
+
+    assert in_child(check)
+    assert executor.submit(lambda: 2).result(timeout=5) == 2
+
+
+def test_rejects_when_workers_and_queue_are_full(executor):
+    release = threading.Event()
+    running = executor.submit(release.wait)
+    queued = executor.submit(lambda: 'queued')
+    with pytest.raises(Rejected):
+        executor.submit(lambda: 'rejected')
+    assert executor.metrics()['rejected'] == 1
+    release.set()
+    assert running.result(timeout=5) and queued.result(timeout=5) == 'queued'
+    # 名額歸還後可以再送出
+    assert executor.submit(lambda: 'again').result(timeout=5) == 'again'
+    wait_for(lambda: executor.metrics()['completed'] == 3)
+
+
+def test_deadline_scope_keeps_the_earlier_deadline():
+    assert current_deadline() is None
+    with deadline_scope(0.5) as outer:
+        with deadline_scope(10) as inner:
+            assert inner is outer
+        with deadline_scope(0.1) as inner:
+            assert inner is not outer and current_deadline() is inner
+        assert current_deadline() is outer
+        assert remaining_timeout(30) <= 0.5
+    assert current_deadline() is None
+    assert remaining_timeout(30) == 30
+
+
+def test_deadline_propagates_into_pool_tasks(executor):
+    with deadline_scope(0.3) as deadline:
+        seen = executor.submit(current_deadline, deadline=Deadline(5)).result(timeout=5)
+        # call() 不超過外層期限
+        assert executor.call(lambda: current_deadline().remaining(), timeout=5) <= 0.3
+    assert seen is not None and seen is not deadline
+    assert executor.submit(current_deadline).result(timeout=5) is None
+
+
+def test_call_times_out_and_cancels_the_task(executor):
+    stopped = threading.Event()
+
+    def slow():
+        try:
+            while True:
+                check_deadline()
+                time.sleep(0.01)
+        finally:
+            stopped.set()
+
+    with pytest.raises(DeadlineExceeded):
+        executor.call(slow, timeout=0.05)
+    assert stopped.wait(5)
+    wait_for(lambda: executor.metrics()['active'] == 0)
+    metrics = executor.metrics()
+    assert metrics['timed_out'] == 1 and metrics['failed'] == 1
+
+
+def test_task_expired_in_the_queue_does_not_run(executor):
+    release = threading.Event()
+    executor.submit(release.wait)
+    ran = []
+    future = executor.submit(ran.append, 1, deadline=Deadline(0.01))
+    time.sleep(0.05)
+    release.set()
+    with pytest.raises(DeadlineExceeded):
+        future.result(timeout=5)
+    assert ran == []
+
+
+def test_abandoned_gauge(executor):
+    release = threading.Event()
+    future = executor.submit(release.wait, deadline=Deadline(5))
+    wait_for(lambda: executor.metrics()['active'] == 1)
+    future.abandon()
+    future.abandon()
+    assert future.deadline.cancelled
+    metrics = executor.metrics()
+    assert metrics['abandoned'] == 1 and metrics['abandoned_total'] == 1
+    release.set()
+    wait_for(lambda: executor.metrics()['abandoned'] == 0)
+    assert executor.metrics()['abandoned_total'] == 1
+    # 已完成的工作放棄時不計入
+    done = executor.submit(lambda: 1)
+    done.result(timeout=5)
+    wait_for(lambda: executor.metrics()['active'] == 0)
+    done.abandon()
+    assert executor.metrics()['abandoned_total'] == 1
+
+
+def test_abandoning_a_queued_task_cancels_it(executor):
+    release = threading.Event()
+    executor.submit(release.wait)
+    queued = executor.submit(lambda: 1)
+    queued.abandon()
+    assert queued.cancelled()
+    release.set()
+    wait_for(lambda: executor.metrics()['cancelled_in_queue'] == 1)
+    assert executor.metrics()['abandoned_total'] == 0
+
+
+def test_abandoned_gauge_does_not_leak_under_races(executor):
+    # 工作結束與呼叫端放棄同時發生時，計數最後都要回到 0
+    for _ in range(200):
+        future = executor.submit(lambda: None)
+        future.abandon()
+        try:
+            future.result(timeout=5)
+        except Exception:
+            pass
+    wait_for(lambda: executor.metrics()['active'] == 0)
+    assert executor.metrics()['abandoned'] == 0
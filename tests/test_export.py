@@ -0,0 +1,104 @@
+"""/export/draws 端點：以 Flask test client 經由 line_bot 取得替身伺服器上的歷史資料"""
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+import standins
+from export import CSV_HEADER
+
+
+@pytest.fixture
+def records(history_bytes):
+    # 依開獎先後排列
+    return json.loads(history_bytes)['records'][::-1]
+
+
+@pytest.fixture
+def client(line_bot, history_bytes, monkeypatch):
+    with standins.history_server(history_bytes) as history:
+        monkeypatch.setenv('HISTORY_URL', f"{history.url}/bingo_history.json")
+        for env in ('BINGO_SHM_NAME', 'BINGO_DB_PATH', 'BINGO_TIERED_DIR', 'REDIS_URL'):
+            monkeypatch.delenv(env, raising=False)
+        yield line_bot.app.test_client()
+
+
+def jsonl(body):
+    return [json.loads(line) for line in body.decode('utf-8').splitlines()]
+
+
+@pytest.mark.parametrize('query, error', [
+    ('start=abc', '期號必須是數字'),
+    ('end=-1', '期號必須是數字'),
+    ('from=2025/02/13', '日期格式必須是 YYYY-MM-DD'),
+    ('start=114008800&end=114008700', '起始期號不可大於結束期號'),
+    ('from=2025-02-14&to=2025-02-13', '起始日期不可晚於結束日期'),
+])
+def test_invalid_range_is_rejected(client, query, error):
+    response = client.get(f"/export/draws.jsonl?{query}")
+    assert response.status_code == 400
+    assert response.get_json() == {'error': error}
+
+
+def test_unknown_format(client):
+    response = client.get("/export/draws.xml")
+    assert response.status_code == 404
+
+
+def test_jsonl_full_and_period_range(client, records):
+    response = client.get("/export/draws.jsonl")
+    assert response.status_code == 200
+    assert response.content_type == 'application/x-ndjson; charset=utf-8'
+    assert jsonl(response.data) == records
+
+    response = client.get("/export/draws.jsonl?start=114008800&end=114008809")
+    assert [r['期號'] for r in jsonl(response.data)] == [str(p) for p in range(114008800, 114008810)]
+
+
+def test_date_range(client, records):
+    assert jsonl(client.get("/export/draws.jsonl?from=2025-02-13&to=2025-02-13").data) == records
+    assert client.get("/export/draws.jsonl?from=2025-02-14").data == b''
+
+
+def test_csv_body(client, records):
+    response = client.get("/export/draws.csv?start=114008875")
+    assert response.content_type == 'text/csv; charset=utf-8'
+    rows = list(csv.reader(io.StringIO(response.data.decode('utf-8'))))
+    assert rows[0] == CSV_HEADER
+    assert len(rows) == 3
+    latest = records[-1]
+    assert rows[-1] == (
+        [latest['期號'], latest['日期'], latest['時間'], '0']
+        + [str(n) for n in latest['開獎號碼']] + [str(latest['超級獎號'])]
+    )
+
+
+def test_gzip_output(client):
+    plain = client.get("/export/draws.csv")
+    compressed = client.get("/export/draws.csv", headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Encoding' not in plain.headers
+    assert gzip.decompress(compressed.data) == plain.data
+    assert len(compressed.data) < len(plain.data)
+
+
+def test_etag_not_modified(client):
+    first = client.get("/export/draws.jsonl?start=114008870")
+    etag = first.headers['ETag']
+    assert etag.startswith('"114008876-')
+
+    cached = client.get("/export/draws.jsonl?start=114008870", headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+    assert cached.headers['ETag'] == etag
+
+    # 查詢條件或壓縮不同時是不同的 ETag
+    other = client.get("/export/draws.jsonl?start=114008871", headers={'If-None-Match': etag})
+    assert other.status_code == 200
+    gzipped = client.get(
+        "/export/draws.jsonl?start=114008870", headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'}
+    )
+    assert gzipped.status_code == 200
+    assert gzipped.headers['ETag'].endswith('-gz"')
@@ -0,0 +1,60 @@
+"""GitHubCommitter 對 Git Data API 替身的提交行為"""
+import pytest
+
+import standins
+from github_commit import FileContent, GitHubCommitter, GitHubError, blob_sha
+
+
+@pytest.fixture
+def github():
+    files = {'data/bingo_history.json': b'{"records": []}', 'README.md': b'hi'}
+    with standins.github_api(files, repo='me/bingo') as server:
+        yield server
+
+
+@pytest.fixture
+def committer(github):
+    return GitHubCommitter('me/bingo', 'test-token', branch='main', api_url=github.url)
+
+
+def writes(github):
+    return [(method, path) for method, path, _ in github.requests if method != 'GET']
+
+
+def test_identical_content_makes_no_commit(github, committer):
+    head = github.state['refs']['main']
+    assert committer.commit_files({'data/bingo_history.json': '{"records": []}', 'README.md': b'hi'}, 'same') is None
+    assert github.state['refs']['main'] == head
+    assert writes(github) == []
+
+
+def test_changed_blob_advances_the_ref(github, committer):
+    head = github.state['refs']['main']
+    sha = committer.commit_files({'data/bingo_history.json': '{"records": [1]}', 'README.md': b'hi'}, 'update')
+    assert sha is not None and sha != head
+    assert github.state['refs']['main'] == sha
+    # 只上傳改變的檔案
+    assert [path for method, path in writes(github) if path.endswith('git/blobs')] == ['/repos/me/bingo/git/blobs']
+    files = standins.github_files(github)
+    assert files['data/bingo_history.json'] == b'{"records": [1]}'
+    assert files['README.md'] == b'hi'
+
+
+def test_file_content_is_streamed_and_binary_safe(github, committer, tmp_path):
+    path = tmp_path / 'b.bin'
+    path.write_bytes(bytes(range(256)) * 5000)
+    content = FileContent(str(path))
+    assert content.blob_sha() == blob_sha(path.read_bytes())
+    assert committer.commit_files({'data/sub/b.bin': content}, 'binary') is not None
+    assert standins.github_files(github)['data/sub/b.bin'] == path.read_bytes()
+    assert committer.commit_files({'data/sub/b.bin': content}, 'again') is None
+
+
+def test_stale_head_is_not_forced(github, committer):
+    head = committer.head()
+    committer.commit_files({'README.md': 'one'}, 'one')
+    committer.head = lambda: head
+    with pytest.raises(GitHubError) as e:
+        committer.commit_files({'README.md': 'two'}, 'two')
+    assert e.value.status == 422
+    assert standins.github_files(github)['README.md'] == b'one'
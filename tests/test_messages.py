@@ -0,0 +1,64 @@
+"""ReplyBuilder 拆出的訊息不超過 LINE 的字數與則數上限"""
+import random
+
+import pytest
+
+from messages import (
+    MAX_REPLY_MESSAGES, TEXT_LIMIT, ReplyBuilder, build_matches_reply, text_length, truncate_text
+)
+
+FOOTER = "\n💡 共找到 1234 筆匹配記錄"
+
+
+def check(messages):
+    assert 1 <= len(messages) <= MAX_REPLY_MESSAGES
+    for message in messages:
+        assert text_length(message) <= TEXT_LIMIT
+
+
+@pytest.mark.parametrize('count', [1, 10, 49, 50, 51, 99, 100, 249, 250, 251, 1000])
+def test_short_chunks_fit_with_footer(count):
+    builder = ReplyBuilder("🎯 查詢結果\n", FOOTER)
+    messages = builder.build(('x' * 100 for _ in range(count)), count)
+    check(messages)
+    assert messages[-1].endswith(FOOTER)
+
+
+def test_footer_that_does_not_fit_starts_a_new_message():
+    # 頁尾加上 50 個 100 字的項目剛好超過一則
+    messages = ReplyBuilder('', FOOTER).build(['x' * 100] * 50, 50)
+    check(messages)
+    assert messages == ['x' * 5000, FOOTER]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_mixed_chunks(seed):
+    rng = random.Random(seed)
+    chunks = [
+        rng.choice(['a', '號', '🎉']) * rng.choice([1, 50, 700, 2600, 4990, 6000])
+        for _ in range(rng.randint(1, 40))
+    ]
+    builder = ReplyBuilder("🎯 查詢結果\n" * rng.randint(0, 3), FOOTER * rng.randint(0, 3))
+    messages = builder.build(iter(chunks), len(chunks))
+    check(messages)
+    assert messages[-1].endswith(builder.footer)
+
+
+def test_long_chunk_is_truncated_by_utf16_length():
+    messages = ReplyBuilder('', FOOTER).build(['🎉' * 4000], 1)
+    check(messages)
+    assert set(messages[0][:-len(FOOTER)]) == {'🎉'}
+
+
+def test_truncate_text_does_not_split_surrogate_pairs():
+    assert truncate_text('a🎉b', 2) == 'a'
+    assert truncate_text('a🎉b', 3) == 'a🎉'
+    assert text_length(truncate_text('🎉' * 10, 7)) == 6
+
+
+def test_remaining_count_when_results_do_not_fit():
+    matches = ({'期號': str(i), '時間': '07:05', '匹配數字': {1, 2}, '超級獎號': False} for i in range(2000))
+    messages = build_matches_reply("🎯 查詢結果", matches, FOOTER, 2000)
+    check(messages)
+    assert len(messages) == MAX_REPLY_MESSAGES
+    assert "筆未顯示" in messages[-1]
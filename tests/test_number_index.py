@@ -0,0 +1,115 @@
+"""號碼點陣圖索引與逐筆掃描的結果一致"""
+import json
+import random
+
+import pytest
+
+import number_index
+from number_index import (
+    NumberIndex, add_bitsets, at_least, bit_bytes, index_for, iter_positions_desc, positions
+)
+
+
+@pytest.fixture
+def records(history_bytes):
+    # 期號由大到小
+    return json.loads(history_bytes)['records']
+
+
+@pytest.fixture(autouse=True)
+def fresh_index(monkeypatch):
+    monkeypatch.setattr(number_index, '_index', None)
+
+
+def scan(records, numbers, min_matches=2, start=None, end=None):
+    return [
+        r for r in records
+        if (start is None or int(r['期號']) >= int(start)) and (end is None or int(r['期號']) <= int(end))
+        and (len(set(numbers) & set(r['開獎號碼'])) >= min_matches or r['超級獎號'] in numbers)
+    ]
+
+
+def test_positions_and_bit_bytes():
+    rng = random.Random(11)
+    assert list(positions(0)) == []
+    assert bit_bytes(0, 3) == b'\x00\x00\x00'
+    for _ in range(50):
+        bits = rng.getrandbits(rng.randint(1, 500))
+        expected = [pos for pos in range(bits.bit_length()) if bits >> pos & 1]
+        assert list(positions(bits)) == expected
+        size = bits.bit_length() + 5
+        assert bit_bytes(bits, size) == bytes(bits >> pos & 1 for pos in range(size))
+
+
+def test_at_least_counts_hits_per_position():
+    rng = random.Random(7)
+    size = 300
+    mask = (1 << size) - 1
+    for _ in range(50):
+        bitsets = [rng.getrandbits(size) for _ in range(rng.randint(1, 10))]
+        counters = add_bitsets(bitsets)
+        hits = [sum(bits >> pos & 1 for bits in bitsets) for pos in range(size)]
+        for k in range(0, len(bitsets) + 2):
+            expected = sum(1 << pos for pos in range(size) if hits[pos] >= k)
+            assert at_least(counters, k, mask) == expected
+
+
+def test_iter_positions_desc():
+    bits = (1 << 200) | (1 << 64) | (1 << 63) | 1
+    assert list(iter_positions_desc(bits)) == [200, 64, 63, 0]
+    assert list(iter_positions_desc(bits, limit=2)) == [200, 64]
+    assert list(iter_positions_desc(0)) == []
+
+
+@pytest.mark.parametrize('numbers, min_matches', [((11, 22, 33), 2), ((1, 2, 3, 4, 5), 3), ((80,), 1)])
+def test_iter_matches_agrees_with_a_scan(records, numbers, min_matches):
+    index = NumberIndex(records)
+    total, draws = index.iter_matches(numbers, min_matches)
+    expected = scan(records, numbers, min_matches)
+    assert total == len(expected)
+    assert list(draws) == expected
+
+
+@pytest.mark.parametrize('start, end', [
+    (10, 50),        # 兩端都包含
+    (0, 0),          # 只有一期
+    (None, 20),
+    (100, None),
+])
+def test_iter_matches_period_bounds(records, start, end):
+    index = NumberIndex(records)
+    oldest = int(records[-1]['期號'])
+    start = oldest + start if start is not None else None
+    end = oldest + end if end is not None else None
+    total, draws = index.iter_matches((11, 22, 33, 44), 1, start, end)
+    expected = scan(records, (11, 22, 33, 44), 1, start, end)
+    assert total == len(expected) and list(draws) == expected
+
+
+def test_iter_matches_outside_the_history(records):
+    index = NumberIndex(records)
+    latest, oldest = int(records[0]['期號']), int(records[-1]['期號'])
+    assert index.count_matches((1, 2), 0, latest + 1, latest + 10) == 0
+    assert index.count_matches((1, 2), 0, oldest - 10, oldest - 1) == 0
+    assert index.count_matches((1, 2), 0, latest, oldest) == 0
+    assert index.count_matches((1, 2), 0, oldest - 10, latest + 10) == len(records)
+
+
+def test_index_for_extends_with_new_draws(records):
+    index = index_for(records[5:])
+    assert index_for(records) is index
+    assert index.size == len(records) and index.latest_period == records[0]['期號']
+    assert list(index.iter_matches((7, 8, 9))[1]) == scan(records, (7, 8, 9))
+
+
+def test_index_for_rebuilds_when_history_does_not_connect(records):
+    index = index_for(records[10:])
+    # 較舊的部分少了兩期，新資料的位置接不上索引的最新一期
+    data = records[:12] + records[14:]
+    rebuilt = index_for(data)
+    assert rebuilt is not index
+    assert rebuilt.size == len(data)
+    assert list(rebuilt.iter_matches((7, 8, 9))[1]) == scan(data, (7, 8, 9))
+    # 較短的資料同樣重建
+    assert index_for(records[:20]).size == 20
+    assert index_for([]).size == 0
@@ -0,0 +1,84 @@
+"""按需效能分析：只有正確的 X-Profile token 或管理員指令才會啟動"""
+import json
+import os
+
+import pytest
+
+from load_test import make_payload
+from profiler import RequestProfiler
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    return RequestProfiler(directory=str(tmp_path), admins={'Uadmin'}, token='s3cret')
+
+
+def run(profiler, header):
+    with profiler.requested(header), profiler.profile('handle_message'):
+        sum(range(1000))
+    return profiler.metrics()['profiled']
+
+
+@pytest.mark.parametrize('header', [None, '', 'wrong', 's3cre', 's3cret ', '祕密'])
+def test_wrong_token_does_not_profile(profiler, header):
+    assert run(profiler, header) == 0
+
+
+def test_no_token_configured_ignores_header(tmp_path):
+    profiler = RequestProfiler(directory=str(tmp_path), token='')
+    assert run(profiler, '') == 0
+    assert run(profiler, 'anything') == 0
+
+
+def test_correct_token_profiles_one_request(profiler, tmp_path):
+    assert run(profiler, 's3cret') == 1
+    assert sorted(name.rsplit('.', 1)[1] for name in os.listdir(tmp_path)) == ['prof', 'txt']
+    # 只分析帶標頭的那個請求
+    assert run(profiler, None) == 1
+
+
+def test_arm_limits_samples(profiler):
+    assert profiler.is_admin('Uadmin') and not profiler.is_admin('Uother')
+    assert profiler.arm(100) == profiler.max_samples
+    profiler.arm(2)
+    assert [run(profiler, None) for _ in range(3)] == [1, 2, 2]
+
+
+@pytest.fixture
+def bot_profiler(line_bot, tmp_path, monkeypatch):
+    profiler = line_bot.profiler
+    monkeypatch.setattr(profiler, 'directory', str(tmp_path))
+    monkeypatch.setattr(profiler, 'admins', {'Uadmin'})
+    monkeypatch.setattr(profiler, 'token', 's3cret')
+    monkeypatch.setattr(profiler, '_remaining', 0)
+    monkeypatch.setattr(profiler, '_counters', {'profiled': 0, 'skipped_busy': 0, 'write_errors': 0})
+    monkeypatch.setattr(line_bot, 'load_draws', lambda count: [])
+    return profiler
+
+
+def payload_from(user_id, text):
+    body = json.loads(make_payload(text))
+    body['events'][0]['source']['userId'] = user_id
+    return json.dumps(body, ensure_ascii=False).encode('utf-8')
+
+
+def test_non_admin_command_does_not_arm(bot_profiler, webhook):
+    post, replies = webhook
+    post(payload_from('Uother', '效能分析 5'))
+    assert bot_profiler.metrics()['remaining'] == 0
+    assert replies() == []
+
+    post(payload_from('Uadmin', '效能分析 5'))
+    assert bot_profiler.metrics()['remaining'] == 5
+    assert replies()[0].startswith("接下來 5 個請求會記錄效能分析")
+
+
+def test_webhook_profile_header(bot_profiler, webhook, tmp_path):
+    post, _ = webhook
+    post(make_payload('2'), {'X-Profile': 'wrong'})
+    assert bot_profiler.metrics()['profiled'] == 0
+    assert os.listdir(tmp_path) == []
+
+    post(make_payload('2'), {'X-Profile': 's3cret'})
+    assert bot_profiler.metrics()['profiled'] == 1
+    assert len(os.listdir(tmp_path)) == 2
@@ -0,0 +1,169 @@
+"""SharedDrawCache 對 Redis 替身的租約、過期資料與新期號事件"""
+import json
+import threading
+import time
+
+import pytest
+
+import shared_cache
+import standins
+from shared_cache import RedisClient, SharedDrawCache
+
+
+@pytest.fixture
+def redis():
+    with standins.redis_server() as server:
+        yield server
+
+
+@pytest.fixture
+def records(history_bytes):
+    return json.loads(history_bytes)['records']
+
+
+@pytest.fixture
+def caches(redis):
+    """建立連到同一個 Redis 的快取（各自一條連線，模擬不同實例），結束時停止訂閱"""
+    created = []
+
+    def make(**kwargs):
+        cache = SharedDrawCache(RedisClient(redis.url), **kwargs)
+        created.append(cache)
+        return cache
+
+    yield make
+    for cache in created:
+        cache.stop()
+
+
+class Upstream:
+    """計數的上游：依序回傳 results 中的資料，gate 設定時等它放行"""
+
+    def __init__(self, *results, gate=None):
+        self.results = list(results)
+        self.gate = gate
+        self.calls = 0
+        self.started = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        if self.gate is not None:
+            assert self.gate.wait(5)
+        return self.results[min(self.calls, len(self.results)) - 1]
+
+
+def wait_for(predicate, timeout=5):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_standin_supports_release_script():
+    assert shared_cache.RELEASE_LEASE_SCRIPT in standins.REDIS_SCRIPTS
+
+
+def test_refresh_releases_own_lease(redis, caches, records):
+    cache = caches()
+    upstream = Upstream(records)
+    assert cache.draws(upstream) == records
+    assert upstream.calls == 1
+    assert cache.lease_key.encode() not in redis.state['data']
+    assert ('EVAL', shared_cache.RELEASE_LEASE_SCRIPT, b'') in redis.requests
+    assert not [r for r in redis.requests if r[0] == 'DEL']
+    # 之後由本行程的副本回覆
+    assert cache.draws(upstream) == records
+    assert upstream.calls == 1
+    assert cache.metrics()['local_hits'] == 1
+
+
+def test_expired_lease_taken_by_another_instance_is_kept(redis, caches, records):
+    cache = caches(lease_ttl=0.05)
+    other = RedisClient(redis.url)
+
+    def slow_fetch():
+        # 抓取比租約久，其他實例在租約過期後取得新租約
+        time.sleep(0.1)
+        assert other.set(cache.lease_key, 'other-token', nx=True, px=10000)
+        return records
+
+    assert cache.draws(slow_fetch) == records
+    assert other.get(cache.lease_key) == b'other-token'
+
+
+def test_lease_contention_single_upstream_fetch(caches, records):
+    gate = threading.Event()
+    leader_upstream = Upstream(records, gate=gate)
+    follower_upstream = Upstream(records)
+    leader = caches()
+    follower = caches()
+    results = {}
+    thread = threading.Thread(target=lambda: results.setdefault('leader', leader.draws(leader_upstream)))
+    thread.start()
+    assert leader_upstream.started.wait(5)
+
+    # 租約在 leader 手上，沒有舊資料的 follower 等待 leader 寫入
+    waiter = threading.Thread(target=lambda: results.setdefault('follower', follower.draws(follower_upstream)))
+    waiter.start()
+    assert wait_for(lambda: follower.metrics()['lease_waits'] == 1)
+    gate.set()
+    thread.join(5)
+    waiter.join(5)
+    assert results == {'leader': records, 'follower': records}
+    assert (leader_upstream.calls, follower_upstream.calls) == (1, 0)
+    assert leader.metrics()['upstream_fetches'] == 1
+
+
+def test_stale_data_served_while_other_instance_refreshes(redis, caches, records):
+    older = records[1:]
+    cache = caches(ttl=0.05)
+    upstream = Upstream(older, records)
+    assert cache.draws(upstream) == older
+    time.sleep(0.06)
+
+    other = RedisClient(redis.url)
+    assert other.set(cache.lease_key, 'other-token', nx=True, px=10000)
+    # 資料已過期但租約在其他實例：先回傳舊資料，不向上游抓取
+    assert cache.draws(upstream) == older
+    assert upstream.calls == 1
+    assert cache.metrics()['stale_served'] == 1
+
+    other.delete(cache.lease_key)
+    assert cache.draws(upstream) == records
+    assert upstream.calls == 2
+
+
+def test_new_draw_event_updates_other_instances(caches, records):
+    older = records[1:]
+    publisher = caches(ttl=0)
+    subscriber = caches()
+    notified = []
+    subscriber.add_listener(notified.append)
+    subscriber.start()
+    assert wait_for(lambda: subscriber.metrics()['subscribed'])
+
+    upstream = Upstream(older, records)
+    assert publisher.draws(upstream) == older
+    assert wait_for(lambda: subscriber.metrics()['new_draw_events'] == 1)
+    assert subscriber.draws(Upstream()) == older
+
+    # 新期號寫入 Redis 並發布事件，訂閱者不必等到過期就換上新資料
+    assert publisher.draws(upstream) == records
+    assert wait_for(lambda: subscriber.metrics()['new_draw_events'] == 2)
+    assert subscriber.draws(Upstream()) == records
+    assert subscriber.metrics()['local_hits'] == 2
+    assert subscriber.metrics()['latest_period'] == records[0]['期號']
+    assert [r[0]['期號'] for r in notified] == [older[0]['期號'], records[0]['期號']]
+    assert publisher.metrics()['published'] == 2
+
+
+def test_redis_down_falls_back_to_upstream(records):
+    with standins.redis_server() as server:
+        url = server.url
+    cache = SharedDrawCache(RedisClient(url, timeout=0.5))
+    upstream = Upstream(records)
+    assert cache.draws(upstream) == records
+    assert cache.metrics()['redis_errors'] == 1
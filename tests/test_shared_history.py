@@ -0,0 +1,88 @@
+"""共享記憶體中的開獎資料：世代切換、seqlock 與 worker 端的讀取"""
+import json
+import struct
+import time
+import uuid
+
+import pytest
+
+import shared_history
+from number_index import NumberIndex
+from shared_history import SharedHistoryPublisher, SharedHistoryReader, pack_record, unpack_record
+
+
+@pytest.fixture
+def records(history_bytes):
+    # 期號由大到小
+    return json.loads(history_bytes)['records']
+
+
+@pytest.fixture
+def publisher():
+    publisher = SharedHistoryPublisher(f"bingotest_{uuid.uuid4().hex[:8]}")
+    yield publisher
+    publisher.close()
+
+
+def test_pack_round_trip(records):
+    for record in records[:20]:
+        assert unpack_record(pack_record(record)) == record
+
+
+def test_reader_sees_the_published_draws(publisher, records):
+    reader = SharedHistoryReader(publisher.name)
+    assert publisher.refresh(lambda: records[10:]) is True
+    assert reader.latest(3) == records[10:13]
+    assert reader.latest() == records[10:]
+    assert list(reader.records.periods) == sorted(int(r['期號']) for r in records[10:])
+    # 沒有新期號時不發布新世代
+    assert publisher.refresh(lambda: records[12:]) is False
+    assert publisher.generation == 1
+
+
+def test_index_matches_a_private_index(publisher, records):
+    publisher.publish(records)
+    reader = SharedHistoryReader(publisher.name)
+    expected = NumberIndex(records)
+    for numbers in [(11, 22, 33), (1, 2, 3, 4), (80,)]:
+        total, draws = reader.index().iter_matches(numbers, 2, records[100]['期號'], records[5]['期號'])
+        want_total, want = expected.iter_matches(numbers, 2, records[100]['期號'], records[5]['期號'])
+        assert total == want_total and list(draws) == list(want)
+
+
+def test_generation_swap(publisher, records):
+    publisher.publish(records[10:])
+    reader = SharedHistoryReader(publisher.name)
+    old_records, old_index = reader.refresh(), reader.index()
+    assert reader.index() is old_index
+    publisher.publish(records)
+    new_records = reader.refresh()
+    assert reader.generation == 2 and new_records is not old_records
+    index = reader.index()
+    assert index is not old_index and index.records is new_records
+    assert index.size == len(records)
+    # 進行中的請求仍可讀取前一世代
+    assert old_records.latest(1) == records[10:11]
+    assert old_index.count_matches((11, 22, 33)) == NumberIndex(records[10:]).count_matches((11, 22, 33))
+
+
+def test_stuck_writer_times_out(publisher, records, monkeypatch):
+    monkeypatch.setattr(shared_history, 'CONTROL_TIMEOUT', 0.05)
+    publisher.publish(records)
+    reader = SharedHistoryReader(publisher.name)
+    current = reader.refresh()
+    # master 在更新控制區途中停止：序號停在奇數
+    seq = struct.unpack_from('<Q', publisher._control.buf, 0)[0]
+    struct.pack_into('<Q', publisher._control.buf, 0, seq + 1)
+    started = time.monotonic()
+    assert reader.refresh() is current
+    assert time.monotonic() - started < 1
+    assert SharedHistoryReader(publisher.name).refresh() is None
+
+
+def test_get_shared_history_without_a_publisher(monkeypatch):
+    monkeypatch.setattr(shared_history, '_reader', None)
+    monkeypatch.delenv(shared_history.SHM_NAME_ENV, raising=False)
+    assert shared_history.get_shared_history() is None
+    monkeypatch.setenv(shared_history.SHM_NAME_ENV, f"bingotest_missing_{uuid.uuid4().hex[:8]}")
+    assert shared_history.get_shared_history() is None
@@ -0,0 +1,109 @@
+"""HedgedFetcher 對本機替身伺服器的逾時、失敗與斷路器行為"""
+import time
+
+import pytest
+
+import standins
+import scraper
+from sources import CircuitBreaker, HedgedFetcher, Source, SourceUnavailable
+
+
+@pytest.fixture
+def upstream(monkeypatch, history_bytes, page_bytes):
+    """GitHub raw 與開獎網站的替身，回傳 (github, pilio)"""
+    with standins.history_server(history_bytes) as github, standins.pilio_server(page_bytes) as pilio:
+        monkeypatch.setenv('HISTORY_URL', f"{github.url}/bingo_history.json")
+        monkeypatch.setenv('PILIO_URL', f"{pilio.url}/list.asp")
+        yield github, pilio
+
+
+def make_fetcher(hedge_after=0.2, deadline=2.0, failure_threshold=3):
+    return HedgedFetcher(
+        [
+            Source('github', scraper.get_history_from_github, deadline,
+                   CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=60)),
+            Source('pilio', scraper.scrape_pilio, deadline, partial=True),
+        ],
+        hedge_after=hedge_after
+    )
+
+
+def test_fast_primary_answers_without_hedging(upstream):
+    github, pilio = upstream
+    fetcher = make_fetcher()
+    records = fetcher.fetch()
+    assert len(records) == 147
+    assert fetcher.hedged == 0
+    assert pilio.requests == []
+
+
+def test_slow_primary_is_hedged_for_latest_draws(upstream):
+    github, pilio = upstream
+    github.state['latency'] = 1.0
+    fetcher = make_fetcher()
+    started = time.monotonic()
+    records = fetcher.fetch()
+    assert time.monotonic() - started < 1.0
+    assert fetcher.hedged == 1
+    assert fetcher.wins['pilio'] == 1
+    assert 0 < len(records) < 147
+
+
+def test_full_history_waits_for_the_complete_source(upstream):
+    github, pilio = upstream
+    github.state['latency'] = 0.6
+    fetcher = make_fetcher()
+    records = fetcher.fetch(full=True)
+    assert len(records) == 147
+    assert fetcher.hedged == 0
+    assert pilio.requests == []
+
+
+def test_full_history_times_out_instead_of_using_partial_source(upstream):
+    github, pilio = upstream
+    github.state['latency'] = 2.0
+    fetcher = make_fetcher(deadline=0.5)
+    assert fetcher.fetch(full=True) is None
+    assert pilio.requests == []
+
+
+def test_failed_primary_falls_back_only_for_latest_draws(upstream):
+    github, pilio = upstream
+    github.state['status'] = 500
+    fetcher = make_fetcher()
+    assert fetcher.fetch(full=True) is None
+    records = fetcher.fetch()
+    assert 0 < len(records) < 147
+    assert fetcher.wins == {'github': 0, 'pilio': 1}
+    assert fetcher.sources[0].latency.snapshot()['failures'] == 2
+
+
+def test_open_circuit_skips_the_primary(upstream):
+    github, pilio = upstream
+    github.state['status'] = 500
+    fetcher = make_fetcher(failure_threshold=2)
+    for _ in range(2):
+        assert fetcher.fetch(full=True) is None
+    assert fetcher.sources[0].breaker.state == 'open'
+    calls = len(github.requests)
+
+    with pytest.raises(SourceUnavailable):
+        fetcher.sources[0].call()
+    # 斷路器開啟時不再向 GitHub 發出請求，最新開獎直接由網站取得
+    records = fetcher.fetch()
+    assert len(github.requests) == calls
+    assert 0 < len(records) < 147
+    assert fetcher.fetch(full=True) is None
+
+
+def test_half_open_trial_closes_the_circuit(upstream):
+    github, pilio = upstream
+    github.state['status'] = 500
+    fetcher = make_fetcher(failure_threshold=1)
+    assert fetcher.fetch(full=True) is None
+    breaker = fetcher.sources[0].breaker
+    assert breaker.state == 'open'
+    github.state['status'] = 200
+    breaker.reset_timeout = 0
+    assert len(fetcher.fetch(full=True)) == 147
+    assert breaker.state == 'closed'
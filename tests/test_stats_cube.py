@@ -0,0 +1,148 @@
+"""星期與時段統計：補上新期數、打包資料的星期對應、序列化與查詢解析，以及重建不在請求中執行"""
+import json
+from concurrent.futures import Future
+
+import pytest
+
+import stats_cube
+from analytics import pack_history
+from stats_cube import SLOTS_PER_DAY, StatsCube, cell_of, parse_query
+
+
+@pytest.fixture
+def records(history_bytes):
+    # 期號由大到小
+    return json.loads(history_bytes)['records']
+
+
+def draw(period, day='2025/02/13(四)', time='19:15'):
+    return {'期號': str(period), '日期': day, '時間': time, '開獎號碼': list(range(1, 21)), '超級獎號': 1}
+
+
+def cube_at(period):
+    cube = StatsCube()
+    cube.add(draw(period))
+    return cube
+
+
+def test_catch_up_from_recent_containing_latest():
+    cube = cube_at(100)
+    assert cube.catch_up([draw(p) for p in (103, 102, 101, 100, 99)]) == 3
+    assert (cube.latest_period, cube.total) == (103, 4)
+
+
+def test_catch_up_when_recent_starts_right_after_latest():
+    cube = cube_at(100)
+    assert cube.catch_up([draw(p) for p in (103, 102, 101)]) == 3
+    assert (cube.latest_period, cube.total) == (103, 4)
+
+
+def test_catch_up_gap_or_nothing_new():
+    cube = cube_at(100)
+    assert cube.catch_up([draw(p) for p in (104, 103, 102)]) is None
+    assert (cube.latest_period, cube.total) == (100, 1)
+    assert cube.catch_up([draw(p) for p in (100, 99)]) == 0
+    assert cube.catch_up([]) == 0
+
+
+def test_catch_up_matches_full_build(records):
+    cube = StatsCube.from_records(reversed(records[50:]))
+    assert cube.catch_up(records[:50]) == 50
+    full = StatsCube.from_records(reversed(records))
+    assert cube.counts == full.counts and cube.super_counts == full.super_counts and cube.draws == full.draws
+
+
+def test_cell_of_weekday_and_slot():
+    # 2025/02/13 是星期四
+    assert cell_of(draw(1)) == (3, (19 * 60 + 15) // 5)
+    assert cell_of(draw(1, day='2025/02/16(日)', time='00:04')) == (6, 0)
+    assert cell_of(draw(1, time='24:00')) is None
+    assert cell_of({'期號': '1'}) is None
+
+
+def test_add_packed_same_as_records(records):
+    records = records + [draw(1, day=f'2025/02/{day:02d}', time='06:00') for day in range(3, 10)]
+    packed_cube = StatsCube.from_packed(pack_history(records))
+    record_cube = StatsCube.from_records(records)
+    assert packed_cube.counts == record_cube.counts
+    assert packed_cube.super_counts == record_cube.super_counts
+    assert packed_cube.draws == record_cube.draws
+    assert (packed_cube.total, packed_cube.latest_period) == (record_cube.total, record_cube.latest_period)
+    # 2/3 到 2/9 各一期，星期一到星期日
+    slot = 6 * 12
+    assert [packed_cube.draws[w * SLOTS_PER_DAY + slot] for w in range(7)] == [1] * 7
+
+
+def test_bytes_round_trip(records, tmp_path):
+    cube = StatsCube.from_records(records)
+    restored = StatsCube.from_bytes(cube.to_bytes())
+    assert restored.counts == cube.counts
+    assert restored.super_counts == cube.super_counts
+    assert restored.draws == cube.draws
+    assert (restored.total, restored.latest_period) == (147, 114008876)
+    assert StatsCube.from_bytes(stats_cube.rebuild(pack_history(records))).counts == cube.counts
+
+    path = str(tmp_path / 'cube.bin')
+    cube.save(path)
+    assert StatsCube.load(path).query(3, 19) == cube.query(3, 19)
+    with open(path, 'r+b') as f:
+        f.write(b'NOTACUBE')
+    assert StatsCube.load(path) is None
+    assert StatsCube.load(str(tmp_path / 'missing.bin')) is None
+
+
+def test_query_sums_selected_cells():
+    cube = StatsCube()
+    cube.add(draw(1, time='19:05'))
+    cube.add(draw(2, time='19:55'))
+    cube.add(draw(3, time='20:00'))
+    assert cube.query(3, 19)['draws'] == 2
+    assert cube.query(3, slot=(19 * 60 + 5) // 5)['draws'] == 1
+    assert cube.query()['draws'] == 3
+    assert cube.query(4)['draws'] == 0
+    assert cube.query(3, 19)['hot'][0] == (1, 2)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('熱門', (None, None, None)),
+    ('熱門 週四 19點', (3, 19, None)),
+    ('熱門 星期日', (6, None, None)),
+    ('熱門 禮拜天 7', (6, 7, None)),
+    ('熱門 19:05', (None, 19, 229)),
+    ('熱門 四 0：00', (3, 0, 0)),
+])
+def test_parse_query(text, expected):
+    assert parse_query(text) == expected
+
+
+@pytest.mark.parametrize('text', ['熱門 24點', '熱門 19:60', '熱門 週八', '熱門 四 五'])
+def test_parse_query_errors(text):
+    with pytest.raises(ValueError):
+        parse_query(text)
+
+
+def test_rebuild_runs_in_background(line_bot, records, monkeypatch):
+    recent = records[:10]
+    jobs = []
+
+    def start_analysis(analysis, params):
+        jobs.append((analysis, params))
+        return jobs_future
+
+    jobs_future = Future()
+    monkeypatch.setattr(line_bot, 'load_draws', lambda count: recent)
+    monkeypatch.setattr(line_bot, 'start_analysis', start_analysis)
+    monkeypatch.setattr(line_bot, '_stats_cube', None)
+    monkeypatch.setattr(line_bot, '_stats_cube_rebuild', None)
+    monkeypatch.setattr(StatsCube, 'load', classmethod(lambda cls, path=None: None))
+
+    # 沒有統計時立即回傳，重建交給分析行程池，重建中不重複送出
+    assert line_bot.stats_cube() is None
+    assert line_bot.stats_cube() is None
+    assert jobs == [('stats_cube', ())]
+    assert line_bot.stats_cube_rebuilding()
+
+    jobs_future.set_result(stats_cube.rebuild(pack_history(records[5:])))
+    assert not line_bot.stats_cube_rebuilding()
+    cube = line_bot.stats_cube()
+    assert (cube.latest_period, cube.total) == (114008876, 147)
@@ -0,0 +1,91 @@
+"""SQLite 儲存的查詢與增量同步"""
+import json
+
+import pytest
+
+from storage import SQLiteStore, record_timestamp
+
+
+@pytest.fixture
+def records(history_bytes):
+    # 期號由大到小
+    return json.loads(history_bytes)['records']
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteStore(str(tmp_path / 'bingo.db'))
+
+
+def counting(records):
+    """fetch()：逐筆產生，並記錄呼叫端讀了幾筆"""
+    consumed = []
+
+    def fetch():
+        for record in records:
+            consumed.append(record['期號'])
+            yield record
+
+    return fetch, consumed
+
+
+def test_upsert_skips_existing_periods(store, records):
+    assert store.upsert_records(records[:10]) == 10
+    assert store.upsert_records(records[5:15]) == 5
+    assert store.count() == 15
+    assert store.latest_period() == records[0]['期號']
+    assert store.latest_records(3) == records[:3]
+
+
+def test_records_round_trip(store, records):
+    store.upsert_records(records)
+    assert store.latest_records() == records
+    assert store.records_in_range(records[9]['期號'], records[5]['期號']) == records[5:10]
+    assert list(store.iter_records(start_period=records[9]['期號'], end_period=records[5]['期號'])) == records[5:10][::-1]
+
+
+def test_iter_records_filters_by_time(store, records):
+    store.upsert_records(records)
+    start, end = record_timestamp(records[20]), record_timestamp(records[10])
+    expected = [r for r in records[::-1] if start <= record_timestamp(r) <= end]
+    assert expected and list(store.iter_records(start_ts=start, end_ts=end)) == expected
+
+
+@pytest.mark.parametrize('numbers', [(11, 22, 33), (1, 2), (5, 40, 41, 80)])
+def test_iter_matches_agrees_with_a_scan(store, records, numbers):
+    store.upsert_records(records)
+    lo, hi = records[100]['期號'], records[10]['期號']
+    expected = [
+        r for r in records[10:101]
+        if len(set(numbers) & set(r['開獎號碼'])) >= 2 or r['超級獎號'] in numbers
+    ]
+    total, draws = store.iter_matches(numbers, lo, hi, min_matches=2, chunk_size=7)
+    assert total == len(expected)
+    assert list(draws) == expected
+
+
+def test_sync_stops_at_the_latest_period(store, records):
+    store.upsert_records(records[5:])
+    fetch, consumed = counting(records)
+    assert store.sync(fetch, min_interval=0) == 5
+    assert consumed == [r['期號'] for r in records[:6]]
+    assert store.latest_records() == records
+
+
+def test_sync_respects_the_interval(store, records):
+    store.upsert_records(records[5:])
+    assert store.sync(lambda: iter(records[4:]), min_interval=60) == 1
+    assert store.sync(lambda: iter(records), min_interval=60) == 0
+    assert store.count() == len(records) - 4
+
+
+def test_sync_discards_a_run_that_leaves_a_gap(store, records):
+    store.upsert_records(records[10:])
+    assert store.sync(lambda: iter(records[:5]), min_interval=0) == 0
+    assert store.latest_period() == records[10]['期號']
+    assert store.sync(lambda: iter(records[:10]), min_interval=0) == 10
+
+
+def test_sync_into_an_empty_store_reads_everything(store, records):
+    assert store.sync(lambda: iter(records), min_interval=0) == len(records)
+    assert store.sync(lambda: iter(()), min_interval=0) == 0
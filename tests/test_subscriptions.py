@@ -0,0 +1,150 @@
+"""訂閱索引的比對結果與 check_win 逐筆比對一致，以及訂閱的期數範圍與通知狀態"""
+import random
+
+import pytest
+
+from scraper import check_win
+from subscriptions import MIN_WIN_HITS, SubscriptionStore, TicketIndex, parse_subscription
+
+
+def make_draw(period, numbers, super_number):
+    return {'期號': str(period), '時間': '', '開獎號碼': list(numbers), '超級獎號': super_number}
+
+
+def random_draw(rng, period=1):
+    numbers = sorted(rng.sample(range(1, 81), 20))
+    return make_draw(period, numbers, rng.choice(numbers))
+
+
+def brute_force(tickets, draw):
+    winners = []
+    for ticket_id, user_id, numbers in tickets:
+        hits, is_super = check_win(numbers, draw['開獎號碼'], draw['超級獎號'])
+        if hits >= MIN_WIN_HITS[len(numbers)] or is_super:
+            winners.append((ticket_id, user_id, tuple(numbers), hits, is_super))
+    return sorted(winners)
+
+
+def test_min_win_hits_from_payouts():
+    # 3 星中 2 個起有獎金，10 星中 5 個起（全不中的安慰獎不算）
+    assert MIN_WIN_HITS[3] == 2
+    assert MIN_WIN_HITS[10] == 5
+    assert all(0 < hits <= stars for stars, hits in MIN_WIN_HITS.items())
+
+
+def test_match_same_as_check_win():
+    rng = random.Random(3)
+    index = TicketIndex()
+    tickets = []
+    for ticket_id in range(2000):
+        numbers = sorted(rng.sample(range(1, 81), rng.randint(3, 10)))
+        user_id = f"U{ticket_id % 37}"
+        index.add(ticket_id, user_id, numbers, 1, 100)
+        tickets.append((ticket_id, user_id, numbers))
+    for seq in range(1, 21):
+        draw = random_draw(rng, seq)
+        assert sorted(index.match(draw, seq)) == brute_force(tickets, draw)
+
+
+def test_match_threshold_boundaries():
+    index = TicketIndex()
+    index.add(1, 'U', [1, 2, 3], 1, 10)                  # 3 星門檻 2
+    index.add(2, 'U', [1, 2, 3, 4, 5, 6, 7, 8, 9, 10], 1, 10)  # 10 星門檻 5
+    draw = make_draw(1, [1, 2, 4, 5] + list(range(60, 76)), 75)
+    # 3 星中 2 個有獎，10 星中 4 個沒有
+    assert index.match(draw, 1) == [(1, 'U', (1, 2, 3), 2, False)]
+    draw = make_draw(2, [1, 4, 5, 6, 7] + list(range(60, 75)), 75)
+    assert index.match(draw, 2) == [(2, 'U', tuple(range(1, 11)), 5, False)]
+
+
+def test_match_super_number_alone_wins():
+    index = TicketIndex()
+    index.add(1, 'U', [1, 2, 3, 4, 5, 6, 7, 8, 9, 10], 1, 10)
+    draw = make_draw(1, [10] + list(range(50, 69)), 10)
+    assert index.match(draw, 1) == [(1, 'U', tuple(range(1, 11)), 1, True)]
+
+
+def test_match_respects_period_window():
+    index = TicketIndex()
+    index.add(1, 'U', [1, 2, 3], 3, 4)
+    draw = make_draw(1, list(range(1, 21)), 1)
+    assert index.match(draw, 2) == []
+    assert [w[0] for w in index.match(draw, 3)] == [1]
+    assert [w[0] for w in index.match(draw, 4)] == [1]
+    assert index.match(draw, 5) == []
+    assert len(index) == 0
+
+
+def test_removed_slot_reused_without_stale_bits():
+    index = TicketIndex()
+    index.add(1, 'A', [1, 2, 3], 1, 10)
+    index.add(2, 'B', [4, 5, 6], 1, 10)
+    index.remove(1)
+    index.add(3, 'C', [7, 8, 9], 1, 10)
+    assert index.tickets[3][0] == 0
+    draw = make_draw(1, [1, 2, 3, 7, 8] + list(range(60, 75)), 60)
+    assert index.match(draw, 1) == [(3, 'C', (7, 8, 9), 2, False)]
+    index.remove(99)
+    assert len(index) == 2
+
+
+def test_expire_returns_removed_tickets():
+    index = TicketIndex()
+    index.add(1, 'A', [1, 2, 3], 1, 2)
+    index.add(2, 'B', [4, 5, 6], 1, 5)
+    assert index.expire(1) == []
+    assert index.expire(2) == [1]
+    assert list(index.tickets) == [2]
+
+
+def test_parse_subscription():
+    assert parse_subscription("訂閱 33 11 22 十期") == ([11, 22, 33], 10)
+    assert parse_subscription("訂閱 1 2 3 4") == ([1, 2, 3, 4], 1)
+    for text in ("訂閱 1 2", "訂閱 1 1 2", "訂閱 1 2 81", "訂閱 1 2 3 六十期", "訂閱 a b c"):
+        with pytest.raises(ValueError):
+            parse_subscription(text)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SubscriptionStore(str(tmp_path / 'subscriptions.db'))
+
+
+def notification_rows(store):
+    return store._conn().execute(
+        "SELECT ticket_id, period, hits, is_super, sent FROM notifications ORDER BY ticket_id"
+    ).fetchall()
+
+
+def test_process_draws_notifies_and_mark_sent(store, tmp_path):
+    # 第一次只記錄目前期號
+    assert store.process_draws([make_draw(100, range(41, 61), 41)]) == []
+    winner = store.add_ticket('U1', [1, 2, 3], 2)
+    store.add_ticket('U2', [70, 71, 72], 2)
+
+    notifications = store.process_draws([make_draw(101, range(1, 21), 5), make_draw(100, range(41, 61), 41)])
+    assert [(n['ticket_id'], n['user_id'], n['period'], n['hits'], n['is_super']) for n in notifications] == [
+        (winner, 'U1', '101', 3, False)
+    ]
+    assert notification_rows(store) == [(winner, '101', 3, 0, 0)]
+
+    # 其他 worker 看到同一期不再比對
+    other = SubscriptionStore(store.path)
+    assert other.process_draws([make_draw(101, range(1, 21), 5)]) == []
+
+    store.mark_sent(notifications)
+    assert notification_rows(store) == [(winner, '101', 3, 0, 1)]
+
+
+def test_process_draws_window_and_cancel(store):
+    store.process_draws([make_draw(100, range(41, 61), 41)])
+    first = store.add_ticket('U1', [1, 2, 3], 1)
+    second = store.add_ticket('U1', [4, 5, 6], 3)
+    store.process_draws([make_draw(101, range(1, 21), 1)])
+    assert [t[0] for t in store.user_tickets('U1')] == [second]
+
+    assert store.cancel('U1', second) == 1
+    # 第一組只訂一期，第二組已取消
+    assert store.process_draws([make_draw(102, range(1, 21), 1)]) == []
+    assert [row[0] for row in notification_rows(store)] == [first, second]
+    assert store.user_tickets('U1') == []
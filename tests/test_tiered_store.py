@@ -0,0 +1,69 @@
+"""分層儲存同步時不可以留下缺口，第一次下載不在請求的期限內進行"""
+import json
+import time
+
+import pytest
+
+from executor import DeadlineExceeded, check_deadline, deadline_scope
+from tiered_store import TieredStore
+
+
+@pytest.fixture
+def records(history_bytes):
+    # 期號由大到小
+    return json.loads(history_bytes)['records']
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = TieredStore(str(tmp_path / 'tiered'), hot_draws=20, page_draws=16, cache_pages=2)
+    yield store
+    store.close()
+
+
+def periods(store):
+    return [int(store[i]['期號']) for i in range(len(store))]
+
+
+def test_run_that_does_not_reach_latest_is_discarded(store, records):
+    assert store.sync(lambda: iter(records[10:]), min_interval=0) == len(records) - 10
+    # 只有最新 5 期，與已有的最新期號之間缺 5 期
+    assert store.sync(lambda: iter(records[:5]), min_interval=0) == 0
+    assert store.latest_period == int(records[10]['期號'])
+    assert store.sync(lambda: iter(records), min_interval=0) == 10
+    assert periods(store) == sorted(int(r['期號']) for r in records)
+
+
+def test_run_ending_right_after_latest_is_appended(store, records):
+    store.sync(lambda: iter(records[10:]), min_interval=0)
+    assert store.sync(lambda: iter(records[:10]), min_interval=0) == 10
+    assert periods(store) == sorted(int(r['期號']) for r in records)
+
+
+def test_deadline_propagates_without_appending(store, records):
+    store.sync(lambda: iter(records[10:]), min_interval=0)
+
+    def slow():
+        for record in records:
+            time.sleep(0.01)
+            check_deadline()
+            yield record
+
+    with deadline_scope(0.02):
+        with pytest.raises(DeadlineExceeded):
+            store.sync(slow, min_interval=0)
+    assert len(store) == len(records) - 10
+
+
+def test_bootstrap_runs_outside_the_request_deadline(store, records):
+    def slow():
+        for record in records:
+            time.sleep(0.001)
+            check_deadline()
+            yield record
+
+    with deadline_scope(0.01):
+        store.bootstrap(slow)
+        store.bootstrap(slow)
+    store._bootstrap.join(5)
+    assert len(store) == len(records)
@@ -0,0 +1,84 @@
+"""update_history 讀不到現有歷史時不可以用空的歷史覆蓋 GitHub 上的檔案"""
+import functools
+import json
+
+import pytest
+
+import standins
+import update_history
+from github_commit import GitHubCommitter
+
+HISTORY_PATH = 'data/bingo_history.json'
+
+
+@pytest.fixture
+def records(history_bytes):
+    return json.loads(history_bytes)['records']
+
+
+@pytest.fixture
+def github(history_bytes, monkeypatch, tmp_path):
+    with standins.github_api({HISTORY_PATH: history_bytes}, repo='me/bingo') as server:
+        monkeypatch.setenv('GITHUB_TOKEN', 'test-token')
+        monkeypatch.setenv('REPO_NAME', 'me/bingo')
+        monkeypatch.delenv('BINGO_DB_PATH', raising=False)
+        monkeypatch.setattr(update_history, 'GitHubCommitter', functools.partial(GitHubCommitter, api_url=server.url))
+        # 本機統計檔寫到暫存目錄
+        (tmp_path / 'data').mkdir()
+        monkeypatch.chdir(tmp_path)
+        yield server
+
+
+def run_update(monkeypatch, raw, new_data):
+    monkeypatch.setenv('HISTORY_URL', f"{raw.url}/bingo_history.json")
+    monkeypatch.setattr(update_history, 'scrape_latest', lambda: new_data)
+    return update_history.update_history()
+
+
+def new_draw(records):
+    draw = dict(records[0])
+    draw['期號'] = str(int(draw['期號']) + 1)
+    return draw
+
+
+def committed_records(github):
+    return json.loads(standins.github_files(github)[HISTORY_PATH])['records']
+
+
+@pytest.mark.parametrize('status', [403, 500, 503])
+def test_http_error_does_not_commit(github, history_bytes, records, monkeypatch, status):
+    head = github.state['refs']['main']
+    with standins.history_server(history_bytes, status=status) as raw:
+        assert run_update(monkeypatch, raw, [new_draw(records)]) is False
+    assert github.state['refs']['main'] == head
+
+
+def test_truncated_history_does_not_commit(github, history_bytes, records, monkeypatch):
+    head = github.state['refs']['main']
+    with standins.history_server(history_bytes[:len(history_bytes) // 2]) as raw:
+        assert run_update(monkeypatch, raw, [new_draw(records)]) is False
+    assert github.state['refs']['main'] == head
+
+
+def test_unreachable_history_does_not_commit(github, history_bytes, records, monkeypatch):
+    head = github.state['refs']['main']
+    raw = standins.history_server(history_bytes).start()
+    raw.stop()
+    assert run_update(monkeypatch, raw, [new_draw(records)]) is False
+    assert github.state['refs']['main'] == head
+
+
+def test_new_draw_is_merged_into_existing_history(github, history_bytes, records, monkeypatch):
+    draw = new_draw(records)
+    with standins.history_server(history_bytes) as raw:
+        assert run_update(monkeypatch, raw, [draw, records[0]]) is True
+    merged = committed_records(github)
+    assert len(merged) == len(records) + 1
+    assert merged[0]['期號'] == draw['期號']
+    assert [r['期號'] for r in merged[1:]] == [r['期號'] for r in records]
+
+
+def test_missing_history_file_starts_empty(github, history_bytes, records, monkeypatch):
+    with standins.history_server(history_bytes, status=404) as raw:
+        assert run_update(monkeypatch, raw, records[:3]) is True
+    assert [r['期號'] for r in committed_records(github)] == [r['期號'] for r in records[:3]]
@@ -0,0 +1,314 @@
+"""分層的開獎資料：最近的開獎放在記憶體，較舊的存成磁碟上的分頁，用到時才讀入
+
+冷資料檔依開獎先後存放 shared_history.RECORD 格式的記錄（每筆 32 位元組，只會附加），
+每頁的第一個期號留在記憶體中供二分搜尋，讀入的分頁放在有上限的 LRU；熱資料是最新
+TIERED_HOT_DRAWS 期解碼後的開獎，最近開獎的查詢不必讀磁碟。記憶體用量由這幾個設定決定，
+不隨歷史長度增加（分頁索引每頁只佔 4 位元組）。
+
+同步時向上游由新到舊逐筆讀取，讀到已有的期號就停止，不必下載整份歷史；接不上已有期號的資料不附加。
+第一次需要下載全部歷史，由 gunicorn 啟動時或背景執行緒進行，不在處理請求時進行。
+同一目錄可由多個 worker 共用：以檔案鎖確保只有一個行程附加，其他行程讀取時自動看到新資料。
+"""
+import fcntl
+import os
+import tempfile
+import threading
+import time
+import logging
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+
+from executor import DeadlineExceeded
+from shared_history import RECORD, pack_record, unpack_record
+
+logger = logging.getLogger(__name__)
+
+# 設定 BINGO_TIERED_DIR 後才啟用分層儲存
+TIERED_DIR_ENV = 'BINGO_TIERED_DIR'
+# 熱資料的期數，預設約兩天
+TIERED_HOT_DRAWS = int(os.getenv('TIERED_HOT_DRAWS', '406'))
+TIERED_PAGE_DRAWS = int(os.getenv('TIERED_PAGE_DRAWS', '512'))
+TIERED_CACHE_PAGES = int(os.getenv('TIERED_CACHE_PAGES', '16'))
+# 與上游同步的最短間隔（秒）
+SYNC_INTERVAL = int(os.getenv('BINGO_TIERED_SYNC_INTERVAL', '60'))
+# 同步時新資料超過這個大小才寫到暫存檔
+SPILL_BYTES = 1024 * 1024
+
+
+def _period_of(buf, offset=0):
+    return int.from_bytes(buf[offset:offset + 4], 'little')
+
+
+class TieredStore:
+    """依開獎先後的序列（可直接交給 export.select_range），熱資料在記憶體、冷資料分頁讀取"""
+
+    def __init__(self, directory, hot_draws=TIERED_HOT_DRAWS, page_draws=TIERED_PAGE_DRAWS,
+                 cache_pages=TIERED_CACHE_PAGES):
+        self.directory = directory
+        self.path = os.path.join(directory, 'draws.bin')
+        self.hot_draws = hot_draws
+        self.page_draws = page_draws
+        self.page_bytes = page_draws * RECORD.size
+        self.cache_pages = cache_pages
+        os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._last_sync = 0
+        self._bootstrap = None
+        self._pages = OrderedDict()
+        self._counters = {'hot_hits': 0, 'page_hits': 0, 'page_misses': 0}
+        # 每頁第一筆的期號
+        self.page_periods = array('I')
+        # (筆數, 熱資料列表)，一起替換，讀取端不需要上鎖
+        self._view = (0, [])
+        self._refresh()
+
+    def close(self):
+        os.close(self._fd)
+
+    @property
+    def latest_period(self):
+        count, hot = self._view
+        return int(hot[-1]['期號']) if hot else 0
+
+    def _refresh(self):
+        """檔案變長（本行程或其他 worker 附加）時更新分頁索引與熱資料"""
+        count = os.fstat(self._fd).st_size // RECORD.size
+        if count == self._view[0]:
+            return
+        with self._lock:
+            old_count, hot = self._view
+            if count <= old_count:
+                return
+            for page in range(len(self.page_periods), (count - 1) // self.page_draws + 1):
+                self.page_periods.append(_period_of(os.pread(self._fd, 4, page * self.page_bytes)))
+            # 只解碼最後 hot_draws 期，新資料較少時接在原本的熱資料後面
+            start = max(count - self.hot_draws, old_count)
+            buf = os.pread(self._fd, (count - start) * RECORD.size, start * RECORD.size)
+            new_records = [unpack_record(buf, i * RECORD.size) for i in range(count - start)]
+            if start == old_count:
+                new_records = (hot + new_records)[-self.hot_draws:]
+            self._view = (count, new_records)
+
+    def __len__(self):
+        self._refresh()
+        return self._view[0]
+
+    def _page(self, page, needed):
+        """讀取分頁（最後一頁可能還在增加，已讀入的長度不足時重讀）"""
+        with self._lock:
+            buf = self._pages.get(page)
+            if buf is not None and len(buf) >= needed:
+                self._pages.move_to_end(page)
+                self._counters['page_hits'] += 1
+                return buf
+        buf = os.pread(self._fd, self.page_bytes, page * self.page_bytes)
+        with self._lock:
+            self._counters['page_misses'] += 1
+            self._pages[page] = buf
+            self._pages.move_to_end(page)
+            while len(self._pages) > self.cache_pages:
+                self._pages.popitem(last=False)
+        return buf
+
+    def _record_bytes(self, i):
+        page, slot = divmod(i, self.page_draws)
+        offset = slot * RECORD.size
+        return self._page(page, offset + RECORD.size), offset
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        count, hot = self._view
+        if i < 0:
+            i += count
+        if not 0 <= i < count:
+            raise IndexError(i)
+        if i >= count - len(hot):
+            return hot[i - (count - len(hot))]
+        return unpack_record(*self._record_bytes(i))
+
+    def period_at(self, i):
+        return _period_of(*self._record_bytes(i))
+
+    def position(self, period, right=False):
+        """期號在序列中的插入位置（同 bisect_left / bisect_right），先查分頁索引再讀一頁"""
+        count = len(self)
+        page = bisect_right(self.page_periods, period) - 1
+        if page < 0:
+            return 0
+        lo = page * self.page_draws
+        hi = min(lo + self.page_draws, count)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self.period_at(mid)
+            if value < period or (right and value == period):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def latest(self, limit=None):
+        """最新的開獎資料（期號由大到小）；不超過熱資料的期數時不讀磁碟"""
+        count = len(self)
+        stop = 0 if limit is None else max(count - limit, 0)
+        if count - stop <= len(self._view[1]):
+            with self._lock:
+                self._counters['hot_hits'] += 1
+        return [self[i] for i in range(count - 1, stop - 1, -1)]
+
+    def packed(self, start=0, stop=None):
+        """依開獎先後的原始記錄（每筆 RECORD.size 位元組），不經過分頁快取"""
+        stop = len(self) if stop is None else stop
+        return os.pread(self._fd, (stop - start) * RECORD.size, start * RECORD.size)
+
+    def iter_matches(self, numbers, min_matches=2, start_period=None, end_period=None):
+        """回傳 (符合期數, 由新到舊逐筆產生開獎的 generator)；逐頁掃描區間，只保留符合的位置"""
+        bet = set(numbers)
+        lo = self.position(int(start_period)) if start_period is not None else 0
+        hi = self.position(int(end_period), right=True) if end_period is not None else len(self)
+        positions = array('I')
+        stop = hi
+        while stop > lo:
+            page = (stop - 1) // self.page_draws
+            start = max(lo, page * self.page_draws)
+            end = (stop - page * self.page_draws) * RECORD.size
+            chunk = self._page(page, end)[(start - page * self.page_draws) * RECORD.size:end]
+            matched = [
+                start + j for j, record in enumerate(RECORD.iter_unpack(chunk))
+                if len(bet.intersection(record[6])) >= min_matches or record[5] in bet
+            ]
+            positions.extend(reversed(matched))
+            stop = start
+        return len(positions), (self[pos] for pos in positions)
+
+    def sync(self, fetch, min_interval=SYNC_INTERVAL):
+        """定期由 fetch()（期號由大到小的可迭代物件）補上新期號，讀到已有的期號就停止
+
+        其他 worker 正在同步時略過（已有資料的情況下），回傳新增的期數。
+        """
+        now = time.monotonic()
+        if self._last_sync and now - self._last_sync < min_interval:
+            return 0
+        if not self._sync_lock.acquire(blocking=False):
+            return 0
+        try:
+            self._last_sync = now
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | (fcntl.LOCK_NB if len(self) else 0))
+            except BlockingIOError:
+                return 0
+            try:
+                return self._sync_locked(fetch)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        except DeadlineExceeded:
+            # 請求的期限已到，由呼叫端處理；沒有附加任何資料
+            raise
+        except Exception as e:
+            logger.error(f"同步分層儲存失敗：{str(e)}")
+            return 0
+        finally:
+            self._sync_lock.release()
+
+    def bootstrap(self, fetch):
+        """資料還是空的時在背景執行緒下載全部歷史，不受請求的期限限制；已在進行中時不重複啟動
+
+        重試的間隔同樣受 sync() 的 min_interval 限制。
+        """
+        with self._lock:
+            if self._bootstrap is not None and self._bootstrap.is_alive():
+                return
+            self._bootstrap = threading.Thread(target=self.sync, args=(fetch,), name='tiered-bootstrap', daemon=True)
+            self._bootstrap.start()
+
+    def _sync_locked(self, fetch):
+        # 上次寫到一半中斷時，捨去不完整的記錄
+        size = os.fstat(self._fd).st_size
+        if size % RECORD.size:
+            os.ftruncate(self._fd, size - size % RECORD.size)
+        self._refresh()
+        latest = self.latest_period
+        added = 0
+        previous = None
+        # 讀到已有的期號（或資料還是空的）才表示新資料與檔案相接
+        connected = not latest
+        records = fetch()
+        with tempfile.SpooledTemporaryFile(max_size=SPILL_BYTES, dir=self.directory) as spill:
+            try:
+                for record in records or ():
+                    period = int(record['期號'])
+                    if period <= latest:
+                        connected = True
+                        break
+                    # 來源重試時可能從頭再給一次，只接受比上一筆更舊的
+                    if previous is not None and period >= previous:
+                        continue
+                    spill.write(pack_record(record))
+                    previous = period
+                    added += 1
+            finally:
+                close = getattr(records, 'close', None)
+                if close is not None:
+                    close()
+            if not added:
+                return 0
+            if not connected and previous != latest + 1:
+                # 來源只有最近的部分期數，附加上去會在檔案中留下缺口；捨棄，下次同步再補
+                logger.warning(f"上游資料只到期號 {previous}，接不上已有的 {latest}，捨棄這次的 {added} 期")
+                return 0
+            # 暫存檔是由新到舊，逐頁反轉後附加
+            with open(self.path, 'ab') as f:
+                for stop in range(added, 0, -self.page_draws):
+                    start = max(stop - self.page_draws, 0)
+                    spill.seek(start * RECORD.size)
+                    block = spill.read((stop - start) * RECORD.size)
+                    f.write(b''.join(
+                        block[i * RECORD.size:(i + 1) * RECORD.size] for i in range(stop - start - 1, -1, -1)
+                    ))
+        self._refresh()
+        logger.info(f"分層儲存新增 {added} 期，共 {self._view[0]} 期")
+        return added
+
+    def metrics(self):
+        count, hot = self._view
+        with self._lock:
+            metrics = dict(self._counters)
+            cached = len(self._pages)
+        metrics.update(
+            draws=count, hot_draws=len(hot), pages=len(self.page_periods), cached_pages=cached,
+            cache_pages=self.cache_pages, latest_period=self.latest_period
+        )
+        return metrics
+
+
+_tiered = None
+_tiered_lock = threading.Lock()
+
+
+def get_tiered_store():
+    """取得分層儲存，未設定 BINGO_TIERED_DIR 時回傳 None"""
+    global _tiered
+    directory = os.getenv(TIERED_DIR_ENV)
+    if not directory:
+        return None
+    if _tiered is None or _tiered.directory != directory:
+        with _tiered_lock:
+            if _tiered is None or _tiered.directory != directory:
+                _tiered = TieredStore(directory)
+    return _tiered
+
+
+if __name__ == '__main__':
+    import sys
+
+    from history_stream import HistoryReader
+
+    if len(sys.argv) < 2:
+        print("用法: python tiered_store.py <bingo_history.json> [目錄]")
+        sys.exit(1)
+    store = TieredStore(sys.argv[2] if len(sys.argv) > 2 else os.getenv(TIERED_DIR_ENV, 'data/tiered'))
+    store.sync(lambda: HistoryReader.from_file(sys.argv[1]).records(), min_interval=0)
+    print(f"分層儲存共有 {len(store)} 期，最新期號 {store.latest_period}")
@@ -1,9 +1,12 @@
-import json
 from datetime import datetime, timezone, timedelta
-from scraper import scrape_bingo
+from scraper import scrape_latest, history_url
+from storage import get_store
+from github_commit import FileContent, GitHubCommitter
+from history_stream import CHUNK_SIZE, EMPTY_HISTORY, HistoryReader, merge_records, write_history
+from stats_cube import StatsCube
 import os
+import tempfile
 import requests
-from github import Github
 import logging
 from dotenv import load_dotenv
 
@@ -14,16 +17,24 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 def load_existing_data():
-    """從 GitHub 加載現有數據"""
+    """從 GitHub 串流讀取現有數據，回傳逐筆解析的 HistoryReader
+
+    只有檔案確實不存在（404，第一次執行）時才從空的歷史開始；其他錯誤回傳 None，
+    避免以空的歷史覆蓋 GitHub 上的檔案。
+    """
     try:
-        repo_name = os.getenv('REPO_NAME', 'YOUR_USERNAME/YOUR_REPO')
-        url = f"https://raw.githubusercontent.com/{repo_name}/main/data/bingo_history.json"
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.json()
+        response = requests.get(history_url(), stream=True)
     except Exception as e:
         logger.error(f"加載現有數據失敗：{str(e)}")
-    return {"last_updated": "", "records": []}
+        return None
+    if response.status_code == 200:
+        return HistoryReader(response.iter_content(CHUNK_SIZE))
+    response.close()
+    if response.status_code == 404:
+        logger.info("尚無歷史數據檔案，從空的歷史開始")
+        return HistoryReader([EMPTY_HISTORY])
+    logger.error(f"加載現有數據失敗：HTTP {response.status_code}")
+    return None
 
 def update_history():
     """更新歷史數據"""
@@ -32,31 +43,49 @@ def update_history():
     print("GITHUB_TOKEN:", os.getenv('GITHUB_TOKEN'))
     print("REPO_NAME:", os.getenv('REPO_NAME'))
     
-    # 獲取現有數據
-    existing_data = load_existing_data()
-    existing_records = {record['期號']: record for record in existing_data['records']}
-    
-    # 爬取新數據
-    new_data = scrape_bingo()
+    # 爬取新數據（與現有歷史合併，只有今日的資料也可以）
+    new_data = scrape_latest()
     if not new_data:
         logger.error("爬取新數據失敗")
         return False
-        
-    # 合併數據
-    for record in new_data:
-        if record['期號'] not in existing_records:
-            existing_records[record['期號']] = record
     
-    # 按期號排序
-    sorted_records = sorted(existing_records.values(), 
-                          key=lambda x: x['期號'], 
-                          reverse=True)
+    # 有設定 SQLite 時一併寫入
+    store = get_store()
+    if store is not None:
+        inserted = store.upsert_records(new_data)
+        logger.info(f"SQLite 新增 {inserted} 筆開獎資料")
     
-    # 更新數據
-    updated_data = {
-        "last_updated": datetime.now(timezone(timedelta(hours=8))).isoformat(),
-        "records": sorted_records
-    }
+    # 讀不到現有數據時不提交，下次排程再試
+    existing = load_existing_data()
+    if existing is None:
+        return False
+    
+    # 現有數據逐筆讀取，與新數據依期號由大到小合併後寫到暫存檔；串流中斷或格式錯誤時同樣不提交
+    last_updated = datetime.now(timezone(timedelta(hours=8))).isoformat()
+    new_periods = []
+    fd, tmp_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        total = write_history(tmp_path, merge_records(existing.records(), new_data, new_periods), last_updated)
+    except Exception as e:
+        os.unlink(tmp_path)
+        logger.error(f"合併歷史數據失敗：{str(e)}")
+        return False
+    
+    if not new_periods:
+        os.unlink(tmp_path)
+        logger.info("沒有新的期號，不需要提交")
+        return True
+    logger.info(f"新增 {len(new_periods)} 期：{min(new_periods)} - {max(new_periods)}，共 {total} 期")
+    
+    # 星期與時段統計只加上新的期數；與歷史期數對不上時（第一次或曾經失敗）由合併後的檔案重建
+    cube = StatsCube.load() or StatsCube()
+    new_by_period = {record['期號']: record for record in new_data}
+    for period in new_periods:
+        cube.add(new_by_period[period])
+    if cube.total != total:
+        logger.info(f"統計期數 {cube.total} 與歷史 {total} 期不符，重建星期與時段統計")
+        cube = StatsCube.from_records(HistoryReader.from_file(tmp_path).records())
     
     # 保存到 GitHub
     try:
@@ -65,24 +94,18 @@ def update_history():
             logger.error("未設置 GITHUB_TOKEN 環境變數")
             return False
         
-        g = Github(github_token)
         repo_name = os.getenv('REPO_NAME', 'YOUR_USERNAME/YOUR_REPO')
-        repo = g.get_repo(repo_name)
+        committer = GitHubCommitter(repo_name, github_token)
         
-        # 獲取現有文件
-        try:
-            contents = repo.get_contents("data/bingo_history.json")
-            sha = contents.sha
-        except:
-            sha = None
-        
-        # 更新或創建文件
-        repo.update_file(
-            "data/bingo_history.json",
-            f"Update bingo history {updated_data['last_updated']}",
-            json.dumps(updated_data, ensure_ascii=False, indent=2),
-            sha
+        # 只讀取 tree 中繼資料比對 blob SHA，不下載現有檔案；暫存檔逐塊上傳
+        committer.commit_files(
+            {"data/bingo_history.json": FileContent(tmp_path), "data/stats_cube.bin": cube.to_bytes()},
+            f"Update bingo history {last_updated}"
         )
+        try:
+            cube.save()
+        except OSError as e:
+            logger.warning(f"保存本機統計檔失敗：{str(e)}")
         
         logger.info("成功更新歷史數據")
         return True
@@ -90,6 +113,9 @@ def update_history():
     except Exception as e:
         logger.error(f"保存到 GitHub 失敗：{str(e)}")
         return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
 
 if __name__ == "__main__":
     update_history() 
\ No newline at end of file